@@ -0,0 +1,334 @@
+import logging
+import threading
+import time
+from datetime import date
+from sqlalchemy import BigInteger, Column, Index, Integer, String, bindparam, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from Categories import get_categories
+from Data_Processing import MONTH_SNAPSHOT_QUERY, ZERO
+from Expense import Expense
+from Storage import Base, create_tables, month_key, session_scope, to_money
+
+# Budget alerts: a chat is told when a category's spending this month crosses
+# a share of its budget, 80% and 100% unless the chat sets other thresholds.
+# Each chat's budget, spending per category and alerts already sent this month
+# are read once and kept in memory; every committed expense insert adds its
+# amounts to those running totals and checks the thresholds without another
+# query. Alerts are handed to the bot's outbox, which batches them per chat
+# within Telegram's send limits. Each threshold alerts once per month.
+
+# Percentages of a category's budget that alert when no thresholds are set
+DEFAULT_THRESHOLDS = (80, 100)
+
+# Category of the thresholds that apply to every category without their own
+ALL_CATEGORIES = "*"
+
+# Seconds a chat's totals are trusted before they are read again, so changes
+# written by another process (e.g. python Manage.py import) are picked up
+ALERT_STATE_TTL = 300
+
+# Locks a chat's totals are read and updated under; chats share them by chat id,
+# so the number of locks stays fixed however many chats write
+ALERT_LOCK_STRIPES = 64
+
+logger = logging.getLogger(__name__)
+
+
+class AlertThreshold(Base):
+    """
+    Budget alert thresholds set by a chat.
+
+    Attributes:
+        id (int): Unique identifier.
+        chat_id (int): Telegram chat that set the thresholds.
+        category (str): Category code, or ALL_CATEGORIES for the chat's default.
+        percents (str): Comma-separated percentages of the budget, e.g. "50,90,100";
+            empty when the chat turned the alerts off.
+    """
+
+    __tablename__ = "alert_thresholds"
+    __table_args__ = (Index("ix_alert_thresholds_chat_category", "chat_id", "category", unique=True),)
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column("chat_id", BigInteger, nullable=False)
+    category = Column("category", String, nullable=False)
+    percents = Column("percents", String, nullable=False)
+
+
+class SentAlert(Base):
+    """
+    A threshold a chat was alerted of in a month, so it never alerts twice.
+
+    Attributes:
+        chat_id (int): Telegram chat that was alerted.
+        month (str): Month key in "YYYY-MM" format.
+        category (str): Category code.
+        percent (int): Threshold crossed.
+    """
+
+    __tablename__ = "sent_alerts"
+
+    chat_id = Column("chat_id", BigInteger, primary_key=True)
+    month = Column("month", String, primary_key=True)
+    category = Column("category", String, primary_key=True)
+    percent = Column("percent", Integer, primary_key=True)
+
+
+# Create the alert tables in the shared database
+create_tables()
+
+# The month's budget and spending per category (see Data_Processing.month_snapshot)
+# next to the chat's last expense id, read in one statement so both come from
+# the same committed state
+ALERT_STATE_QUERY = MONTH_SNAPSHOT_QUERY.add_columns(
+    select(func.max(Expense.id)).where(Expense.chat_id == bindparam("chat_id")).scalar_subquery())
+
+
+class ChatAlertState:
+    """
+    Running totals of one chat and month that budget alerts are checked against.
+
+    Attributes:
+        month (str): Month key in "YYYY-MM" format.
+        budget (dict): Budget per category code, as Decimal.
+        spent (dict): Spending per category code this month, as Decimal.
+        thresholds (dict): Thresholds per category code, and ALL_CATEGORIES for the rest.
+        sent (set): (category, percent) alerts already sent this month.
+        last_expense_id (int): Id of the chat's last expense when the totals were
+            read; the totals already hold it and every expense before it.
+        loaded_at (float): time.monotonic() of the read.
+    """
+
+    def __init__(self, month, budget, spent, thresholds, sent, last_expense_id):
+        self.month = month
+        self.budget = budget
+        self.spent = spent
+        self.thresholds = thresholds
+        self.sent = sent
+        self.last_expense_id = last_expense_id
+        self.loaded_at = time.monotonic()
+
+    def category_thresholds(self, category):
+        """Returns the thresholds of a category, lowest first."""
+        return self.thresholds.get(category, self.thresholds.get(ALL_CATEGORIES, DEFAULT_THRESHOLDS))
+
+
+class BudgetAlerts:
+    """
+    Checks new expenses against the budget thresholds of their chat.
+
+    add_expenses() calls record() once its transaction has committed. Until a
+    deliver function is set (by the bot) nothing is tracked, so scripts and the
+    dashboard pay nothing. Writers that change totals in other ways (deletes,
+    imports, budget and threshold changes) call invalidate().
+
+    Attributes:
+        deliver (callable): Called with (chat_id, text) for each alert message,
+            from the thread that inserted the expenses.
+        loads (int): Chat states read from the database.
+        fired (int): Alerts delivered.
+    """
+
+    def __init__(self, ttl=ALERT_STATE_TTL):
+        self.ttl = ttl
+        self.deliver = None
+        self.loads = 0
+        self.fired = 0
+        self._states = {}  # chat_id -> ChatAlertState
+        self._chat_locks = [threading.Lock() for _ in range(ALERT_LOCK_STRIPES)]  # by chat_id % ALERT_LOCK_STRIPES
+        self._lock = threading.Lock()
+
+    def record(self, chat_id, expenses):
+        """
+        Adds committed expenses to their chat's totals and delivers the alerts they trigger.
+
+        Args:
+            chat_id (int): Telegram chat that owns the expenses.
+            expenses (list): Expense objects just committed; those outside the current month are ignored.
+
+        Returns:
+            list: (category, percent, spent, budget) of every alert delivered.
+        """
+        if self.deliver is None:
+            return []
+        month = month_key(date.today())
+        expenses = [expense for expense in expenses if month_key(expense.date) == month]
+        if not expenses:
+            return []
+
+        alerts = []
+        # Inserts of one chat may commit in one order and get here in another; the chat's
+        # lock and the last expense id of the read keep each expense counted once
+        with self._chat_locks[chat_id % ALERT_LOCK_STRIPES]:
+            with self._lock:
+                state = self._states.get(chat_id)
+            if state is None or state.month != month or time.monotonic() - state.loaded_at > self.ttl:
+                # Read after the commit, so the totals already hold these expenses
+                state = self._load(chat_id, month)
+                with self._lock:
+                    self._states[chat_id] = state
+
+            for expense in expenses:
+                if expense.id > state.last_expense_id:
+                    state.spent[expense.category] = state.spent.get(expense.category, ZERO) + expense.amount
+            for category in {expense.category for expense in expenses}:
+                budget = state.budget.get(category, ZERO)
+                if budget <= 0:
+                    continue
+                spent = state.spent.get(category, ZERO)
+                crossed = [percent for percent in state.category_thresholds(category)
+                           if spent * 100 >= percent * budget and (category, percent) not in state.sent]
+                if crossed:
+                    # One alert for the highest threshold crossed; the lower ones count as sent too
+                    state.sent.update((category, percent) for percent in crossed)
+                    alerts.append((category, max(crossed), spent, budget))
+        if alerts:
+            with session_scope() as session:
+                session.execute(sqlite_insert(SentAlert).on_conflict_do_nothing(), [
+                    {"chat_id": chat_id, "month": month, "category": category, "percent": percent}
+                    for category, percent, _, _ in alerts])
+            self.fired += len(alerts)
+            self.deliver(chat_id, format_alerts(chat_id, month, alerts))
+        return alerts
+
+    def invalidate(self, chat_id):
+        """Drops the totals of a chat; the next insert reads them again."""
+        with self._lock:
+            self._states.pop(chat_id, None)
+
+    def clear(self):
+        """Drops every chat's totals."""
+        with self._lock:
+            self._states.clear()
+
+    def _load(self, chat_id, month):
+        with session_scope() as session:
+            rows = session.execute(ALERT_STATE_QUERY, {"chat_id": chat_id, "month": month}).all()
+            thresholds = session.query(AlertThreshold.category, AlertThreshold.percents).filter(
+                AlertThreshold.chat_id == chat_id).all()
+            sent = session.query(SentAlert.category, SentAlert.percent).filter(
+                SentAlert.chat_id == chat_id, SentAlert.month == month).all()
+        self.loads += 1
+        return ChatAlertState(
+            month,
+            {category: to_money(budget) for category, budget, _, budgeted, _, _ in rows if budgeted},
+            {category: to_money(spent) for category, _, spent, _, _, _ in rows},
+            {category: parse_percents(percents) for category, percents in thresholds},
+            set(sent),
+            # Without rows the month has no spending yet, so every later expense is new
+            (rows[0][5] or 0) if rows else 0)
+
+
+# Alert tracker shared by every insert in the process
+budget_alerts = BudgetAlerts()
+
+
+def parse_percents(percents):
+    """Returns the thresholds stored as "80,100" as a sorted tuple; () for alerts turned off."""
+    return tuple(sorted(int(percent) for percent in percents.split(",") if percent))
+
+
+def format_alerts(chat_id, month, alerts):
+    """
+    Formats the alerts triggered by one insert.
+
+    Args:
+        chat_id (int): Telegram chat that is alerted.
+        month (str): Month key in "YYYY-MM" format.
+        alerts (list): (category, percent, spent, budget) tuples from BudgetAlerts.record().
+
+    Returns:
+        str: One line per alert.
+    """
+    categories = get_categories(chat_id)
+    lines = []
+    for category, percent, spent, budget in alerts:
+        name = categories.name(category)
+        if spent > budget:
+            lines.append(f"Budget alert: {name} is over budget for {month}: "
+                         f"${spent:.2f} of ${budget:.2f} spent, ${spent - budget:.2f} over.")
+        else:
+            lines.append(f"Budget alert: {name} reached {percent}% of its budget for {month}: "
+                         f"${spent:.2f} of ${budget:.2f} spent.")
+    return "\n".join(lines)
+
+
+def parse_alerts_command(text, categories):
+    """
+    Parses an /alerts command that sets thresholds.
+
+    Args:
+        text (str): Message text such as "/alerts 80 100", "/alerts G 50 90 100",
+            "/alerts off", "/alerts G off" or "/alerts G default".
+        categories (CategorySet): Categories of the chat, from get_categories().
+
+    Returns:
+        tuple: The category (ALL_CATEGORIES for every category) and the thresholds,
+        () to turn alerts off or None to use the chat's default again; raises ValueError on bad input.
+    """
+    tokens = text.split()[1:]
+    category = ALL_CATEGORIES
+    if tokens and not tokens[0].isdigit() and tokens[0].lower() not in ("off", "default"):
+        category = categories.normalize(tokens.pop(0))
+    if len(tokens) == 1 and tokens[0].lower() == "off":
+        return category, ()
+    if len(tokens) == 1 and tokens[0].lower() == "default":
+        return category, None
+    if not tokens or not all(token.isdigit() for token in tokens):
+        raise ValueError("Give the thresholds as percentages of the budget, e.g. 80 100")
+    percents = tuple(sorted({int(token) for token in tokens}))
+    if not all(1 <= percent <= 1000 for percent in percents):
+        raise ValueError("Thresholds must be between 1 and 1000 percent")
+    return category, percents
+
+
+def set_alert_thresholds(chat_id, category, percents):
+    """
+    Stores the alert thresholds of a chat.
+
+    Args:
+        chat_id (int): Telegram chat that sets the thresholds.
+        category (str): Category code, or ALL_CATEGORIES for every category without its own.
+        percents (tuple): Thresholds; () turns the alerts off and None removes the setting.
+
+    Returns:
+        str: Confirmation message.
+    """
+    with session_scope() as session:
+        session.query(AlertThreshold).filter(
+            AlertThreshold.chat_id == chat_id, AlertThreshold.category == category).delete()
+        if percents is not None:
+            session.add(AlertThreshold(chat_id=chat_id, category=category,
+                                       percents=",".join(str(percent) for percent in percents)))
+    budget_alerts.invalidate(chat_id)
+    target = "every category" if category == ALL_CATEGORIES else f"category {category}"
+    if percents is None:
+        return f"Budget alerts of {target} reset to the default."
+    if not percents:
+        return f"Budget alerts turned off for {target}."
+    return f"Budget alerts for {target} at {', '.join(f'{percent}%' for percent in percents)} of the budget."
+
+
+def format_alert_thresholds(chat_id):
+    """
+    Formats the alert thresholds of a chat for the /alerts command.
+
+    Args:
+        chat_id (int): Telegram chat whose thresholds are shown.
+
+    Returns:
+        str: The default thresholds and those of each category with its own.
+    """
+    with session_scope() as session:
+        rows = dict(session.query(AlertThreshold.category, AlertThreshold.percents).filter(
+            AlertThreshold.chat_id == chat_id).all())
+    categories = get_categories(chat_id)
+
+    def describe(percents):
+        return ", ".join(f"{percent}%" for percent in percents) or "off"
+
+    default = parse_percents(rows.pop(ALL_CATEGORIES)) if ALL_CATEGORIES in rows else DEFAULT_THRESHOLDS
+    lines = [f"Budget alerts for every category: {describe(default)}"]
+    for category, percents in rows.items():
+        lines.append(f"{categories.name(category)}: {describe(parse_percents(percents))}")
+    return "\n".join(lines)
@@ -1,30 +1,53 @@
-import telebot
+import asyncio
+import io
+from telebot.async_telebot import AsyncTeleBot
 from telebot import types
+from telebot.asyncio_helper import ApiTelegramException
 import os
 from dash import dcc, html
 from dotenv import load_dotenv
+# Load environment variables from a .env file before the storage modules read them
+load_dotenv()
+from Runtime import workers
+from Webhook import WEBHOOK_URL, run_webhook
 from Budget import Budget, BudgetManager, print_budget
-from Visualization import visual_by_month
-from Expense import Expense, expense_delete_by_id, expense_summarize_monthly, get_last_expense, spend_command
+from Categories import (format_categories, get_categories, parse_category_command, remove_category, set_category,
+                        set_category_keywords)
+from Expense import Expense, expense_delete_by_id, expense_summarize_monthly, format_expenses, get_last_expense, spend_command
 from Income import Income, earn_command, get_last_income, income_delete_by_id, income_summarize_monthly
-from Data_Processing import check_budget, get_budget_message, overall_spending_vs_budget, category_spending_vs_budget
+from Exporter import export_to_tempfile, parse_export_command
+from Importer import format_import_stats, import_statement_bytes
+from Charts import CHART_COMMANDS, charts, parse_chart_command
+from Data_Processing import check_budget, get_budget_delta_message, month_snapshot, overall_spending_vs_budget, category_spending_vs_budget
+from Data_Processing import category_subtree_spending, format_category_spending, format_tag_spending, tag_spending, tag_totals
+from Storage import parse_period
+from Tags import parse_tag_sum_command
+from Alerts import budget_alerts, format_alert_thresholds, parse_alerts_command, set_alert_thresholds
+from History import CALLBACK_PREFIX, history_page, parse_history_callback, parse_history_command
+from Search import format_search_results, parse_find_command, search_entries
+from Outbox import Outbox
+from Recurring import add_rule, format_recorded_entries, format_rules, get_rules, parse_recurring_command, remove_rule, scheduler
 from datetime import date
-# Load environment variables from a .env file
-load_dotenv()
 # Retrieve the bot token and name from environment variables
 key = os.getenv('APIBUDGET')
 bot_name = os.getenv('NAMEBUDGET')
 BOT_TOKEN = key
 BOT_USERNAME = bot_name
 
-# Initialize the bot with the token
-bot = telebot.TeleBot(BOT_TOKEN)
+# Initialize the asyncio bot with the token; blocking work runs on the worker pool
+bot = AsyncTeleBot(BOT_TOKEN)
+
+# Every text the bot sends goes through the outbox, which joins consecutive
+# messages to a chat into one, keeps within Telegram's send limits and retries
+# rejected sends; handlers queue their replies without waiting for them
+outbox = Outbox(bot.send_message)
 
 # Routine 1: Send a welcome message when the user starts a conversation
 # Input: User starts the conversation with '/start', '/hello', or '/hi'
 # Output: Sends a personalized welcome message with bot introduction
 @bot.message_handler(commands=['start', 'hello','hi'])
-def send_welcome(message):
+@workers.in_chat_order
+async def send_welcome(message):
     user_first_name = str(message.chat.first_name) 
     welcoming = f"""Hello {user_first_name}!
 🚀 Welcome, my name is Aurelius 🤖 - Your Personal Financial Assistant!📊💰
@@ -36,13 +59,14 @@ Are you ready to make changes to how you manage your money? Let us embark on thi
 
 For more information: /help 🤖"""
 
-    bot.reply_to(message, welcoming )
+    outbox.put(message.chat.id, welcoming, reply_to=message.message_id)
     
 # Routine 2: Provide information about the bot's features
 # Input: User sends '/about' command
 # Output: Sends a detailed message about the bot’s functionality
 @bot.message_handler(commands=['about'])
-def help_option(message):
+@workers.in_chat_order
+async def help_option(message):
     help_text ="""
       🤖 Aurelius - Your Financial Companion!📊💼
 
@@ -54,136 +78,158 @@ def help_option(message):
 
 4.	Visualize Your Progress: Experience financial insights at a glance with dynamic charts and graphs showcasing your total monthly summary.
 """
-    bot.send_message(message.chat.id, help_text )
-    bot.send_message(message.chat.id, """All of this is designed for you to unleash the power of data-driven financial empowerment . Once in you life, you can finaly say: 'Financial freedom, here I come!' 
+    outbox.put(message.chat.id, help_text )
+    outbox.put(message.chat.id, """All of this is designed for you to unleash the power of data-driven financial empowerment . Once in you life, you can finaly say: 'Financial freedom, here I come!' 
     For more information: /help """ )
 
 # Routine 3: Provide a list of available commands
 # Input: User sends '/help' command
 # Output: Sends a list of commands to guide user on how to use the bot
 @bot.message_handler(commands=['help'])
-def send_welcome(message):
+@workers.in_chat_order
+async def send_welcome(message):
     start_text = "Welcome to the financial bot! Use the following commands to manage your finances: \n" \
                  "/about - Tell you more about the bot \n" \
                  "/spend - Collect your spending data \n" \
                  "/earn  - Collect your earning data \n" \
                  "/summarize - See expense summary by category \n" \
                  "/budget- Set budget for each category \n" \
+                 "/categories - List your categories; /category CODE Name adds or renames one \n" \
+                 "/category_sum CODE [YYYY-MM] - Spending of a category and its subcategories \n" \
+                 "/tag_sum [#tag] [YYYY-MM] - Spending by #tag \n" \
+                 "/every month 1 /s B, rent, 1500 - Record an expense or income on a schedule \n" \
+                 "/recurring - List your recurring rules; /recurring_remove ID removes one \n" \
+                 "/alerts [CODE] 80 100 - Get alerted when spending reaches a share of the budget \n" \
                  "/expense_sum - Summarize expenses by month \n" \
                  "/income_sum - Summarize income by month \n" \
                  "/last_expense - To view last 5 transactions of Expense \n" \
                  "/last_income - To view last 5 transactions of Income \n" \
+                 "/history [expenses|income] - Browse all your transactions page by page \n" \
+                 "/find uber [2024] - Find expenses and income by their words, with their sum \n" \
                  "/view - show last 5 transactions in either Expense data or Income data \n" \
-                 "/check_budget - show me the remaining budget for all category current month"
-    bot.reply_to(message, start_text)
+                 "/check_budget - show me the remaining budget for all category current month \n" \
+                 "/export - Download your expenses or income as CSV or Parquet \n" \
+                 "/chart [YYYY-MM] - Total spending vs budget as an image \n" \
+                 "/chart_income, /chart_categories, /chart_budget, /chart_remaining, /chart_tree - More charts \n" \
+                 "Send a CSV or OFX bank statement as a document to import it"
+    outbox.put(message.chat.id, start_text, reply_to=message.message_id)
 
 # Routine 4: Ask the user to input spending data
 # Input: User sends '/spend' command
 # Output: Prompts user to input spending data with proper format using '/s'
 @bot.message_handler(commands=['spend'])
-def prompt_spend(message):
-
-    bot.send_message(message.chat.id, """Sure! Please use the /s command with the format:
+@workers.in_chat_order
+async def prompt_spend(message):
+    categories = await workers.run(get_categories, message.chat.id)
+    outbox.put(message.chat.id, f"""Sure! Please use the /s command with the format:
     '/s category, spending reason, amount, note (optional)'.
+    Log several expenses at once by putting one entry per line.
+    Add a currency code after the amount (e.g. 12.50 EUR) to convert it to your home currency.
+    Tag an expense with #hashtags in its reason or note (e.g. latte #coffee) and total them with /tag_sum.
 
     for Categories: 
-        G - Groceries
-        B - Bill and Housing
-        F - Fun (Shopping and Eating out)
-        W - Wellness (Education and Health)
-        M - Miscellaneous""")
+{categories.describe()}""")
 
 # Routine 5: Process the spending data provided by the user
 # Input: User sends a message starting with '/s' and provides spending data
-# Output: Processes the data, saves the spending entry, and sends a formatted response along with the budget message
-@bot.message_handler(func=lambda message: message.text.startswith('/s '))
-def process_spend_command(message):
+# Output: Processes the data, saves every entry in one transaction, and sends one confirmation with the budget change
+@bot.message_handler(func=lambda message: message.text.startswith(('/s ', '/s\n')))
+@workers.in_chat_order
+async def process_spend_command(message):
     try:
-        global budget_manager
-        new_expense = spend_command(message)
-        category = new_expense.get_category()
-        amount = new_expense.get_amount()
-        report = get_budget_message(category)
-        #send formatted message to user
-        bot.send_message(message.chat.id,new_expense)
-        bot.send_message(message.chat.id,report)
-        bot.send_message(message.chat.id,"For more information about summary of your expenses: /expense_sum ")
+        new_expenses = await workers.run(spend_command, message)
+        report = await workers.run(get_budget_delta_message, message.chat.id, new_expenses)
+        #send one formatted message to user
+        outbox.put(message.chat.id,
+            f"{format_expenses(new_expenses)}\n\n{report}\n\n"
+            "For more information about summary of your expenses: /expense_sum ")
     except ValueError as e:
         # Error message in process_spend_command
-        bot.send_message(message.chat.id, f"Error: {e}\n"
+        outbox.put(message.chat.id, f"Error: {e}\n"
         "Please provide the information in the correct format:\n'/s category, spending reason, amount, note'")
 
 # Routine 6: Ask the user to input earning data
 # Input: User sends '/earn' command
 # Output: Prompts user to input earning data with proper format using '/e'
 @bot.message_handler(commands=['earn'])
-def prompt_earn(message):
-    bot.send_message(message.chat.id, """Sure! Please use the /e command with the format:
+@workers.in_chat_order
+async def prompt_earn(message):
+    outbox.put(message.chat.id, """Sure! Please use the /e command with the format:
      '/e earned from, amount, note (optional)'.
+    Add a currency code after the amount (e.g. 100 EUR) to convert it to your home currency.
     """)
 
 # Routine 7: Process the earning data provided by the user
 # Input: User sends a message starting with '/e' and provides earning data
 # Output: Processes the data, saves the earning entry, and sends a formatted response along with the income summary
 @bot.message_handler(func=lambda message: message.text.startswith('/e '))
-def process_earn_command(message):
+@workers.in_chat_order
+async def process_earn_command(message):
     try:
-        new_income = earn_command(message)
+        new_income = await workers.run(earn_command, message)
         # Send a message to the user with the earned information
-        bot.send_message(message.chat.id,new_income)
-        bot.send_message(message.chat.id,"For more information about summary of your income: /income_sum")
+        outbox.put(message.chat.id,new_income)
+        outbox.put(message.chat.id,"For more information about summary of your income: /income_sum")
         
     except ValueError as e:
         # Send an error message to the user if they provided the wrong number of values
-        bot.send_message(message.chat.id,f"Error: {e} \n" "Please provide the information in the correct format: '/e earned from, amount, note'.")
+        outbox.put(message.chat.id,f"Error: {e} \n" "Please provide the information in the correct format: '/e earned from, amount, note'.")
 
 # Routine 8: Provide a summary of expenses for the current month
 # Input: User sends '/expense_sum' command
 # Output: Sends a summary of expenses for the current month
 @bot.message_handler(commands=['expense_sum'])
-def expense_summary_command(message):
-    bot.send_message(message.chat.id,expense_summarize_monthly())
+@workers.in_chat_order
+async def expense_summary_command(message):
+    outbox.put(message.chat.id, await workers.run(expense_summarize_monthly, message.chat.id))
 
 
 # Routine 9: Provide a summary of earnings for the current month
 # Input: User sends '/income_sum' command
 # Output: Sends a summary of earnings for the current month
 @bot.message_handler(commands=['income_sum'])
-def expense_summary_command(message):
-    bot.send_message(message.chat.id,income_summarize_monthly())
+@workers.in_chat_order
+async def expense_summary_command(message):
+    summary_str, total_amount = await workers.run(income_summarize_monthly, message.chat.id)
+    outbox.put(message.chat.id, summary_str)
 
 # Routine 10: Show the last recorded expenses
 # Input: User sends '/last_expense' command
 # Output: Sends the last 5 recorded expense entries
 @bot.message_handler(commands=['last_expense'])
-def expense_preview(message):
-    last_expenses = get_last_expense()
+@workers.in_chat_order
+async def expense_preview(message):
+    last_expenses = await workers.run(get_last_expense, message.chat.id)
     for expense in last_expenses:
-        bot.send_message(message.chat.id, expense)
+        outbox.put(message.chat.id, expense)
 
 # Routine 11: Show the last recorded earnings
 # Input: User sends '/last_income' command
 # Output: Sends the last 5 recorded income entries
 @bot.message_handler(commands=['last_income'])
-def income_preview(message):
-    last_earnings = get_last_income()
+@workers.in_chat_order
+async def income_preview(message):
+    last_earnings = await workers.run(get_last_income, message.chat.id)
     for earning in last_earnings:
-        bot.send_message(message.chat.id, earning)
+        outbox.put(message.chat.id, earning)
 
 # Routine 12: Provides options to view last 5 transactions for Expenses or Income
 # Input: User sends '/view' command
 # Output: Sends a brief message with options to view last 5 transactions of Expenses or Income
 @bot.message_handler(commands=['view'])
-def preview_command(message):
+@workers.in_chat_order
+async def preview_command(message):
     str_out = """To view last 5 transactions of Expenses: /last_expense 
-To view last 5 transactions of Income: /last_income """
-    bot.send_message(message.chat.id, str_out)
+To view last 5 transactions of Income: /last_income 
+To browse all transactions page by page: /history expenses or /history income"""
+    outbox.put(message.chat.id, str_out)
 
 # Routine 13: Deletes an expense or income entry by ID
 # Input: User sends '/delete' command with data type (E or I) and ID of the entry to be deleted
 # Output: Deletes the expense or income entry and sends confirmation message
 @bot.message_handler(func=lambda message: message.text.startswith('/delete '))
-def delete_expense(message):
+@workers.in_chat_order
+async def delete_expense(message):
     try:
         user_data = message.text.split(" ")
 
@@ -193,76 +239,369 @@ def delete_expense(message):
         data_type, data_id = user_data[1:3]
         result =""
 
-        if data_type == "I": result = income_delete_by_id(data_id)
+        if data_type == "I": result = await workers.run(income_delete_by_id, message.chat.id, data_id)
 
-        elif data_type == "E": result = expense_delete_by_id(data_id)
+        elif data_type == "E": result = await workers.run(expense_delete_by_id, message.chat.id, data_id)
 
         else: raise ValueError("Invalid type of fields! Data type is either E or I ")
 
-        bot.send_message(message.chat.id,result)
+        outbox.put(message.chat.id,result)
     except ValueError as e:
         # Error message in process_spend_command
-        bot.send_message(message.chat.id, f"Error: {e}\n"
+        outbox.put(message.chat.id, f"Error: {e}\n"
         "Please provide the information in the correct format:\n'/delete (data type E or I) id'")
 
 # Routine 14: Starts the process to set a new budget
 # Input: User sends '/budget' command
 # Output: Sends a prompt to enter new budget values in a specific format
 @bot.message_handler(commands=['budget'])
-def budget_command(message):
-    global budget_manager
-    budget_manager = BudgetManager()
-    get_report = print_budget()
-    bot.send_message(message.chat.id, get_report)
-    bot.send_message(message.chat.id, "Please enter your new budget in the format:\n/setbud G <amount>, B <amount>, F <amount>, W <amount>, M <amount>")
+@workers.in_chat_order
+async def budget_command(message):
+    get_report = await workers.run(print_budget, message.chat.id)
+    categories = await workers.run(get_categories, message.chat.id)
+    outbox.put(message.chat.id, get_report)
+    outbox.put(message.chat.id, "Please enter your new budget in the format:\n/setbud "
+        + ", ".join(f"{code} <amount>" for code in categories.codes)
+        + "\nCategories without an amount get no budget.")
 
 # Routine 15: Process and save the new budget set by the user
 # Input: User sends the '/setbud' command with budget amounts
 # Output: Saves the budget details and sends confirmation and budget summary
 @bot.message_handler(func=lambda message: message.text.startswith('/setbud '))
-def set_budget_command(message):
+@workers.in_chat_order
+async def set_budget_command(message):
     try:
-        global budget_manager
-        budget_manager = BudgetManager()
-        budget_manager.parse_message(message.text)
-        bot.send_message(message.chat.id, f"Budget is set with:\n{budget_manager.get_budget_summary()}")
-        bot.send_message(message.chat.id, f"Total budget messageset: {budget_manager.get_total_budget()}")
+        budget_manager = BudgetManager(message.chat.id)
+        await workers.run(budget_manager.parse_message, message.text)
+        outbox.put(message.chat.id, f"Budget is set with:\n{budget_manager.get_budget_summary()}")
+        outbox.put(message.chat.id, f"Total budget messageset: {budget_manager.get_total_budget()}")
 
     except ValueError as e:
         # Error message in process_spend_command
-        bot.send_message(message.chat.id, f"Error: {e}\n"
-        "Please provide the information in the correct format:\n'/budget G <amount>, B <amount>, F <amount>, W <amount>, M <amount>")
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please provide the information in the correct format:\n'/setbud <category> <amount>, <category> <amount>, ...'")
         
 # Routine 16: Check and display the remaining budget for each category
 # Input: User sends '/check_budget' command
 # Output: Sends the remaining budget by category
 @bot.message_handler(commands=['check_budget'])
-def check_budget_command(message):
-    str_out =  check_budget()
-    bot.reply_to(message, str_out)
-    bot.send_message(message.chat.id, " Go to /budget_summarize to see more detailed budget summarize.")
+@workers.in_chat_order
+async def check_budget_command(message):
+    str_out, category_data =  await workers.run(check_budget, message.chat.id)
+    outbox.put(message.chat.id, str_out)
+    outbox.put(message.chat.id, " Go to /budget_summarize to see more detailed budget summarize.")
 
 # Routine 17: Provide a comprehensive budget analysis (spending vs. budget)
 # Input: User sends '/budget_summarize' command
 # Output: Sends an analysis of overall spending and category-wise spending vs. budget
 @bot.message_handler(commands=['budget_summarize'])
-def check_budget_command(message):
+@workers.in_chat_order
+async def check_budget_command(message):
     """Handles the /checkbud command to provide budget analysis."""
-    overall_str, overall_data = overall_spending_vs_budget()
-    category_str, category_data = category_spending_vs_budget()
+    # Both reports render from one snapshot of the month
+    snapshot = await workers.run(month_snapshot, message.chat.id)
+    overall_str, overall_data = overall_spending_vs_budget(message.chat.id, snapshot=snapshot)
+    category_str, category_data = category_spending_vs_budget(message.chat.id, snapshot=snapshot)
 
     # Send the combined analysis message to the user
-    bot.send_message(message.chat.id, overall_str)
-    bot.send_message(message.chat.id, category_str)
+    outbox.put(message.chat.id, overall_str)
+    outbox.put(message.chat.id, category_str)
 
 # Routine 18: Provide a link to an external Dash app for financial summaries
 # Input: User sends '/summarize' command
-# Output: Sends a link to the Dash app for financial visual summaries
+# Output: Sends a link to the Dash app, which refreshes itself when the data changes
 @bot.message_handler(commands=['summarize'])
-def check_budget_command(message):
-    visual_by_month()
-    bot.send_message(message.chat.id, "Visit the Dash app for visual summaries: http://127.0.0.1:8057/")
-
-# Start polling to receive messages from users
-bot.polling()
+@workers.in_chat_order
+async def check_budget_command(message):
+    outbox.put(message.chat.id, "Visit the Dash app for visual summaries: http://127.0.0.1:8057/")
+
+# Routine 19: Import a bank statement uploaded as a document
+# Input: User sends a CSV or OFX file as a document
+# Output: Imports new rows (already imported rows are skipped) and sends the import counts
+@bot.message_handler(content_types=['document'])
+@workers.in_chat_order
+async def import_document(message):
+    file_name = message.document.file_name or ""
+    if not file_name.lower().endswith(('.csv', '.ofx', '.qfx')):
+        outbox.put(message.chat.id, "Please send a .csv or .ofx bank statement to import.")
+        return
+    try:
+        file_info = await bot.get_file(message.document.file_id)
+        content = await bot.download_file(file_info.file_path)
+        stats = await workers.run(import_statement_bytes, message.chat.id, content, file_name)
+        outbox.put(message.chat.id, f"{format_import_stats(stats)}\n\n"
+            "For more information about summary of your expenses: /expense_sum ", reply_to=message.message_id)
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}")
+
+# Routine 20: Export the ledger as a document
+# Input: User sends '/export [expenses|income] [csv|parquet] [from..to] [G,F,...]'
+# Output: Streams the matching rows to a file and sends it as a document
+@bot.message_handler(commands=['export'])
+@workers.in_chat_order
+async def export_document(message):
+    try:
+        options = parse_export_command(message.text)
+        export_file, file_name, rows = await workers.run(export_to_tempfile, message.chat.id, **options)
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please use the format:\n'/export [expenses|income] [csv|parquet] [YYYY-MM-DD..YYYY-MM-DD] [G,F]'")
+        return
+    # Files are sent directly, after the texts queued before them
+    await outbox.flush(message.chat.id)
+    with export_file:
+        await bot.send_document(message.chat.id, types.InputFile(export_file, file_name),
+                                caption=f"{rows} {options['kind']} rows exported.")
+
+# Routine 21: Send a dashboard chart as an image
+# Input: User sends '/chart', '/chart_income', '/chart_categories', '/chart_budget', '/chart_remaining' or '/chart_tree', optionally with a month 'YYYY-MM'
+# Output: Renders the chart to PNG (or reuses the cached image while the data is unchanged) and sends it as a photo
+@bot.message_handler(commands=list(CHART_COMMANDS))
+@workers.in_chat_order
+async def send_chart(message):
+    try:
+        command, month = parse_chart_command(message.text)
+        png = await charts.render(message.chat.id, command, month)
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please use the format:\n'/chart [YYYY-MM]'")
+        return
+    caption = f"{CHART_COMMANDS[command][0]} ({month})"
+    await outbox.flush(message.chat.id)
+    await bot.send_photo(message.chat.id, types.InputFile(io.BytesIO(png), f"{command}.png"), caption=caption)
+
+# Routine 22: List the chat's categories
+# Input: User sends '/categories'
+# Output: Sends every category with its code, name and import keywords
+@bot.message_handler(commands=['categories'])
+@workers.in_chat_order
+async def list_categories(message):
+    categories = await workers.run(get_categories, message.chat.id)
+    outbox.put(message.chat.id, format_categories(categories) + "\n\n"
+        "Add or rename one: /category CODE Name\n"
+        "Add or move one below another: /category PARENT/CODE Name (/category /CODE Name moves it to the top)\n"
+        "Set its import keywords: /category_keywords CODE word, word\n"
+        "Remove an unused one: /category_remove CODE")
+
+# Routine 23: Add, rename or move a category
+# Input: User sends '/category CODE Name', or '/category PARENT/CODE Name' to place it below another category
+# Output: Stores the category and confirms it
+@bot.message_handler(commands=['category'])
+@workers.in_chat_order
+async def add_category(message):
+    try:
+        parent, code, name = parse_category_command(message.text, with_parent=True)
+        added = await workers.run(set_category, message.chat.id, code, name, parent)
+        outbox.put(message.chat.id, f"Category {code} {'added' if added else 'updated'}: {name}")
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please use the format:\n'/category CODE Name' or '/category PARENT/CODE Name'")
+
+# Routine 24: Set the words that file imported statement rows under a category
+# Input: User sends '/category_keywords CODE word, word'
+# Output: Stores the keywords and confirms them
+@bot.message_handler(commands=['category_keywords'])
+@workers.in_chat_order
+async def category_keywords(message):
+    try:
+        code, words = parse_category_command(message.text)
+        keywords = await workers.run(set_category_keywords, message.chat.id, code, words.split(","))
+        outbox.put(message.chat.id, f"Keywords of {code}: {', '.join(keywords) or 'none'}")
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please use the format:\n'/category_keywords CODE word, word'")
+
+# Routine 25: Remove a category without expenses
+# Input: User sends '/category_remove CODE'
+# Output: Removes the category and its budget entry
+@bot.message_handler(commands=['category_remove'])
+@workers.in_chat_order
+async def delete_category(message):
+    try:
+        parts = message.text.split()
+        if len(parts) != 2:
+            raise ValueError("Invalid number of fields!")
+        outbox.put(message.chat.id, await workers.run(remove_category, message.chat.id, parts[1].upper()))
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please use the format:\n'/category_remove CODE'")
+
+# Routine 26: Total the spending of a category and every category below it
+# Input: User sends '/category_sum CODE [YYYY-MM | YYYY-MM-DD..YYYY-MM-DD]'
+# Output: Sends the subtree's total and the total of each direct subcategory
+@bot.message_handler(commands=['category_sum'])
+@workers.in_chat_order
+async def category_sum(message):
+    try:
+        parts = message.text.split()
+        if len(parts) not in [2, 3]:
+            raise ValueError("Invalid number of fields!")
+        categories = await workers.run(get_categories, message.chat.id)
+        code = categories.normalize(parts[1])
+        start, end, label = parse_period(parts[2] if len(parts) == 3 else None)
+        spending = await workers.run(category_subtree_spending, message.chat.id, code, start, end)
+        outbox.put(message.chat.id, format_category_spending(message.chat.id, code, label, spending))
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please use the format:\n'/category_sum CODE [YYYY-MM]'")
+
+# Routine 27: Total the spending by tag
+# Input: User sends '/tag_sum [#tag] [YYYY-MM | YYYY-MM-DD..YYYY-MM-DD]'
+# Output: Sends one tag's total by category (nested tags included), or the total of every tag
+@bot.message_handler(commands=['tag_sum'])
+@workers.in_chat_order
+async def tag_sum(message):
+    try:
+        tag, start, end, label = parse_tag_sum_command(message.text)
+        if tag is None:
+            spending = await workers.run(tag_totals, message.chat.id, start, end)
+        else:
+            spending = await workers.run(tag_spending, message.chat.id, tag, start, end)
+        outbox.put(message.chat.id, format_tag_spending(message.chat.id, label, tag, spending))
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please use the format:\n'/tag_sum [#tag] [YYYY-MM]'")
+
+# Routine 28: Add a recurring expense or income
+# Input: User sends '/every [N] day(s)|week(s)|month(s) [WEEKDAY|DAY] [from YYYY-MM-DD] /s entry' or '... /e entry'
+# Output: Stores the rule, records the occurrences already due and confirms the next one
+@bot.message_handler(commands=['every'])
+@workers.in_chat_order
+async def add_recurring(message):
+    try:
+        categories = await workers.run(get_categories, message.chat.id)
+        fields = parse_recurring_command(message.text, categories)
+        rule, recorded = await workers.run(add_rule, message.chat.id, fields)
+        reply = f"Recurring rule {rule.id} added: {rule.describe()}, next on {rule.next_run}"
+        if recorded:
+            reply += "\n" + await workers.run(format_recorded_entries, message.chat.id, recorded)
+        outbox.put(message.chat.id, reply)
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please use the format:\n'/every month 1 /s B, rent, 1500'\n'/every 2 weeks friday /e salary, 2500'\n"
+        "'/every 10 days from 2024-01-01 /s G, groceries, 80'")
+
+# Routine 29: List the recurring rules
+# Input: User sends '/recurring'
+# Output: Sends every rule of the chat with its schedule and next occurrence
+@bot.message_handler(commands=['recurring'])
+@workers.in_chat_order
+async def list_recurring(message):
+    rules = await workers.run(get_rules, message.chat.id)
+    outbox.put(message.chat.id, await workers.run(format_rules, message.chat.id, rules))
+
+# Routine 30: Remove a recurring rule
+# Input: User sends '/recurring_remove ID'
+# Output: Removes the rule; the entries it recorded are kept
+@bot.message_handler(commands=['recurring_remove'])
+@workers.in_chat_order
+async def delete_recurring(message):
+    try:
+        parts = message.text.split()
+        if len(parts) != 2 or not parts[1].isdigit():
+            raise ValueError("Invalid rule ID!")
+        outbox.put(message.chat.id, await workers.run(remove_rule, message.chat.id, int(parts[1])))
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please use the format:\n'/recurring_remove ID' (see /recurring)")
+
+# Routine 31: Show or set the budget alert thresholds
+# Input: User sends '/alerts', '/alerts [CODE] 80 100', '/alerts [CODE] off' or '/alerts CODE default'
+# Output: Stores the thresholds and confirms them, or lists the current ones
+@bot.message_handler(commands=['alerts'])
+@workers.in_chat_order
+async def alert_thresholds(message):
+    try:
+        if len(message.text.split()) == 1:
+            outbox.put(message.chat.id, await workers.run(format_alert_thresholds, message.chat.id))
+            return
+        categories = await workers.run(get_categories, message.chat.id)
+        category, percents = parse_alerts_command(message.text, categories)
+        outbox.put(message.chat.id,
+            await workers.run(set_alert_thresholds, message.chat.id, category, percents))
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please use the format:\n'/alerts 80 100', '/alerts G 50 90 100', '/alerts G off' or '/alerts G default'")
+
+# Builds the inline keyboard of a history page
+# Input: (label, callback data) pairs from history_page()
+# Output: An InlineKeyboardMarkup with the buttons in one row, or None without buttons
+def history_keyboard(buttons):
+    if not buttons:
+        return None
+    keyboard = types.InlineKeyboardMarkup()
+    keyboard.row(*(types.InlineKeyboardButton(label, callback_data=data) for label, data in buttons))
+    return keyboard
+
+# Routine 32: Browse the chat's expenses or income a page at a time
+# Input: User sends '/history' or '/history income'
+# Output: Sends the newest page with buttons to the older and newer pages
+@bot.message_handler(commands=['history'])
+@workers.in_chat_order
+async def history_command(message):
+    try:
+        kind = parse_history_command(message.text)
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}")
+        return
+    text, buttons = await workers.run(history_page, message.chat.id, kind)
+    # The page is edited in place later, so it is sent directly with its keyboard
+    await outbox.flush(message.chat.id)
+    await bot.send_message(message.chat.id, text, reply_markup=history_keyboard(buttons))
+
+# Routine 33: Turn a history page
+# Input: User presses a "Newer" or "Older" button under a history page
+# Output: Edits the page message to show the next page
+@bot.callback_query_handler(func=lambda call: (call.data or "").startswith(CALLBACK_PREFIX + " "))
+async def history_turn_page(call):
+    try:
+        kind, cursor, newer = parse_history_callback(call.data)
+    except ValueError:
+        await bot.answer_callback_query(call.id)
+        return
+    chat_id = call.message.chat.id
+    text, buttons = await workers.run(history_page, chat_id, kind, cursor, newer)
+    try:
+        await bot.edit_message_text(text, chat_id, call.message.message_id, reply_markup=history_keyboard(buttons))
+    except ApiTelegramException as e:
+        # A second click on the same button finds the page already shown
+        if "message is not modified" not in e.description:
+            raise
+    await bot.answer_callback_query(call.id)
+
+# Routine 34: Search the chat's expenses and income by their words
+# Input: User sends '/find WORDS [YYYY|YYYY-MM|YYYY-MM-DD..YYYY-MM-DD]'
+# Output: Sends the number and sum of the matching entries and the newest of them
+@bot.message_handler(commands=['find'])
+@workers.in_chat_order
+async def find_command(message):
+    try:
+        words, start, end, label = parse_find_command(message.text)
+    except ValueError as e:
+        outbox.put(message.chat.id, f"Error: {e}\n"
+        "Please use the format:\n'/find uber', '/find coffee 2024' or '/find taxi* 2024-01-01..2024-06-30'")
+        return
+    results = await workers.run(search_entries, message.chat.id, words, start, end)
+    outbox.put(message.chat.id, await workers.run(format_search_results, message.chat.id, words, label, results))
+
+# Tells a chat which entries its recurring rules recorded on a scheduler tick
+# Input: Chat id and the new Expense and Income objects
+# Output: Queues the list of entries in the outbox
+async def notify_recorded(chat_id, entries):
+    outbox.put(chat_id, await workers.run(format_recorded_entries, chat_id, entries))
+
+# Receive messages through the webhook when WEBHOOKURLBUDGET is set, otherwise fall back to polling
+# Budget alerts and recurring rules are handled in the background for as long as the bot runs
+async def main():
+    outbox.start()
+    budget_alerts.deliver = outbox.put_threadsafe
+    scheduler.start(notify_recorded)
+    if WEBHOOK_URL:
+        await run_webhook(bot)
+    else:
+        await bot.delete_webhook()  # getUpdates is refused while a webhook is registered
+        await bot.polling(non_stop=True)
+
+if __name__ == '__main__':
+    asyncio.run(main())
     
\ No newline at end of file
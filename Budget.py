@@ -1,50 +1,48 @@
-from sqlalchemy import create_engine, Column, String, Float, Integer
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-
-# Define the SQLAlchemy Base
-Base = declarative_base()
+from decimal import Decimal
+from sqlalchemy import Column, String, Integer, BigInteger, Index
+from Categories import get_categories
+from Storage import BUDGET_VERSION_KEY, Base, Money, bump_data_version, create_tables, session_scope, to_money
 
 # Represents a budget entry in the database
 """
 Attributes:
     id (int): Unique identifier for the budget entry.
-    category (str): Category of the budget entry (e.g. "G" for Groceries).
-    amount (float): Amount allocated to the budget category.
+    chat_id (int): Telegram chat that owns the budget entry.
+    category (str): Code of one of the chat's categories (e.g. "G" for Groceries).
+    amount (Decimal): Amount allocated to the budget category, stored as integer cents.
 """
 class Budget(Base):
     __tablename__ = 'budget'
+    # One budget entry per category and chat
+    __table_args__ = (Index("ix_budget_chat_category", "chat_id", "category", unique=True),)
     
     id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column(BigInteger, nullable=False, server_default="0")
     category = Column(String, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(Money, nullable=False)
 
     # Initializes a new Budget instance.
-    def __init__(self, category, amount):
+    def __init__(self, chat_id, category, amount):
+        self.chat_id = chat_id
         self.category = category
-        self.amount = amount
-
-# Initialize the database
-engine = create_engine('sqlite:///budget.db')
-Base.metadata.create_all(engine)
+        self.amount = to_money(amount)
 
-# Create a configured "Session" class
-Session = sessionmaker(bind=engine)
-# Create a Session
-session = Session()
+# Create the budget table in the shared database
+create_tables()
 
 # Manages a budget by parsing user input, storing data in a database, and providing summary information.
 class BudgetManager:
-    category_list = ['G', 'B', 'F', 'W', 'M']
-
-    def __init__(self):
+    def __init__(self, chat_id):
+        self.chat_id = chat_id  # Telegram chat the budget belongs to
+        self.categories = get_categories(chat_id)  # The chat's categories, from the shared cache
         self.bud_list = []  # Stores the budget amounts for each category
         self.bud_category = []  # Stores the categories for the budget
-        self.total_budget = 0  # Total budget amount across all categories
+        self.total_budget = Decimal(0)  # Total budget amount across all categories
         self.bud_dict = {}  # Dictionary mapping categories to their budget amounts
 
     # Parses a user-provided message to extract budget information.
-    # Input: A message string containing budget data (e.g., "/setbud G 100, B 200, F 50, W 75, M 40")
+    # Input: A message string containing budget data for any of the chat's categories,
+    #        in any order (e.g., "/setbud G 100, B 200, F 50, W 75, M 40")
     # Output: Parses and stores the budget data; throws errors if message is invalid
     def parse_message(self, message):
         if not message or len(message) < 8:
@@ -52,31 +50,22 @@ class BudgetManager:
 
         user_data = message[8:].split(', ')  # Extract budget data from the message
 
-        if len(user_data) != 5:
-            raise ValueError("Invalid number of fields!")
-
         # Extract category and amount from the user's message
         for i in user_data:
-            i = i.strip()
-            budget = i.split(' ')
-            if budget:
-                if not budget[1].replace('.', '', 1).isdigit():
-                    raise ValueError("Invalid amount!")
-                self.bud_list.append(float(budget[1]))  # Add the amount to the list
-                self.total_budget += float(budget[1])  # Add the amount to the total budget
-                self.bud_category.append(budget[0])  # Add the category to the list
-            else:
+            budget = i.strip().split(' ')
+            if len(budget) != 2:
                 raise ValueError("Syntax error! Please try again.")
+            if not budget[1].replace('.', '', 1).isdigit():
+                raise ValueError("Invalid amount!")
+            category = self.categories.normalize(budget[0])
+            # Each category may appear only once
+            if category in self.bud_category:
+                raise ValueError(f"Category {category} is listed twice! Please try again.")
+            self.bud_list.append(to_money(budget[1]))  # Add the amount to the list
+            self.total_budget += to_money(budget[1])  # Add the amount to the total budget
+            self.bud_category.append(category)  # Add the category to the list
 
-        # Check if the correct number of categories was provided
-        if len(self.bud_category) != len(self.category_list):
-            raise ValueError("Incorrect number of categories! Please try again.")
 
-        # Ensure that the correct order of categories was provided
-        for i in range(len(self.category_list)):
-            if self.bud_category[i] != self.category_list[i]:
-                raise ValueError("Categories are incorrect! Please try again.")
-            
         self.bud_dict = dict(zip(self.bud_category, self.bud_list))  # Create a dictionary of categories and amounts
 
         # Save to the database
@@ -86,11 +75,8 @@ class BudgetManager:
     # Input: None
     # Output: A string summarizing the budget by category
     def get_budget_summary(self):
-        return (f"Groceries: {self.bud_list[0]}\n"
-                f"Bill and Housing: {self.bud_list[1]}\n"
-                f"Fun: {self.bud_list[2]}\n"
-                f"Wellness: {self.bud_list[3]}\n"
-                f"Miscellaneous: {self.bud_list[4]}")
+        return "\n".join(f"{self.categories.name(category)}: {amount}"
+                         for category, amount in zip(self.bud_category, self.bud_list))
 
     # Returns total budget
     # Input: None
@@ -106,25 +92,33 @@ class BudgetManager:
     
     # Store data in the database
     # Input: None
-    # Output: Saves the budget data to the database and clears existing data
+    # Output: Saves the budget data to the database and clears this chat's existing data
     def save_to_db(self):
-        # Clear existing data from the 'budget' table
-        session.query(Budget).delete()
+        with session_scope() as session:
+            # Clear this chat's existing data from the 'budget' table
+            session.query(Budget).filter(Budget.chat_id == self.chat_id).delete()
+
+            # Add the new budget data to the database
+            for category, amount in self.bud_dict.items():
+                budget_entry = Budget(chat_id=self.chat_id, category=category, amount=amount)
+                session.add(budget_entry)
 
-        # Add the new budget data to the database
-        for category, amount in self.bud_dict.items():
-            budget_entry = Budget(category=category, amount=amount)
-            session.add(budget_entry)
+            # Budgets apply to every month
+            bump_data_version(session, self.chat_id, [BUDGET_VERSION_KEY])
 
-        session.commit()
+        # Imported here: alerts read the budget through Data_Processing, which imports this module
+        from Alerts import budget_alerts
+        budget_alerts.invalidate(self.chat_id)
 
 # Returns amount of budget in setup of category dict and total budget amount
-# Input: None
+# Input: Telegram chat id
 # Output: A tuple containing a dictionary of categories and amounts, and the total budget amount
-def get_budget():
+def get_budget(chat_id):
     budget_category = {}
-    budgets = session.query(Budget).all()  # Retrieve all budget entries from the database
-    total_amount = 0  # Initialize total budget amount
+    with session_scope() as session:
+        # Retrieve the chat's budget entries from the database
+        budgets = session.query(Budget).filter(Budget.chat_id == chat_id).all()
+    total_amount = Decimal(0)  # Initialize total budget amount
     for budget in budgets:
         budget_category[budget.category] = budget.amount  # Map categories to their amounts
         total_amount += budget.amount  # Add the amount to the total budget
@@ -132,26 +126,17 @@ def get_budget():
     return budget_category, total_amount
 
 # Returns a formatted string of the current budget summary
-# Input: None
+# Input: Telegram chat id
 # Output: A string summarizing the budget in a user-friendly format
-def print_budget():
+def print_budget(chat_id):
     # Get the budget details from the database
-    budget_category, total_amount = get_budget()
+    budget_category, total_amount = get_budget(chat_id)
     
-    # Format the budget for display
+    # Format the budget for display, with the chat's category names
+    categories = get_categories(chat_id)
     summary_str = "Current Budget Summary:\n"
     for category, amount in budget_category.items():
-        # Convert the category to a more readable format
-        category_name = {
-            'G': 'Groceries',
-            'B': 'Bill and Housing',
-            'F': 'Fun (Shopping and Eating out)',
-            'W': 'Wellness (Education and Health)',
-            'M': 'Miscellaneous'
-        }.get(category, 'Unknown Category')  # Default to 'Unknown Category' if the category is not found
-        
-        # Add the category and amount to the summary string
-        summary_str += f"{category_name}: ${amount:.2f}\n"
+        summary_str += f"{categories.name(category)}: ${amount:.2f}\n"
 
     # Add the total budget at the end
     summary_str += f"Total Budget: ${total_amount:.2f}"
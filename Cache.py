@@ -0,0 +1,125 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+    """
+    Thread-safe least-recently-used cache with hit/miss counters.
+
+    Keys should include the data version of what they cache (e.g. (month, chat,
+    version)), so entries never need invalidating: a change produces a new key
+    and the stale entry ages out. get_or_compute() runs the computation once per
+    key even when many threads miss at the same time; the others wait for it.
+
+    Attributes:
+        maxsize (int): Largest number of entries kept.
+        hits (int): Lookups answered from the cache.
+        misses (int): Lookups that ran the computation.
+        coalesced (int): Lookups that waited for another thread's computation.
+        evictions (int): Entries dropped to stay within maxsize.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._pending = {}  # key -> _Pending computation in progress
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the cached value for a key (marking it recently used), or default."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        """Stores a value, evicting the least recently used entries beyond maxsize."""
+        with self._lock:
+            self._store(key, value)
+
+    def get_or_compute(self, key, compute):
+        """
+        Returns the cached value for a key, computing and storing it on a miss.
+
+        Args:
+            key (hashable): Cache key.
+            compute (callable): Zero-argument function producing the value.
+
+        Returns:
+            The cached or newly computed value; exceptions from compute are
+            raised in every thread waiting for it and nothing is cached.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            pending = self._pending.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._pending[key] = _Pending()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            pending.value = compute()
+        except Exception as e:
+            pending.error = e
+            raise
+        finally:
+            with self._lock:
+                if pending.error is None:
+                    self._store(key, pending.value)
+                del self._pending[key]
+            pending.done.set()
+        return pending.value
+
+    def stats(self):
+        """Returns the counters, the current size and the hit rate as a dictionary."""
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hit_rate": (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        """Drops every entry and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.coalesced = self.evictions = 0
+
+    def _store(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+class _Pending:
+    """A computation in progress that other threads can wait for."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
@@ -0,0 +1,497 @@
+import re
+import threading
+from bisect import bisect_left
+from functools import lru_cache
+from sqlalchemy import BigInteger, Column, Index, Integer, String, func, literal, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from Storage import BUDGET_VERSION_KEY, Base, after_commit, bump_data_version, create_tables, session_scope
+
+# User-defined expense categories, per chat.
+# A chat starts with the five default categories; the first change stores them
+# in the categories table, after which any number can be added, renamed or
+# removed. Every lookup of a chat's codes, names and import keywords goes
+# through get_categories(), which keeps one CategorySet per chat in memory and
+# is invalidated whenever the chat's categories change.
+# Categories form a tree: each stores its materialized path of codes from the
+# top, e.g. "F/RESTAURANTS/COFFEE", so a subtree is one range of sorted paths.
+
+# Code, name and statement keywords of the categories every chat starts with
+DEFAULT_CATEGORIES = [
+    ("G", "Groceries",
+     ["grocery", "groceries", "supermarket", "market", "costco", "walmart", "safeway", "kroger", "aldi", "lidl"]),
+    ("B", "Bill and Housing",
+     ["rent", "mortgage", "hydro", "electric", "water", "gas bill", "internet", "phone", "insurance", "utility"]),
+    ("F", "Fun (Shopping and Eating out)",
+     ["restaurant", "cafe", "coffee", "starbucks", "bar", "cinema", "netflix", "spotify", "amazon", "uber eats",
+      "shop"]),
+    ("W", "Wellness (Education and Health)",
+     ["pharmacy", "clinic", "dental", "doctor", "gym", "fitness", "tuition", "course", "book", "health"]),
+    ("M", "Miscellaneous", []),
+]
+
+# Category of imported rows that match no keyword, when the chat has it
+FALLBACK_CATEGORY = "M"
+
+# Category codes: letters, digits and underscores, compared upper-cased
+CODE_PATTERN = re.compile(r"^[A-Z0-9_]{1,16}$")
+
+# Categories listed in full in error messages; longer lists point to /categories
+LISTED_CATEGORIES = 10
+
+# Separates the codes of a category path; sorts before every code character
+PATH_SEPARATOR = "/"
+
+# Distinct statement descriptions whose category is remembered per chat
+CATEGORIZE_CACHE_SIZE = 4096
+
+
+class Category(Base):
+    """
+    One expense category of a chat.
+
+    Attributes:
+        id (int): Unique identifier; categories are listed in the order they were added.
+        chat_id (int): Telegram chat that owns the category.
+        code (str): Short upper-case code used in /s and /setbud, e.g. "G" or "PETS".
+        name (str): Name shown in messages and charts.
+        keywords (str): Comma-separated lower-case words that file imported statement rows under it.
+        path (str): Codes from the top category down to this one, e.g. "F/RESTAURANTS/COFFEE";
+            None for categories stored before subcategories, which are top-level.
+    """
+
+    __tablename__ = "categories"
+    __table_args__ = (
+        Index("ix_categories_chat_code", "chat_id", "code", unique=True),
+        # Moving a category re-paths its subtree with one range update
+        Index("ix_categories_chat_path", "chat_id", "path"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column("chat_id", BigInteger, nullable=False)
+    code = Column("code", String, nullable=False)
+    name = Column("name", String, nullable=False)
+    keywords = Column("keywords", String, nullable=True)
+    path = Column("path", String, nullable=True)
+
+
+# Create the categories table in the shared database
+create_tables()
+
+
+class CategorySet:
+    """
+    The categories of one chat, as loaded by get_categories().
+
+    Attributes:
+        chat_id (int): Telegram chat the categories belong to.
+        codes (list): Category codes in the order they were added.
+        names (dict): Maps each code to its name.
+        keywords (dict): Maps each code to its list of statement keywords.
+        paths (dict): Maps each code to its path, e.g. "F/RESTAURANTS/COFFEE".
+        children (dict): Maps each code to the codes directly below it, in the order they were added.
+        fallback (str): Category of imported rows that match no keyword.
+    """
+
+    def __init__(self, chat_id, rows):
+        self.chat_id = chat_id
+        self.codes = [code for code, _, _, _ in rows]
+        self.names = {code: name for code, name, _, _ in rows}
+        self.keywords = {code: keywords for code, _, keywords, _ in rows if keywords}
+        self.paths = {code: path or code for code, _, _, path in rows}
+        self.children = {code: [] for code in self.codes}
+        for code in self.codes:
+            parent = self.parent(code)
+            if parent in self.children:
+                self.children[parent].append(code)
+        # Paths in sorted order: the subtree of a category is one contiguous range
+        self._sorted = sorted((path, code) for code, path in self.paths.items())
+        self._sorted_paths = [path for path, _ in self._sorted]
+        self.fallback = FALLBACK_CATEGORY if FALLBACK_CATEGORY in self.names else self.codes[-1]
+        # Statements repeat the same descriptions; match each one against the keywords once
+        self.categorize = lru_cache(maxsize=CATEGORIZE_CACHE_SIZE)(self._categorize)
+
+    def __contains__(self, code):
+        return code in self.names
+
+    def __len__(self):
+        return len(self.codes)
+
+    def name(self, code):
+        """Returns the name of a category, or its code when the chat no longer has it."""
+        return self.names.get(code, code)
+
+    def parent(self, code):
+        """Returns the code of the category directly above a category, or None for a top-level one."""
+        segments = self.paths.get(code, code).split(PATH_SEPARATOR)
+        return segments[-2] if len(segments) > 1 else None
+
+    def subtree(self, code):
+        """
+        Returns a category and every category below it.
+
+        Args:
+            code (str): Upper-case category code.
+
+        Returns:
+            list: Codes of the subtree, parents before their children; just the
+            code itself when the chat has no such category.
+        """
+        path = self.paths.get(code)
+        if path is None:
+            return [code]
+        # Descendant paths start with path + "/"; "0" is the character after the separator
+        start = bisect_left(self._sorted_paths, path)
+        stop = bisect_left(self._sorted_paths, path + "0", start)
+        return [code for _, code in self._sorted[start:stop]]
+
+    def rollup(self, totals):
+        """
+        Adds amounts recorded per category to every category above it.
+
+        Args:
+            totals (dict): Maps category codes to the amount recorded under the category itself.
+
+        Returns:
+            dict: Maps the codes with recorded amounts, and every category above them,
+            to the total of their subtree.
+        """
+        rolled = {}
+        for code, total in totals.items():
+            for ancestor in self.paths.get(code, code).split(PATH_SEPARATOR):
+                rolled[ancestor] = rolled.get(ancestor, 0) + total
+        return rolled
+
+    def walk(self):
+        """Yields (code, depth) for every category, each parent followed by its subtree."""
+        stack = [(code, 0) for code in reversed(self.codes) if self.parent(code) not in self.children]
+        while stack:
+            code, depth = stack.pop()
+            yield code, depth
+            stack.extend((child, depth + 1) for child in reversed(self.children[code]))
+
+    def normalize(self, code):
+        """
+        Returns the stored code of a category typed by the user, in any case.
+
+        Args:
+            code (str): Category code as typed, e.g. "g" or "Pets".
+
+        Returns:
+            str: The upper-case code; raises ValueError when the chat has no such category.
+        """
+        normalized = code.strip().upper()
+        if normalized not in self.names:
+            raise ValueError(f"Invalid category {code}. Category must be in:\n{self.describe()}")
+        return normalized
+
+    def describe(self):
+        """Returns one "code - name" line per category, or a pointer to /categories for long lists."""
+        if len(self.codes) > LISTED_CATEGORIES:
+            return f"{len(self.codes)} categories, see /categories"
+        return "\n".join(f"{code} - {self.names[code]}" for code in self.codes)
+
+    def _categorize(self, description):
+        # The first category with a matching keyword wins; unmatched rows go to the fallback
+        text = description.lower()
+        for code, keywords in self.keywords.items():
+            if any(keyword in text for keyword in keywords):
+                return code
+        return self.fallback
+
+
+class CategoryCache:
+    """
+    CategorySet per chat, read from the categories table once and kept in memory.
+
+    Writers in this process call invalidate() after changing a chat's
+    categories. Readers in other processes, such as the dashboard, pass the
+    data version they render: category changes bump the chat's budget version,
+    so a set loaded for another version is read again.
+
+    Attributes:
+        loads (int): Category sets read from the database.
+    """
+
+    def __init__(self):
+        self.loads = 0
+        self._sets = {}  # chat_id -> (data version it was loaded for, CategorySet)
+        self._lock = threading.Lock()
+
+    def get(self, chat_id, version=None):
+        """
+        Returns the categories of a chat.
+
+        Args:
+            chat_id (int): Telegram chat whose categories are returned.
+            version (int, optional): Data version the caller renders; a set cached
+                for another version is reloaded.
+
+        Returns:
+            CategorySet: The chat's categories.
+        """
+        with self._lock:
+            entry = self._sets.get(chat_id)
+            if entry is None or (version is not None and entry[0] != version):
+                entry = (version, self._load([chat_id])[chat_id])
+                self._sets[chat_id] = entry
+            return entry[1]
+
+    def get_many(self, chat_ids):
+        """
+        Returns the categories of several chats, reading the uncached ones with one query.
+
+        Args:
+            chat_ids (iterable): Telegram chats whose categories are returned.
+
+        Returns:
+            dict: Maps each chat id to its CategorySet.
+        """
+        chat_ids = {int(chat_id) for chat_id in chat_ids}
+        with self._lock:
+            missing = [chat_id for chat_id in chat_ids if chat_id not in self._sets]
+            for chat_id, categories in self._load(missing).items():
+                self._sets[chat_id] = (None, categories)
+            return {chat_id: self._sets[chat_id][1] for chat_id in chat_ids}
+
+    def invalidate(self, chat_id):
+        """Drops the cached categories of a chat; the next lookup reads them again."""
+        with self._lock:
+            self._sets.pop(chat_id, None)
+
+    def clear(self):
+        """Drops every cached chat."""
+        with self._lock:
+            self._sets.clear()
+
+    def _load(self, chat_ids):
+        rows = {chat_id: [] for chat_id in chat_ids}
+        if not rows:
+            return {}
+        with session_scope() as session:
+            # Chunked to stay below SQLite's bound parameter limit
+            chat_list = list(rows)
+            for start in range(0, len(chat_list), 500):
+                stored = session.query(
+                    Category.chat_id, Category.code, Category.name, Category.keywords, Category.path
+                ).filter(
+                    Category.chat_id.in_(chat_list[start:start + 500])
+                ).order_by(Category.chat_id, Category.id).all()
+                for chat_id, code, name, keywords, path in stored:
+                    rows[chat_id].append((code, name, keywords.split(",") if keywords else [], path))
+        self.loads += len(rows)
+        # Chats that never changed their categories use the defaults, all top-level
+        defaults = [(code, name, keywords, None) for code, name, keywords in DEFAULT_CATEGORIES]
+        return {chat_id: CategorySet(chat_id, chat_rows or defaults) for chat_id, chat_rows in rows.items()}
+
+
+# Category cache shared by every lookup in the process
+category_cache = CategoryCache()
+
+
+def get_categories(chat_id, version=None):
+    """
+    Returns the categories of a chat from the in-process cache.
+
+    Args:
+        chat_id (int): Telegram chat whose categories are returned.
+        version (int, optional): Data version the caller renders, for callers in
+            processes that do not see this process's invalidations.
+
+    Returns:
+        CategorySet: The chat's categories.
+    """
+    return category_cache.get(chat_id, version)
+
+
+def parse_category_command(text, with_parent=False):
+    """
+    Parses a /category or /category_keywords command.
+
+    Args:
+        text (str): Message text such as "/category PETS Pets and vet",
+            "/category F/COFFEE Coffee" or "/category_keywords PETS vet, petco".
+        with_parent (bool, optional): Accept a category path before the code, as /category does.
+
+    Returns:
+        tuple: The upper-case category code and the rest of the text; with with_parent,
+        preceded by the parent path ("F/RESTAURANTS" in "F/RESTAURANTS/COFFEE", "" for
+        "/COFFEE", None when only a code is given). Raises ValueError when a field is missing.
+    """
+    parts = text.split(None, 2)
+    if len(parts) < 3:
+        raise ValueError("Invalid number of fields!")
+    segments = parts[1].upper().split(PATH_SEPARATOR)
+    if len(segments) > 1 and not with_parent:
+        raise ValueError("Give the category code without its path.")
+    # "/CODE" moves a category to the top level; its first segment is empty
+    checked = segments[1:] if len(segments) == 2 and not segments[0] else segments
+    if not all(CODE_PATTERN.match(segment) for segment in checked):
+        raise ValueError("Category codes are up to 16 letters, digits or underscores.")
+    if not with_parent:
+        return segments[0], parts[2].strip()
+    parent = PATH_SEPARATOR.join(segments[:-1]) if len(segments) > 1 else None
+    return parent, segments[-1], parts[2].strip()
+
+
+def set_category(chat_id, code, name, parent=None):
+    """
+    Adds a category to a chat, or renames it when the code exists, optionally
+    placing it under another category.
+
+    Moving a category moves its whole subtree: the paths below it are rewritten
+    with one range update on the (chat_id, path) index.
+
+    Args:
+        chat_id (int): Telegram chat that owns the category.
+        code (str): Upper-case category code.
+        name (str): Name shown in messages and charts.
+        parent (str, optional): Code or full path of the category to place it under,
+            "" to make it top-level, or None to keep its place (top level for a new category).
+
+    Returns:
+        bool: True when the category was added, False when it was renamed or moved;
+        raises ValueError on an unknown parent or a move below its own subtree.
+    """
+    with session_scope() as session:
+        _store_defaults(session, chat_id)
+        category = session.query(Category).filter(Category.chat_id == chat_id, Category.code == code).first()
+        old_path = _category_path(category)
+        path = old_path or code
+        if parent == "":
+            path = code
+        elif parent is not None:
+            parent_code = parent.split(PATH_SEPARATOR)[-1]
+            above = session.query(Category).filter(Category.chat_id == chat_id, Category.code == parent_code).first()
+            if above is None:
+                raise ValueError(f"No category {parent_code}. Add it with /category {parent_code} <name>")
+            above_path = _category_path(above)
+            if PATH_SEPARATOR in parent and parent != above_path:
+                raise ValueError(f"The path of {parent_code} is {above_path}.")
+            if old_path and (above_path + PATH_SEPARATOR).startswith(old_path + PATH_SEPARATOR):
+                raise ValueError(f"{code} cannot be moved into its own subtree.")
+            path = above_path + PATH_SEPARATOR + code
+
+        if category is None:
+            session.add(Category(chat_id=chat_id, code=code, name=name, path=path))
+        else:
+            category.name = name
+            category.path = path
+            if path != old_path:
+                # Every descendant keeps its place below the moved category
+                session.execute(update(Category).where(
+                    Category.chat_id == chat_id,
+                    Category.path >= old_path + PATH_SEPARATOR,
+                    Category.path < old_path + "0"
+                ).values(path=literal(path, String).concat(func.substr(Category.path, len(old_path) + 1))))
+        # Category names appear in every budget report and chart
+        bump_data_version(session, chat_id, [BUDGET_VERSION_KEY])
+    category_cache.invalidate(chat_id)
+    return category is None
+
+
+def set_category_keywords(chat_id, code, keywords):
+    """
+    Replaces the statement keywords of a chat's category.
+
+    Args:
+        chat_id (int): Telegram chat that owns the category.
+        code (str): Upper-case category code.
+        keywords (list): Words matched against imported statement descriptions.
+
+    Returns:
+        list: The stored lower-case keywords; raises ValueError when the category does not exist.
+    """
+    keywords = [keyword.strip().lower() for keyword in keywords if keyword.strip()]
+    with session_scope() as session:
+        _store_defaults(session, chat_id)
+        category = session.query(Category).filter(Category.chat_id == chat_id, Category.code == code).first()
+        if category is None:
+            raise ValueError(f"No category {code}. Add it with /category {code} <name>")
+        category.keywords = ",".join(keywords) or None
+    category_cache.invalidate(chat_id)
+    return keywords
+
+
+def remove_category(chat_id, code):
+    """
+    Removes a category without expenses from a chat, together with its budget entry.
+
+    Args:
+        chat_id (int): Telegram chat that owns the category.
+        code (str): Upper-case category code.
+
+    Returns:
+        str: Confirmation message; raises ValueError when the category does not
+        exist, still has expenses or recurring rules or is the chat's last category.
+    """
+    # Imported here: the expense, budget, recurring and alert modules look categories up through this module
+    from Alerts import budget_alerts
+    from Budget import Budget
+    from Expense import Expense
+    from Recurring import RecurringRule
+
+    with session_scope() as session:
+        _store_defaults(session, chat_id)
+        category = session.query(Category).filter(Category.chat_id == chat_id, Category.code == code).first()
+        if category is None:
+            raise ValueError(f"No category {code}.")
+        if session.query(Category).filter(Category.chat_id == chat_id).count() == 1:
+            raise ValueError("A chat needs at least one category.")
+        path = _category_path(category)
+        below = session.query(Category.code).filter(
+            Category.chat_id == chat_id,
+            Category.path >= path + PATH_SEPARATOR,
+            Category.path < path + "0"
+        ).first()
+        if below is not None:
+            raise ValueError(f"Category {code} has subcategories; move or remove {below.code} first.")
+        used = session.query(Expense.id).filter(Expense.chat_id == chat_id, Expense.category == code).first()
+        if used is not None:
+            raise ValueError(f"Category {code} still has expenses; rename it with /category {code} <name> instead.")
+        rule = session.query(RecurringRule.id).filter(
+            RecurringRule.chat_id == chat_id, RecurringRule.category == code).first()
+        if rule is not None:
+            raise ValueError(f"Recurring rule {rule.id} uses category {code}; remove it with /recurring_remove first.")
+        session.delete(category)
+        session.query(Budget).filter(Budget.chat_id == chat_id, Budget.category == code).delete()
+        bump_data_version(session, chat_id, [BUDGET_VERSION_KEY])
+        # The alert totals still hold the removed budget; they are read again on the next insert
+        after_commit(session, lambda: budget_alerts.invalidate(chat_id))
+    category_cache.invalidate(chat_id)
+    return f"Category {code} removed."
+
+
+def format_categories(categories):
+    """
+    Formats a chat's categories for the /categories command.
+
+    Args:
+        categories (CategorySet): Categories of the chat.
+
+    Returns:
+        str: One line per category with its code, name and keywords, subcategories
+        indented below their parent.
+    """
+    lines = [f"Your {len(categories)} categories:"]
+    for code, depth in categories.walk():
+        keywords = categories.keywords.get(code)
+        lines.append("  " * depth + f"{code} - {categories.names[code]}"
+                     + (f" ({', '.join(keywords)})" if keywords else ""))
+    return "\n".join(lines)
+
+
+def _store_defaults(session, chat_id):
+    # The first change to a chat's categories stores the defaults it was using
+    if session.query(Category.id).filter(Category.chat_id == chat_id).first() is not None:
+        return
+    session.execute(sqlite_insert(Category).values([
+        {"chat_id": chat_id, "code": code, "name": name, "keywords": ",".join(keywords) or None, "path": code}
+        for code, name, keywords in DEFAULT_CATEGORIES
+    ]).on_conflict_do_nothing())
+
+
+def _category_path(category):
+    # Categories stored before subcategories existed have no path and are top-level
+    if category is None:
+        return None
+    return category.path or category.code
@@ -0,0 +1,164 @@
+import asyncio
+import json
+import math
+import multiprocessing
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+import plotly.graph_objs as go
+import plotly.io as pio
+from plotly.subplots import make_subplots
+from plotly.utils import PlotlyJSONEncoder
+from Cache import LRUCache
+from Runtime import workers
+from Storage import get_data_version, month_key
+from Visualization import visual_by_month
+
+# PNG versions of the dashboard charts, sent directly in Telegram.
+# The figures come from Visualization.visual_by_month(); rendering them with
+# kaleido is CPU-bound, so it runs in a small process pool instead of the bot's
+# thread pool. Rendered images are cached per (chat, month, chart, data version).
+# Override the number of render processes with the RENDERWORKERSBUDGET environment variable.
+
+RENDER_WORKERS = int(os.getenv('RENDERWORKERSBUDGET', '2'))
+
+# Rendered PNGs kept in memory
+CHART_CACHE_SIZE = 256
+
+# Image size in pixels
+CHART_WIDTH = 900
+CHART_HEIGHT = 600
+
+# Bot command -> (caption, position of the figure in visual_by_month()'s result)
+CHART_COMMANDS = {
+    "chart": ("Total Spending vs Total Budget", 3),
+    "chart_income": ("Income vs Total Spending", 4),
+    "chart_categories": ("Spending per Category", 5),
+    "chart_budget": ("Category-Specific Spending vs Budget", 6),
+    "chart_remaining": ("Remaining Budget by Category", 7),
+    "chart_tree": ("Spending by Category Tree", 8),
+}
+
+
+# Renders a Plotly figure to PNG; runs in a render process
+# Input: Figure JSON, width and height in pixels
+# Output: PNG bytes and the render time in milliseconds
+def render_png(figure_json, width=CHART_WIDTH, height=CHART_HEIGHT):
+    start = time.perf_counter()
+    png = pio.from_json(figure_json).to_image(format="png", width=width, height=height)
+    return png, (time.perf_counter() - start) * 1000
+
+
+def _start_renderer():
+    # Kaleido starts a headless browser on first use; do it before the first request
+    render_png(json.dumps(go.Figure(), cls=PlotlyJSONEncoder), 10, 10)
+
+
+# Parses a /chart command
+# Input: Message text such as "/chart_budget" or "/chart_budget 2024-03"
+# Output: (command name, month key); raises ValueError on a bad month
+def parse_chart_command(text):
+    parts = text.split()
+    command = parts[0].lstrip("/").split("@")[0]
+    if command not in CHART_COMMANDS:
+        raise ValueError(f"Unknown chart: {command}")
+    if len(parts) == 1:
+        return command, month_key(date.today())
+    try:
+        return command, month_key(datetime.strptime(parts[1], "%Y-%m"))
+    except ValueError:
+        raise ValueError("Month must be in the format YYYY-MM")
+
+
+# Builds the figure of one chart as Plotly JSON
+# Input: Chat id, month key and chart command
+# Output: Figure JSON string; raises ValueError when the chat has nothing to chart
+def chart_figure_json(chat_id, month, command):
+    title, position = CHART_COMMANDS[command]
+    outputs = visual_by_month(chat_id, month)
+    figure = outputs[position]
+
+    if command != "chart_categories":
+        chart = go.Figure(data=figure["data"], layout=figure["layout"])
+        return json.dumps(chart.update_layout(title=f"{title} ({month})"), cls=PlotlyJSONEncoder)
+
+    # The dashboard shows one small pie per category; combine them in one image
+    pies = [graph.figure for graph in figure]
+    if not pies:
+        raise ValueError("No budget set. Use /budget to set one first.")
+    columns = min(3, len(pies))
+    rows = math.ceil(len(pies) / columns)
+    combined = make_subplots(
+        rows=rows, cols=columns,
+        specs=[[{"type": "domain"}] * columns for _ in range(rows)],
+        subplot_titles=[pie["layout"].title.text for pie in pies])
+    for index, pie in enumerate(pies):
+        combined.add_trace(pie["data"][0], row=index // columns + 1, col=index % columns + 1)
+    return json.dumps(combined.update_layout(title=f"{title} ({month})", showlegend=False), cls=PlotlyJSONEncoder)
+
+
+class ChartRenderer:
+    """
+    Renders chart PNGs in a process pool and caches them by data version.
+
+    Requests from one chat are already serialized by the bot, so two requests
+    for the same cache key never render concurrently.
+
+    Attributes:
+        cache (LRUCache): PNG bytes keyed by (chat, month, chart, data version).
+        render_ms (deque): Duration of the most recent renders, in milliseconds.
+    """
+
+    def __init__(self, max_workers=RENDER_WORKERS, cache_size=CHART_CACHE_SIZE):
+        self.max_workers = max_workers
+        self.cache = LRUCache(maxsize=cache_size)
+        self.render_ms = deque(maxlen=1000)
+        self._pool = None
+
+    @property
+    def pool(self):
+        """Process pool, started on first use. Uses spawn: the bot process runs threads."""
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_start_renderer)
+        return self._pool
+
+    async def render(self, chat_id, command, month):
+        """
+        Returns the PNG of one chart, rendering it only when the data changed.
+
+        Args:
+            chat_id (int): Telegram chat whose data is charted.
+            command (str): Chart command name, a key of CHART_COMMANDS.
+            month (str): Month key in "YYYY-MM" format.
+
+        Returns:
+            bytes: The PNG image.
+        """
+        version = await workers.run(get_data_version, chat_id, month)
+        key = (chat_id, month, command, version)
+        png = self.cache.get(key)
+        if png is not None:
+            return png
+
+        figure_json = await workers.run(chart_figure_json, chat_id, month, command)
+        loop = asyncio.get_running_loop()
+        png, elapsed = await loop.run_in_executor(self.pool, render_png, figure_json)
+        self.render_ms.append(elapsed)
+        self.cache.put(key, png)
+        return png
+
+    def shutdown(self):
+        """Stops the render processes."""
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+
+
+# Chart renderer shared by the bot handlers
+charts = ChartRenderer()
+
@@ -1,59 +1,173 @@
-from sqlalchemy import create_engine
+import argparse
+import json
+import os
+import numpy as np
 import pandas as pd
+from sqlalchemy import text
+from Categories import category_cache
+from Storage import engine
+# Importing the models creates their tables on a fresh database
+from Expense import Expense
+from Income import Income
 
-# Create engine and load data
-# Input: None
-# Output: Loads income and expense data from the SQLite databases into Pandas DataFrames
-engine = create_engine('sqlite:///income.db', echo=True)
-df_income = pd.read_sql('income', con=engine)  # Load income data from 'income' table
+# Cleans the income and expense tables into cleaned_income.csv and cleaned_expenses.csv.
+# Runs are incremental: the id of the last processed row (the high-water mark) is
+# kept in cleaned_state.json, so each run only reads, cleans and appends rows added
+# since the previous run. Duplicates are found through a sorted index of row hashes
+# stored next to each CSV instead of re-scanning the cleaned data. The state also
+# records each CSV's size, so rows appended by an interrupted run are discarded.
+# Rows deleted or edited in the database after they were cleaned are only picked up
+# by a full run: python Clean_data.py --full
 
-engine = create_engine('sqlite:///expenses.db', echo=True)
-df_expense = pd.read_sql('expenses', con=engine)  # Load expense data from 'expenses' table
+# Rows read from the database and cleaned per chunk
+CHUNK_SIZE = 100000
+
+STATE_FILE = "cleaned_state.json"
+
+# Per table: columns read, columns that must be present and columns identifying a duplicate
+CLEAN_SPECS = {
+    "income": {
+        "columns": ["id", "chat_id", "date", "source", "amount", "note"],
+        "required": ["date", "source", "amount"],
+        "duplicates": ["chat_id", "date", "source", "amount", "note"],
+    },
+    "expenses": {
+        "columns": ["id", "chat_id", "date", "category", "reason", "amount", "note"],
+        "required": ["date", "category", "reason", "amount"],
+        "duplicates": ["chat_id", "date", "category", "reason", "amount", "note"],
+    },
+}
+
+# Load data
+# Input: Table name, the last id already cleaned and the chunk size
+# Output: Yields DataFrames of the rows with a larger id, in id order
+def load_new_rows(table, last_id=0, chunk_size=CHUNK_SIZE):
+    columns = ", ".join(CLEAN_SPECS[table]["columns"])
+    query = text(f"SELECT {columns} FROM {table} WHERE id > :last_id ORDER BY id")
+    yield from pd.read_sql(query, con=engine, params={"last_id": last_id}, chunksize=chunk_size)
 
-# Remove duplicates which happen to be collected twice on the same date and same information
-# Input: None
-# Output: Removes duplicates from income and expense data where the same record appears twice
-def remove_duplicates():
-    # Drop duplicate rows based on specific columns for income and expenses
-    df_income.drop_duplicates(subset=["date", "source", "amount", "note"], inplace=True)
-    df_expense.drop_duplicates(subset=["date", "category", "reason", "amount", "note"], inplace=True)
-
-# Remove duplicates which happen to have missing values
-# Input: None
-# Output: Removes rows with missing values in specific columns for income and expenses
-def drop_na():
-    # Drop rows where any of the specified columns have missing (NaN) values
-    df_income.dropna(subset=["date", "source", "amount"], inplace=True)
-    df_expense.dropna(subset=["date", "category", "reason", "amount"], inplace=True)
 
 # Validate Data
-# Input: None
-# Output: Validates data by checking types and ensuring certain conditions hold for income and expense data
-def validate_data():
-    # Ensure 'amount' is of type float for both income and expense
-    df_expense["amount"] = df_expense["amount"].astype(float)
-    df_income["amount"] = df_income["amount"].astype(float)
+# Input: Table name and a DataFrame of its rows
+# Output: Converts amounts to positive floats in place and checks expense categories against
+#         the categories of each row's chat
+def validate_data(table, df):
+    # Amounts are stored as integer cents; write them as positive dollar floats
+    # (vectorized, no per-row Python calls)
+    df["amount"] = df["amount"].astype(float).abs() / 100
+
+    # Ensure expense categories are valid; the categories of every chat in the chunk are read at once
+    if table == "expenses":
+        chat_categories = category_cache.get_many(df["chat_id"].unique())
+        expected = pd.MultiIndex.from_tuples(
+            [(chat_id, code) for chat_id, categories in chat_categories.items() for code in categories.codes],
+            names=["chat_id", "category"])
+        found = pd.MultiIndex.from_frame(df[["chat_id", "category"]])
+        assert found.isin(expected).all(), "Unexpected categories found in expenses"
+
+
+# Remove rows which happen to have missing values
+# Input: Table name and a DataFrame of its rows
+# Output: The DataFrame without rows missing a required column
+def drop_na(table, df):
+    return df.dropna(subset=CLEAN_SPECS[table]["required"])
+
+
+# Remove duplicates which happen to be collected twice on the same date and same information
+# Input: Table name, a DataFrame of new rows and the sorted hashes of the rows cleaned so far
+# Output: (DataFrame without duplicates, sorted hash index including the kept rows)
+def remove_duplicates(table, df, seen_hashes):
+    hashes = pd.util.hash_pandas_object(df[CLEAN_SPECS[table]["duplicates"]], index=False).to_numpy()
+
+    # Keep the first occurrence within the chunk, then drop rows already in the index
+    keep = ~pd.Series(hashes).duplicated().to_numpy()
+    if len(seen_hashes):
+        positions = np.minimum(np.searchsorted(seen_hashes, hashes), len(seen_hashes) - 1)
+        keep &= seen_hashes[positions] != hashes
 
-    # Ensure 'amount' is positive by converting negative values to their absolute value
-    df_expense["amount"] = df_expense["amount"].apply(lambda x: abs(x))
-    df_income["amount"] = df_income["amount"].apply(lambda x: abs(x))
+    # Both parts are sorted, so the stable sort only merges two runs
+    merged = np.sort(np.concatenate([seen_hashes, np.sort(hashes[keep])]), kind="stable")
+    return df[keep], merged
+
+
+# Returns the hash index file of a table at a given high-water mark
+def _index_file(output_dir, table, last_id):
+    return os.path.join(output_dir, f"cleaned_{table}.hashes-{last_id}.npy")
+
+
+# Clean one table into its CSV file
+# Input: Table name, output directory, the saved state of the table and whether to start over
+# Output: Appends the cleaned new rows to the CSV, saves the hash index and returns
+#         (new state of the table, rows read, rows written)
+def clean_table(table, output_dir, table_state=None, full=False):
+    output = os.path.join(output_dir, f"cleaned_{table}.csv")
+    table_state = table_state or {}
+    last_id = table_state.get("last_id", 0)
+
+    # Resume only from a consistent previous run, otherwise start over from the first row
+    if (not full and "csv_bytes" in table_state and os.path.exists(output)
+            and os.path.getsize(output) >= table_state["csv_bytes"]
+            and os.path.exists(_index_file(output_dir, table, last_id))):
+        seen_hashes = np.load(_index_file(output_dir, table, last_id))
+        # Drop anything an interrupted run appended after the saved state
+        with open(output, "r+b") as f:
+            f.truncate(table_state["csv_bytes"])
+    else:
+        last_id, seen_hashes = 0, np.empty(0, dtype=np.uint64)
+        pd.DataFrame(columns=CLEAN_SPECS[table]["columns"]).to_csv(output, index=False)
+
+    read = written = 0
+    for df in load_new_rows(table, last_id):
+        if df.empty:
+            continue
+        read += len(df)
+        last_id = int(df["id"].iloc[-1])
+        validate_data(table, df)
+        df = drop_na(table, df)
+        df, seen_hashes = remove_duplicates(table, df, seen_hashes)
+        df.to_csv(output, mode="a", header=False, index=False)
+        written += len(df)
+
+    # A new high-water mark gets a new index file; the saved state still points at the old one
+    if read or not os.path.exists(_index_file(output_dir, table, last_id)):
+        np.save(_index_file(output_dir, table, last_id), seen_hashes)
+    return {"last_id": last_id, "csv_bytes": os.path.getsize(output)}, read, written
 
-    # Ensure expense categories are valid
-    expected_categories = ["G", "B", "F", "W", "M"]
-    assert df_expense["category"].isin(expected_categories).all(), "Unexpected categories found in expenses"
 
 # Return cleaned data in CSV
-# Input: None
-# Output: Cleans the data (removes duplicates, missing values, validates data), then saves cleaned data to CSV files
-def return_clean_csv():
-    # Call the data cleaning functions
-    validate_data()  # Validate data types and category values
-    drop_na()  # Remove rows with missing values
-    remove_duplicates()  # Remove duplicate records
-
-    # Save the cleaned data as CSV files
-    df_income.to_csv('cleaned_income.csv', index=False)
-    df_expense.to_csv('cleaned_expenses.csv', index=False)
-
-# Call the function to clean and save the data
-return_clean_csv()
+# Input: Output directory and whether to re-clean all history
+# Output: Cleans new income and expense rows, appends them to the CSV files and
+#         returns {table: (rows read, rows written)}
+def return_clean_csv(output_dir=".", full=False):
+    state_file = os.path.join(output_dir, STATE_FILE)
+    state = {}
+    if os.path.exists(state_file):
+        with open(state_file) as f:
+            state = json.load(f)
+
+    result, new_state = {}, {}
+    for table in CLEAN_SPECS:
+        new_state[table], read, written = clean_table(table, output_dir, state.get(table), full)
+        result[table] = (read, written)
+
+    # Saving the state commits the run; the hash index of the previous run is
+    # only removed afterwards, so an interrupted run resumes from the old state
+    with open(state_file + ".tmp", "w") as f:
+        json.dump(new_state, f)
+    os.replace(state_file + ".tmp", state_file)
+    for table in CLEAN_SPECS:
+        old_id = state.get(table, {}).get("last_id")
+        if old_id is not None and old_id != new_state[table]["last_id"]:
+            old_index = _index_file(output_dir, table, old_id)
+            if os.path.exists(old_index):
+                os.remove(old_index)
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Clean the income and expense tables into CSV files")
+    parser.add_argument("--full", action="store_true", help="Re-clean all history instead of only new rows")
+    parser.add_argument("--output-dir", default=".", help="Directory of the cleaned CSV files")
+    args = parser.parse_args()
+    for table, (read, written) in return_clean_csv(args.output_dir, args.full).items():
+        print(f"{table}: {read} new rows, {written} written after cleaning")
@@ -0,0 +1,253 @@
+import csv
+import os
+import re
+import threading
+import time
+from bisect import bisect_right
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from sqlalchemy import Column, Date, String, TypeDecorator
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from Storage import Base, create_tables, session_scope, to_money
+
+# Entries in foreign currencies, converted to the home currency when they are stored.
+# Expenses and income keep a single currency in the amount column, so the
+# monthly aggregates and budget reports never mix currencies; the original amount
+# and currency code are kept next to it. Exchange rates are loaded from a CSV
+# file (no network access) with `python Manage.py fx-load rates.csv`.
+# Override the home currency with the CURRENCYBUDGET environment variable.
+
+HOME_CURRENCY = os.getenv('CURRENCYBUDGET', 'USD').upper()
+
+# Seconds before cached rates are read again, so rates loaded by another process are picked up
+RATE_CACHE_TTL = 300
+
+# Rows upserted per statement when loading a rate file
+RATE_BATCH_SIZE = 5000
+
+# A currency code in a rate file, e.g. "EUR"
+CURRENCY_PATTERN = re.compile(r"^[A-Z]{3}$")
+
+# An amount optionally followed by a three-letter currency code, e.g. "12.50 EUR"
+AMOUNT_PATTERN = re.compile(r"^(\d+\.?\d*|\.\d+)(?:\s*([A-Za-z]{3}))?$")
+
+
+class Rate(TypeDecorator):
+    """Exchange rate stored as decimal text, so conversions use the exact rate from the file."""
+
+    impl = String
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else str(Decimal(str(value)))
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else Decimal(value)
+
+
+class FxRate(Base):
+    """
+    Exchange rate of one currency into the home currency, effective from a date.
+
+    A rate applies from its date until the next date loaded for the currency,
+    so files with one rate per business day (or per month) both work.
+
+    Attributes:
+        currency (str): Three-letter currency code, e.g. "EUR".
+        date (Date): First day the rate applies to.
+        rate (Decimal): Home currency units per unit of the currency.
+    """
+
+    __tablename__ = "fx_rates"
+
+    currency = Column("currency", String, primary_key=True)
+    date = Column("date", Date, primary_key=True)
+    rate = Column("rate", Rate, nullable=False)
+
+
+# Create the rates table in the shared database
+create_tables()
+
+
+class RateCache:
+    """
+    In-memory exchange rates, read from the fx_rates table once per currency.
+
+    Each currency's rates are kept as a sorted list of effective dates with the
+    rate of each date, so a day is mapped to the rate in force on it with one
+    binary search and no database query. Loading a rate file invalidates the
+    cache; rates loaded by another process are picked up after RATE_CACHE_TTL.
+
+    Attributes:
+        loads (int): Currencies read from the database.
+        lookups (int): Rates returned.
+    """
+
+    def __init__(self, ttl=RATE_CACHE_TTL):
+        self.ttl = ttl
+        self.loads = 0
+        self.lookups = 0
+        self._series = {}  # currency -> (loaded at, effective date ordinals, rates)
+        self._lock = threading.Lock()
+
+    def rate(self, currency, day):
+        """
+        Returns the rate of a currency in force on a day.
+
+        Args:
+            currency (str): Three-letter currency code.
+            day (date): Day of the entry.
+
+        Returns:
+            Decimal: Home currency units per unit; raises ValueError when no rate
+            is loaded for the currency on or before the day.
+        """
+        if currency == HOME_CURRENCY:
+            return Decimal(1)
+        _, days, rates = self._get_series(currency)
+        index = bisect_right(days, day.toordinal()) - 1
+        if index < 0:
+            raise ValueError(f"No exchange rate for {currency} on or before {day}. "
+                             "Load rates with: python Manage.py fx-load rates.csv")
+        self.lookups += 1
+        return rates[index]
+
+    def convert(self, amount, currency, day):
+        """
+        Converts an amount to the home currency at the rate in force on a day.
+
+        Args:
+            amount (Decimal, float or str): Amount in the given currency.
+            currency (str): Three-letter currency code.
+            day (date): Day of the entry.
+
+        Returns:
+            Decimal: The amount in the home currency, rounded to the cent.
+        """
+        return to_money(to_money(amount) * self.rate(currency, day))
+
+    def invalidate(self):
+        """Drops every cached currency; the next lookups read the table again."""
+        with self._lock:
+            self._series.clear()
+
+    def _get_series(self, currency):
+        with self._lock:
+            series = self._series.get(currency)
+            if series is None or time.monotonic() - series[0] > self.ttl:
+                with session_scope() as session:
+                    rows = session.query(FxRate.date, FxRate.rate).filter(
+                        FxRate.currency == currency
+                    ).order_by(FxRate.date).all()
+                series = (time.monotonic(), [day.toordinal() for day, _ in rows], [rate for _, rate in rows])
+                self._series[currency] = series
+                self.loads += 1
+            return series
+
+
+# Rate cache shared by every conversion in the process
+rates = RateCache()
+
+
+def parse_amount_currency(value):
+    """
+    Parses an entry amount with an optional currency code, such as "12.50" or "12.50 EUR".
+
+    Args:
+        value (str): Amount field of a /s or /e entry.
+
+    Returns:
+        tuple: The amount as a Decimal and the currency code, or None for the home currency.
+    """
+    match = AMOUNT_PATTERN.match(value.strip())
+    if match is None:
+        raise ValueError("Invalid amount!")
+    amount, currency = match.groups()
+    currency = currency.upper() if currency else None
+    return to_money(amount), None if currency == HOME_CURRENCY else currency
+
+
+def convert_entry(entry, currency):
+    """
+    Converts a new Expense or Income entry to the home currency in place.
+
+    Keeps the amount as entered in original_amount and the currency code in
+    currency; entries in the home currency are left unchanged.
+
+    Args:
+        entry (obj): Expense or Income whose amount is in the given currency.
+        currency (str): Three-letter currency code, or None for the home currency.
+    """
+    if currency is None or currency == HOME_CURRENCY:
+        return
+    entry.original_amount = entry.amount
+    entry.currency = currency
+    entry.amount = rates.convert(entry.amount, currency, entry.date)
+
+
+def format_original_amount(entry):
+    """
+    Returns the original amount of a converted entry for display, e.g. " (12.00 EUR)".
+
+    Args:
+        entry (obj): Expense or Income entry.
+
+    Returns:
+        str: The original amount and currency, or an empty string for home currency entries.
+    """
+    if not entry.currency:
+        return ""
+    return f" ({entry.original_amount:.2f} {entry.currency})"
+
+
+def load_fx_rates(stream, batch_size=RATE_BATCH_SIZE):
+    """
+    Loads exchange rates from a CSV file with date, currency and rate columns.
+
+    The rate is the number of home currency units per unit of the currency.
+    Rates already stored for the same currency and date are replaced. The file
+    is loaded in one transaction, so a malformed row leaves the stored rates unchanged.
+
+    Args:
+        stream (file): Text stream with a "date,currency,rate" header row.
+        batch_size (int, optional): Rows upserted per statement.
+
+    Returns:
+        int: Number of rates loaded; raises ValueError on a malformed row.
+    """
+    reader = csv.DictReader(stream)
+    header = {name.strip().lower() for name in reader.fieldnames or []}
+    if not {"date", "currency", "rate"} <= header:
+        raise ValueError("Rate file needs a date, currency and rate column")
+
+    loaded, batch = 0, []
+    with session_scope() as session:
+        for line, row in enumerate(reader, start=2):
+            # A short row has None for its missing fields
+            row = {name.strip().lower(): (value or "").strip() for name, value in row.items() if name}
+            try:
+                currency = row["currency"].upper()
+                if not CURRENCY_PATTERN.match(currency):
+                    raise ValueError
+                rate = Decimal(row["rate"])
+                if not rate.is_finite() or rate <= 0:
+                    raise ValueError
+                batch.append({"currency": currency, "date": date.fromisoformat(row["date"]), "rate": rate})
+            except (InvalidOperation, ValueError):
+                raise ValueError(f"Line {line}: invalid rate row {row}")
+            if len(batch) >= batch_size:
+                loaded += _store_rates(session, batch)
+                batch = []
+        loaded += _store_rates(session, batch)
+    rates.invalidate()
+    return loaded
+
+
+def _store_rates(session, batch):
+    if not batch:
+        return 0
+    statement = sqlite_insert(FxRate)
+    statement = statement.on_conflict_do_update(
+        index_elements=["currency", "date"], set_={"rate": statement.excluded.rate})
+    session.execute(statement, batch)
+    return len(batch)
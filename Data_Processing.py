@@ -1,143 +1,277 @@
-import os
-from Expense import Expense
+from Expense import Expense, MonthlyExpense
 from Income import Income
 from Budget import Budget, get_budget
-from sqlalchemy import create_engine, ForeignKey, Column, String, Integer, CHAR, Float, Date, func
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import date, datetime
-from Budget import Budget, get_budget
+from Categories import get_categories
+from Tags import TAG_SEPARATOR, ExpenseTag, Tag, tag_ancestors, tag_subtree_filter
+from sqlalchemy import bindparam, func, literal, literal_column, null, select, type_coerce, union_all
+from collections import namedtuple
+from datetime import date, timedelta
+from decimal import Decimal
+from Storage import Money, month_key, session_scope
 import numpy as np
 
-Base = declarative_base()
-engine = create_engine('sqlite:///expenses.db', echo=True)
-Base.metadata.create_all(bind=engine)
-Session = sessionmaker(bind=engine)
-session = Session()
+# Zero amount, with the two decimal places of money values
+ZERO = Decimal("0.00")
+
+# Numeric and flag columns of a category table; the width of the category code column
+# is set per table from the longest code
+CATEGORY_FIELDS = [
+    ("budget", "f8"),
+    ("spent", "f8"),
+    ("remaining", "f8"),
+    ("percentage_spent", "f8"),
+    ("overspent", "f8"),
+    ("budgeted", "?"),
+    ("recorded", "?"),
+]
+
+# One row of a category table as plain Python values
+CategoryLine = namedtuple("CategoryLine", ["category"] + [name for name, _ in CATEGORY_FIELDS])
+
+
+"""
+    Builds the per-category table of a month as a NumPy record array.
+
+    Remaining budget, percentage spent and overspend are computed on whole float64
+    columns. Each column is a native array (e.g. table.spent) and each row a record
+    with attribute access (e.g. table[0].budget).
+
+    Args:
+        categories (list): Category codes.
+        budget (list): Budget of each category, 0 when none is set.
+        spent (list): Amount spent in each category.
+        budgeted (list): Whether each category has a budget entry.
+        recorded (list): Whether each category has expenses in the month.
+
+    Returns:
+        np.recarray: One record per category with the fields category and CATEGORY_FIELDS.
+"""
+def category_table(categories, budget, spent, budgeted, recorded):
+    """Returns a record array of budget, spent, remaining, percentage and overspend per category."""
+    codes = np.asarray(categories, dtype=str)
+    table = np.recarray(len(codes), dtype=[("category", codes.dtype)] + CATEGORY_FIELDS)
+    table.category = codes
+    table.budget = budget
+    table.spent = spent
+    table.budgeted = budgeted
+    table.recorded = recorded
+
+    table.remaining = table.budget - table.spent
+    # Percentage spent is 0 for categories without a budget
+    table.percentage_spent = 0
+    np.divide(table.spent * 100, table.budget, out=table.percentage_spent, where=table.budget > 0)
+    np.maximum(table.spent - table.budget, 0, out=table.overspent)
+    return table
 
-category_dict = {
-            "G" : "Groceries",
-            "B" : "Bill and Housing",
-            "F" : "Fun (Shopping and Eating out)",
-            "W" : "Wellness (Education and Health)",
-            "M" : "Miscellaneous"
-        }
+
+"""
+    Returns the rows of a category table as named tuples of plain Python values.
+
+    Reading fields of single NumPy records is slow; reports that format one line
+    per category (hundreds for some chats) iterate over these instead.
+
+    Args:
+        table (np.recarray): A category_table(), or a selection of its rows.
+
+    Returns:
+        list: One CategoryLine per row, with the same field names.
+"""
+def category_lines(table):
+    """Returns the rows of a category table as CategoryLine tuples."""
+    return list(map(CategoryLine._make, table.tolist()))
+
+
+class MonthSnapshot:
+    """
+    Budget and spending of one chat in one month, per category and in total.
+
+    Built by month_snapshot() from a single grouped query, so every report about
+    the month (the bot's text summaries and the dashboard figures) can be
+    rendered from one read.
+
+    Attributes:
+        chat_id (int): Telegram chat the snapshot belongs to.
+        month (str): Month key in "YYYY-MM" format.
+        categories (np.recarray): category_table() of every category with a budget
+            or expenses: budgeted categories in the order they were set, then the rest.
+        budget (Decimal): Total monthly budget.
+        spent (Decimal): Total spent in the month, in every category.
+        remaining (Decimal): Total budget left, negative when overspent.
+        percentage_spent (float): Share of the total budget spent, in percent.
+        overspent (Decimal): Amount spent beyond the total budget, 0 when within it.
+    """
+
+    def __init__(self, chat_id, month, categories, budget, spent):
+        self.chat_id = chat_id
+        self.month = month
+        self.categories = categories
+        self.budget = budget
+        self.spent = spent
+        self.remaining = budget - spent
+        self.percentage_spent = float(spent / budget) * 100 if budget > 0 else 0
+        self.overspent = spent - budget if spent > budget else ZERO
+
+    def category(self, category):
+        """Returns the record of a category, with zero budget and spending when absent."""
+        matches = self.categories[self.categories.category == category]
+        if len(matches):
+            return matches[0]
+        return category_table([category], [0.0], [0.0], [False], [False])[0]
+
+    def budgeted(self):
+        """Returns the records of the categories with a budget entry, in the order they were set."""
+        return self.categories[self.categories.budgeted]
+
+    def recorded(self):
+        """Returns the records of the categories with expenses in the month."""
+        return self.categories[self.categories.recorded]
+
+
+# Budget and month's spending per category of one chat, as one grouped query.
+# The chat's budget rows and the month's rows of the monthly aggregate table are
+# combined with UNION ALL; built once, with the chat and month as bound parameters.
+_budget_rows = select(
+    Budget.category.label("category"),
+    Budget.amount.label("budget"),
+    type_coerce(literal_column("0"), Money).label("spent"),
+    Budget.id.label("position"),
+    literal_column("0").label("recorded")
+).where(Budget.chat_id == bindparam("chat_id"))
+_spent_rows = select(
+    MonthlyExpense.category,
+    literal_column("0"),
+    MonthlyExpense.total,
+    null(),
+    literal_column("1")
+).where(
+    MonthlyExpense.chat_id == bindparam("chat_id"),
+    MonthlyExpense.month == bindparam("month")
+)
+_snapshot_rows = union_all(_budget_rows, _spent_rows).subquery()
+_snapshot_position = func.min(_snapshot_rows.c.position)
+MONTH_SNAPSHOT_QUERY = select(
+    _snapshot_rows.c.category,
+    func.sum(_snapshot_rows.c.budget),
+    func.sum(_snapshot_rows.c.spent),
+    func.count(_snapshot_rows.c.position),
+    func.max(_snapshot_rows.c.recorded)
+).group_by(_snapshot_rows.c.category).order_by(
+    _snapshot_position.is_(None), _snapshot_position, _snapshot_rows.c.category)
+
+
+"""
+    Reads the budget and the month's spending of every category in one grouped query.
+
+    Args:
+        chat_id (int): Telegram chat whose budget and spending are read.
+        month (str, optional): Month key in "YYYY-MM" format. Defaults to the current month.
+
+    Returns:
+        MonthSnapshot: Budget, spent, remaining, percentage and overspend per category and in total.
+"""
+def month_snapshot(chat_id, month=None):
+    """Returns the MonthSnapshot of a chat and month, read with MONTH_SNAPSHOT_QUERY."""
+    month = month or month_key(date.today())
+    with session_scope() as session:
+        results = session.execute(MONTH_SNAPSHOT_QUERY, {"chat_id": chat_id, "month": month}).all()
+
+    categories, budget, spent, budgeted, recorded = zip(*results) if results else ([],) * 5
+    table = category_table(categories, budget, spent, np.array(budgeted) > 0, np.array(recorded) > 0)
+    # The totals are summed from the exact Decimal amounts, not the float64 columns
+    return MonthSnapshot(chat_id, month, table, sum(budget, ZERO), sum(spent, ZERO))
 
 
 """
     Generates a message about the remaining budget for a specific category and the overall budget.
     
     Args:
+        chat_id (int): The Telegram chat whose budget is checked.
         category (str): The category for which the remaining budget is being checked (e.g., "G" for Groceries).
 
     Returns:
         tuple: A string message with the remaining budget information and an array of budget data.
 """
-def get_budget_message(category):
+def get_budget_message(chat_id, category):
     """Generates a message about the remaining budget for a category and total budget, and returns data in an array."""
-    
-    # Retrieve the budget dictionary and total budget from the get_budget function
-    budget_dict, budget_total = get_budget()
-    
-    # Get the budget value for the specified category if it exists in the budget dictionary
-    if category in budget_dict:
-        budget_value = budget_dict[category]
-    
-    # Query the database to get the total amount spent in the current month for the specified category
-    sort_by_category = session.query(
-        func.sum(Expense.amount).label('total_amount')
-    ).filter(
-        func.strftime("%Y-%m", Expense.date) == datetime.now().strftime("%Y-%m"),
-        Expense.category == category
-    ).all()
-    
-    # Retrieve the total amount spent for the specified category, default to 0 if None
-    recorded_by_category = sort_by_category[0][0] if sort_by_category[0][0] is not None else 0
-    
-    # Query the database to get the total amount spent in the current month for all categories
-    total_budget = session.query(
-        func.sum(Expense.amount).label('total_amount')
-    ).filter(
-        func.strftime("%Y-%m", Expense.date) == datetime.now().strftime("%Y-%m"),
-    ).all()
-    
-    # Retrieve the total amount spent, default to 0 if None
-    recorded_total = total_budget[0][0] if total_budget[0][0] is not None else 0
-    
-    # Calculate the remaining budget for the specified category and the total budget
-    category_diff = budget_value - (recorded_by_category)
-    total_diff = budget_total - (recorded_total)
-    
+    snapshot = month_snapshot(chat_id)
+    line = snapshot.category(category)
+
     # Create the return message string with the remaining budget information
-    return_str = f"Category Budget Remaining: {category_diff}\nTotal Budget Remaining: {total_diff}"
+    return_str = f"Category Budget Remaining: {line.remaining:.2f}\nTotal Budget Remaining: {snapshot.remaining:.2f}"
     
     # Add the array for the budget data
     array_data = np.array([[
-        budget_value, 
-        recorded_by_category, 
-        category_diff, 
-        budget_total, 
-        recorded_total, 
-        total_diff
-    ]])
+        line.budget,
+        line.spent,
+        line.remaining,
+        snapshot.budget,
+        snapshot.spent,
+        snapshot.remaining
+    ]], dtype=np.float64)
     
     return return_str, array_data
 
 
+"""
+    Generates one message with the budget impact of a batch of new expenses.
+
+    Args:
+        chat_id (int): The Telegram chat whose budget is checked.
+        expenses (list): Expense objects just recorded for the chat.
+
+    Returns:
+        str: The amount added and the budget remaining for each category in the
+             batch, followed by the total budget remaining.
+"""
+def get_budget_delta_message(chat_id, expenses):
+    """Summarizes how a batch of expenses changed the remaining budget, with one snapshot read."""
+    # Amount added by this batch per category, in the order the categories first appear
+    added_by_category = {}
+    for expense in expenses:
+        added_by_category[expense.category] = added_by_category.get(expense.category, 0) + expense.amount
+
+    snapshot = month_snapshot(chat_id)
+    categories = get_categories(chat_id)
+
+    return_str = ""
+    for category, added in added_by_category.items():
+        remaining = snapshot.category(category).remaining
+        return_str += f"{categories.name(category)}: -${added:.2f}, Budget Remaining: ${remaining:.2f}\n"
+
+    return_str += f"Total Budget Remaining: ${snapshot.remaining:.2f}"
+    return return_str
+
+
 """
     Checks the remaining budget by category and overall, and returns a summary of the budget status.
 
+    Args:
+        chat_id (int): The Telegram chat whose budget is checked.
+        snapshot (MonthSnapshot, optional): Snapshot of the current month to render
+            instead of reading a new one.
+
     Returns:
         tuple: A summary string with budget information for each category and the overall budget,
-               and an array of data containing the budget details by category.
+               and a record array with the category, budget, spent and remaining amount of each category.
 """
-def check_budget():
+def check_budget(chat_id, snapshot=None):
     """Checks the remaining budget by category and total, and returns data in an array."""
-    # Retrieve the budget dictionary and total budget from the get_budget function
-    budget_dict, budget_total = get_budget()
-
-    # Query the database to get the total amount spent in the current month grouped by category
-    results = session.query(
-        Expense.category,
-        func.sum(Expense.amount).label('total_amount')
-    ).filter(
-        func.strftime("%Y-%m", Expense.date) == datetime.now().strftime("%Y-%m")
-    ).group_by(
-        Expense.category
-    ).all()
-
-    # Create a dictionary of total amounts spent by category
-    totals_by_category = {category: total_amount for category, total_amount in results}
-
-    # Query the database to get the total amount spent in the current month
-    total_budget = session.query(
-        func.sum(Expense.amount).label('total_amount')
-    ).filter(
-        func.strftime("%Y-%m", Expense.date) == datetime.now().strftime("%Y-%m")
-    ).all()
-
-    # Retrieve the total amount spent in the current month
-    recorded_total = total_budget[0][0] if total_budget[0][0] is not None else 0
-
-    # Initialize the summary string and a list to hold category data
+    snapshot = snapshot or month_snapshot(chat_id)
+
+    # Initialize the summary string with the categories that have expenses this month
     summary_str = "Monthly Expense Summary by Category:\n"
-    category_data = []
-
-    # Iterate through the summary results and calculate the remaining budget for each category
-    for category, total_amount in totals_by_category.items():
-        recorded_amount = totals_by_category.get(category, 0)
-        remaining_budget_category = budget_dict.get(category, 0) - recorded_amount
-        summary_str += f"Category: {category_dict.get(category, 'Unknown')}, Remaining Total: ${remaining_budget_category:.2f}\n"
-        
-        # Append the category data to the list
-        category_data.append([category, budget_dict.get(category, 0), recorded_amount, remaining_budget_category])
-
-    # Calculate the total remaining budget
-    total_remaining = budget_total - recorded_total
-    summary_str += f"\nTotal Budget Remaining: ${total_remaining:.2f}"
-
-    # Convert the category data list to a NumPy array
-    category_data_array = np.array(category_data, dtype=object)
+    recorded = snapshot.recorded()
+    categories = get_categories(chat_id)
+
+    # The remaining budget of every category with expenses this month
+    for line in category_lines(recorded):
+        summary_str += f"Category: {categories.name(line.category)}, Remaining Total: ${line.remaining:.2f}\n"
+
+    # Add the total remaining budget
+    summary_str += f"\nTotal Budget Remaining: ${snapshot.remaining:.2f}"
+
+    # The category, budget, spent and remaining columns of the record array
+    category_data_array = recorded[["category", "budget", "spent", "remaining"]]
     
     return summary_str, category_data_array
 
@@ -145,109 +279,412 @@ def check_budget():
 """
     Compares the overall spending for the month with the total budget and checks for overspending.
 
+    Args:
+        chat_id (int): The Telegram chat whose spending is compared.
+        month (str, optional): Month key in "YYYY-MM" format. Defaults to the current month.
+        snapshot (MonthSnapshot, optional): Snapshot of the month to render instead of reading a new one.
+
     Returns:
         tuple: A string with the overall budget vs spending comparison message, 
                and an array of data with total budget, total spent, and overspending details.
 """
-def overall_spending_vs_budget():
+def overall_spending_vs_budget(chat_id, month=None, snapshot=None):
     """Compares overall spending with the allocated budget and handles overspending."""
-    # Retrieve the budget dictionary and total budget from the get_budget function
-    budget_dict, budget_total = get_budget()
-
-    # Query the database to get the total amount spent in the current month
-    total_budget_spent = session.query(
-        func.sum(Expense.amount).label('total_amount')
-    ).filter(
-        func.strftime("%Y-%m", Expense.date) == datetime.now().strftime("%Y-%m")
-    ).all()
-
-    # Retrieve the total amount spent, default to 0 if None
-    total_spent = total_budget_spent[0][0] if total_budget_spent[0][0] is not None else 0
-
-    # Calculate the overall budget vs spending percentage
-    if budget_total > 0:
-        overall_percentage_spent = (total_spent / budget_total) * 100
-    else:
-        overall_percentage_spent = 0
+    snapshot = snapshot or month_snapshot(chat_id, month)
 
     # Check for overspending
-    if total_spent > budget_total:
-        overspent_amount = total_spent - budget_total
-        overspent_str = f"OVERSPENT! You have overspent by: ${overspent_amount:.2f}\n"
+    if snapshot.overspent:
+        overspent_str = f"OVERSPENT! You have overspent by: ${snapshot.overspent:.2f}\n"
     else:
         overspent_str = "You are within the budget.\n"
 
     # Create the message string for overall spending
-    overall_comparison_str = f"Overall Budget: ${budget_total:.2f}\n"
-    overall_comparison_str += f"Total Spent: ${total_spent:.2f}\n"
-    overall_comparison_str += f"Percentage of Budget Spent: {overall_percentage_spent:.2f}%\n"
+    overall_comparison_str = f"Overall Budget: ${snapshot.budget:.2f}\n"
+    overall_comparison_str += f"Total Spent: ${snapshot.spent:.2f}\n"
+    overall_comparison_str += f"Percentage of Budget Spent: {snapshot.percentage_spent:.2f}%\n"
     overall_comparison_str += overspent_str
 
     # Return both the message and the array of data
-    overall_data = np.array([[budget_total, total_spent, overall_percentage_spent, overspent_amount if total_spent > budget_total else 0]])
+    overall_data = np.array([[snapshot.budget, snapshot.spent, snapshot.percentage_spent, snapshot.overspent]], dtype=np.float64)
     return overall_comparison_str, overall_data
 
 
 """
     Compares spending by category with the allocated budget for each category and handles overspending.
 
+    Args:
+        chat_id (int): The Telegram chat whose spending is compared.
+        month (str, optional): Month key in "YYYY-MM" format. Defaults to the current month.
+        snapshot (MonthSnapshot, optional): Snapshot of the month to render instead of reading a new one.
+
     Returns:
-        tuple: A message with spending vs budget details for each category, and an array with category-wise data.
+        tuple: A message with spending vs budget details for each category, and a record array with
+               the category, budget, spent, percentage spent and overspend of each budgeted category.
 """
-def category_spending_vs_budget():
+def category_spending_vs_budget(chat_id, month=None, snapshot=None):
     """Compares spending by category with the allocated budget and includes all budgeted categories."""
-    # Retrieve the budget dictionary and total budget from the get_budget function
-    budget_dict, budget_total = get_budget()
-
-    # Query the database to get the total amount spent in the current month by category
-    category_spent_query = session.query(
-        Expense.category,
-        func.sum(Expense.amount).label('total_amount')
-    ).filter(
-        func.strftime("%Y-%m", Expense.date) == datetime.now().strftime("%Y-%m")
-    ).group_by(
-        Expense.category
-    ).all()
-
-    # Convert the query result to a dictionary for easier lookups
-    category_spent = {category: total_spent for category, total_spent in category_spent_query}
-
-    # Initialize the message string and a list to store category data
+    snapshot = snapshot or month_snapshot(chat_id, month)
+
+    # Initialize the message string with the categories in the budget
     category_comparison_str = "Category Spending vs Budget:\n"
-    category_data = []
+    budgeted = snapshot.budgeted()
+    categories = get_categories(chat_id)
 
     # Iterate over all categories in the budget
-    for category, budget_for_category in budget_dict.items():
-        # Retrieve the total spent for this category (default to 0 if not in category_spent)
-        total_spent = category_spent.get(category, 0)
-
-        # Calculate the percentage spent for the current category
-        percentage_spent = (total_spent / budget_for_category) * 100 if budget_for_category > 0 else 0
-
+    for line in category_lines(budgeted):
         # Check if the category is overspent
-        if total_spent > budget_for_category:
-            overspent_amount = total_spent - budget_for_category
-            overspent_str = f"OVERSPENT! You have overspent by: ${overspent_amount:.2f}\n"
+        if line.overspent:
+            overspent_str = f"OVERSPENT! You have overspent by: ${line.overspent:.2f}\n"
         else:
-            overspent_amount = 0
             overspent_str = "You are within the budget for this category.\n"
 
         # Add category comparison information to the string
-        category_comparison_str += f"Category: {category_dict.get(category, 'Unknown')}\n"
-        category_comparison_str += f"Budgeted: ${budget_for_category:.2f}\n"
-        category_comparison_str += f"Spent: ${total_spent:.2f}\n"
-        category_comparison_str += f"Percentage of Budget Spent: {percentage_spent:.2f}%\n"
+        category_comparison_str += f"Category: {categories.name(line.category)}\n"
+        category_comparison_str += f"Budgeted: ${line.budget:.2f}\n"
+        category_comparison_str += f"Spent: ${line.spent:.2f}\n"
+        category_comparison_str += f"Percentage of Budget Spent: {line.percentage_spent:.2f}%\n"
         category_comparison_str += overspent_str + "\n"
 
-        # Store the data in a list for output
-        category_data.append([
-            category, 
-            budget_for_category, 
-            total_spent, 
-            percentage_spent, 
-            overspent_amount
-        ])
-
-    # Convert the list to a NumPy array for the category data
-    category_data_array = np.array(category_data, dtype=object)
+    # The category, budget, spent, percentage and overspend columns of the record array
+    category_data_array = budgeted[["category", "budget", "spent", "percentage_spent", "overspent"]]
     return category_comparison_str, category_data_array
+
+
+"""
+    Sums the spending of a category and every category below it over a period.
+
+    The subtree's codes come from the chat's cached category paths, so the sums
+    are one grouped query through the (chat_id, category, date) index, or
+    through the monthly aggregate table when the period is made of whole months.
+
+    Args:
+        chat_id (int): The Telegram chat whose spending is summed.
+        code (str): Upper-case code of the top category of the subtree.
+        start (date): First day of the period.
+        end (date): Day after the last day of the period.
+
+    Returns:
+        dict: Maps each category of the subtree with expenses in the period to a (total, count) tuple.
+"""
+def category_subtree_spending(chat_id, code, start, end):
+    """Returns (total, count) per category of a subtree over a half-open date range."""
+    codes = get_categories(chat_id).subtree(code)
+    with session_scope() as session:
+        if start.day == 1 and end.day == 1 and start != date.min:
+            rows = session.query(
+                MonthlyExpense.category,
+                func.sum(MonthlyExpense.total),
+                func.sum(MonthlyExpense.count)
+            ).filter(
+                MonthlyExpense.chat_id == chat_id,
+                MonthlyExpense.month >= month_key(start),
+                MonthlyExpense.month < month_key(end),
+                MonthlyExpense.category.in_(codes)
+            ).group_by(MonthlyExpense.category).all()
+        else:
+            rows = session.query(
+                Expense.category,
+                func.sum(Expense.amount),
+                func.count(Expense.id)
+            ).filter(
+                Expense.chat_id == chat_id,
+                Expense.category.in_(codes),
+                Expense.date >= start,
+                Expense.date < end
+            ).group_by(Expense.category).all()
+    return {category: (total, count) for category, total, count in rows}
+
+
+"""
+    Formats the spending of a category subtree for the /category_sum command.
+
+    Args:
+        chat_id (int): The Telegram chat whose spending is shown.
+        code (str): Upper-case code of the top category of the subtree.
+        label (str): The period, e.g. "2024-03".
+        spending (dict): Result of category_subtree_spending().
+
+    Returns:
+        str: The subtree's total followed by the total of the category itself and of
+             each category directly below it.
+"""
+def format_category_spending(chat_id, code, label, spending):
+    """Formats a category subtree's total with one line per direct subcategory."""
+    categories = get_categories(chat_id)
+    rolled = categories.rollup({category: total for category, (total, _) in spending.items()})
+    count = sum(count for _, count in spending.values())
+    lines = [f"{categories.name(code)} in {label}: ${rolled.get(code, ZERO):.2f} over {count} expenses"]
+    if categories.children.get(code):
+        own = spending.get(code, (ZERO, 0))[0]
+        lines.append(f"  {categories.name(code)} itself: ${own:.2f}")
+        for child in categories.children[code]:
+            lines.append(f"  {categories.name(child)}: ${rolled.get(child, ZERO):.2f}")
+    return "\n".join(lines)
+
+
+"""
+    Sums the spending tagged with a tag, or with a tag nested below it, over a period.
+
+    The tagged expenses are read through the tag links: a range of the
+    (chat_id, name) tag index selects the tags and a (tag, date) range of the
+    expense_tags primary key their expenses in the period, so no expense
+    reason is scanned. An expense with several matching tags is counted once.
+
+    Args:
+        chat_id (int): The Telegram chat whose spending is summed.
+        tag (str): Lower-case tag name, e.g. "travel".
+        start (date): First day of the period.
+        end (date): Day after the last day of the period.
+
+    Returns:
+        dict: Maps each category with tagged expenses in the period to a (total, count) tuple.
+"""
+def tag_spending(chat_id, tag, start, end):
+    """Returns (total, count) per category of the expenses with a tag over a half-open date range."""
+    tagged = select(ExpenseTag.expense_id).join(Tag, Tag.id == ExpenseTag.tag_id).where(
+        tag_subtree_filter(chat_id, tag),
+        ExpenseTag.date >= start,
+        ExpenseTag.date < end)
+    with session_scope() as session:
+        rows = session.query(
+            Expense.category,
+            func.sum(Expense.amount),
+            func.count(Expense.id)
+        ).filter(
+            Expense.id.in_(tagged),
+            Expense.chat_id == chat_id
+        ).group_by(Expense.category).all()
+    return {category: (total, count) for category, total, count in rows}
+
+
+"""
+    Sums the spending of every tag of a chat over a period, nested tags included in their parents.
+
+    Reads the period's links of every tag of the chat with their expenses, then adds
+    the expense to each tag it carries and every tag those are nested in,
+    counting it once per tag even when several of its tags share a parent.
+
+    Args:
+        chat_id (int): The Telegram chat whose spending is summed.
+        start (date): First day of the period.
+        end (date): Day after the last day of the period.
+
+    Returns:
+        list: (tag, total, count) tuples sorted by tag, so nested tags follow their parent.
+"""
+def tag_totals(chat_id, start, end):
+    """Returns the rolled-up total and count of every tag used in a half-open date range."""
+    with session_scope() as session:
+        rows = session.query(Expense.id, Expense.amount, Tag.name).select_from(Tag).join(
+            ExpenseTag, ExpenseTag.tag_id == Tag.id
+        ).join(
+            Expense, Expense.id == ExpenseTag.expense_id
+        ).filter(
+            Tag.chat_id == chat_id,
+            ExpenseTag.date >= start,
+            ExpenseTag.date < end
+        ).all()
+
+    # Every tag an expense counts towards, including the parents of its nested tags
+    expenses = {}
+    for expense_id, amount, name in rows:
+        entry = expenses.setdefault(expense_id, (amount, set()))
+        entry[1].update(tag_ancestors(name))
+
+    totals = {}
+    for amount, names in expenses.values():
+        for name in names:
+            total, count = totals.get(name, (ZERO, 0))
+            totals[name] = (total + amount, count + 1)
+    return [(name, total, count) for name, (total, count) in sorted(totals.items())]
+
+
+"""
+    Formats the tag spending of a period for the /tag_sum command.
+
+    Args:
+        chat_id (int): The Telegram chat whose spending is shown.
+        label (str): The period, e.g. "2024-03".
+        tag (str, optional): Tag whose spending is broken down by category; every tag when None.
+        spending (dict or list): Result of tag_spending() for a tag, or of tag_totals().
+
+    Returns:
+        str: The tag's total with one line per category, or one line per tag with
+             nested tags indented below their parent.
+"""
+def format_tag_spending(chat_id, label, tag, spending):
+    """Formats one tag's spending by category, or every tag's total."""
+    if tag is None:
+        if not spending:
+            return f"No tagged expenses in {label}. Add #tags to the reason or note of an expense."
+        lines = [f"Spending by tag in {label}:"]
+        for name, total, count in spending:
+            lines.append("  " * name.count(TAG_SEPARATOR) + f"#{name}: ${total:.2f} ({count})")
+        return "\n".join(lines)
+
+    categories = get_categories(chat_id)
+    total = sum((total for total, _ in spending.values()), ZERO)
+    count = sum(count for _, count in spending.values())
+    lines = [f"#{tag} in {label}: ${total:.2f} over {count} expenses"]
+    for category, (category_total, _) in sorted(spending.items(), key=lambda item: item[1][0], reverse=True):
+        lines.append(f"  {categories.name(category)}: ${category_total:.2f}")
+    return "\n".join(lines)
+
+
+# Series name of income in the trend query results (category codes are upper case)
+INCOME_SERIES = "income"
+
+# Longest ranges shown with daily and weekly buckets; longer ranges use months
+DAILY_RANGE_DAYS = 62
+WEEKLY_RANGE_DAYS = 366
+
+
+"""
+    Lists the months of a chat that have expenses, newest first.
+
+    Args:
+        chat_id (int): The Telegram chat whose months are listed.
+
+    Returns:
+        list: Month keys in "YYYY-MM" format.
+"""
+def get_expense_months(chat_id):
+    """Returns the month keys with expenses for a chat, read from the monthly aggregate table."""
+    with session_scope() as session:
+        rows = session.query(MonthlyExpense.month).filter(
+            MonthlyExpense.chat_id == chat_id
+        ).distinct().order_by(MonthlyExpense.month.desc()).all()
+    return [month for month, in rows]
+
+
+"""
+    Splits a date range into day, week or month buckets depending on its length.
+
+    Args:
+        start (date): First day of the range.
+        end (date): Last day of the range (inclusive).
+
+    Returns:
+        tuple: The granularity ("day", "week" or "month"), the bucket keys in order
+               and the number of days in each bucket.
+"""
+def trend_buckets(start, end):
+    """Returns (granularity, bucket keys, days per bucket) covering a date range."""
+    days = (end - start).days + 1
+    if days <= DAILY_RANGE_DAYS:
+        keys = [(start + timedelta(days=offset)).isoformat() for offset in range(days)]
+        return "day", keys, [1] * days
+
+    if days <= WEEKLY_RANGE_DAYS:
+        # Weeks start on Monday, like SQLite's date(day, '-6 days', 'weekday 1')
+        monday = start - timedelta(days=start.weekday())
+        keys = []
+        while monday <= end:
+            keys.append(monday.isoformat())
+            monday += timedelta(days=7)
+        return "week", keys, [7] * len(keys)
+
+    keys, lengths = [], []
+    month_start = start.replace(day=1)
+    while month_start <= end:
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        keys.append(month_key(month_start))
+        lengths.append((next_month - month_start).days)
+        month_start = next_month
+    return "month", keys, lengths
+
+
+"""
+    Computes spending per category, income and budget adherence over a date range.
+
+    All expense and income totals of the range come from one grouped query
+    (a UNION ALL of the expense and income aggregates). Ranges longer than a
+    year are bucketed by month and read from the monthly aggregate table.
+
+    Args:
+        chat_id (int): The Telegram chat whose history is read.
+        start (date): First day of the range.
+        end (date): Last day of the range (inclusive).
+
+    Returns:
+        dict: The granularity, the bucket keys, spending per category per bucket,
+              total spending, income and the percentage of the pro-rated budget
+              spent per bucket, and the monthly budget total.
+"""
+def spending_trends(chat_id, start, end):
+    """Returns per-bucket category spending, income and budget adherence for a date range."""
+    granularity, buckets, bucket_days = trend_buckets(start, end)
+
+    if granularity == "month":
+        first_day = start.replace(day=1)
+        stop = (end.replace(day=1) + timedelta(days=32)).replace(day=1)
+        expense_query = select(
+            MonthlyExpense.month.label("bucket"),
+            MonthlyExpense.category.label("series"),
+            MonthlyExpense.total.label("total")
+        ).where(
+            MonthlyExpense.chat_id == chat_id,
+            MonthlyExpense.month >= buckets[0],
+            MonthlyExpense.month <= buckets[-1]
+        )
+        income_bucket = func.strftime("%Y-%m", Income.date)
+    else:
+        first_day, stop = start, end + timedelta(days=1)
+        expense_bucket = Expense.date if granularity == "day" else func.date(Expense.date, "-6 days", "weekday 1")
+        expense_query = select(
+            expense_bucket.label("bucket"),
+            Expense.category.label("series"),
+            func.sum(Expense.amount).label("total")
+        ).where(
+            Expense.chat_id == chat_id,
+            Expense.date >= first_day,
+            Expense.date < stop
+        ).group_by(expense_bucket, Expense.category)
+        income_bucket = Income.date if granularity == "day" else func.date(Income.date, "-6 days", "weekday 1")
+
+    income_query = select(
+        income_bucket.label("bucket"),
+        literal(INCOME_SERIES).label("series"),
+        func.sum(Income.amount).label("total")
+    ).where(
+        Income.chat_id == chat_id,
+        Income.date >= first_day,
+        Income.date < stop
+    ).group_by(income_bucket)
+
+    with session_scope() as session:
+        _, budget_total = get_budget(chat_id)
+        rows = session.execute(union_all(expense_query, income_query)).all()
+
+    # The series are plotted; exact Decimal sums are converted once here
+    budget_total = float(budget_total)
+
+    position = {bucket: index for index, bucket in enumerate(buckets)}
+    by_category = {}
+    income = [0.0] * len(buckets)
+    for bucket, series, total in rows:
+        index = position.get(str(bucket))
+        if index is None:
+            continue
+        if series == INCOME_SERIES:
+            income[index] += float(total)
+        else:
+            by_category.setdefault(series, [0.0] * len(buckets))[index] += float(total)
+
+    spent = [sum(values) for values in zip(*by_category.values())] or [0.0] * len(buckets)
+
+    # The budget is monthly; pro-rate it to each bucket's length (an average month is 365/12 days)
+    adherence = [
+        (total / (budget_total * days * 12 / 365)) * 100 if budget_total > 0 else 0
+        for total, days in zip(spent, bucket_days)
+    ]
+
+    return {
+        "granularity": granularity,
+        "buckets": buckets,
+        "by_category": by_category,
+        "spent": spent,
+        "income": income,
+        "adherence": adherence,
+        "budget_total": budget_total,
+    }
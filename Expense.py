@@ -1,10 +1,12 @@
-from sqlalchemy import create_engine, ForeignKey, Column, String, Integer, CHAR, Float, Date, func
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import date, datetime
-from Budget import Budget, get_budget
+from sqlalchemy import Column, String, Integer, BigInteger, Date, Index, func, or_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import date
+from Categories import get_categories
+from Currency import convert_entry, format_original_amount, parse_amount_currency
+from Storage import (PAGE_SIZE, Base, Money, after_commit, bump_data_version, create_tables, keyset_page, month_key,
+                     month_window, session_scope, to_money)
+from Tags import delete_expense_tags, parse_tags, store_expense_tags
 
-Base = declarative_base()
 expense_file = "exported_expenses.csv"
 
 class Expense(Base):
@@ -13,11 +15,17 @@ class Expense(Base):
 
     Attributes:
         id (int): Unique identifier for the expense.
+        chat_id (int): Telegram chat that owns the expense.
         date (Date): Date of the expense.
-        category (char): Category of the expense (G, B, F, W, M).
+        category (str): Code of one of the chat's categories (see Categories.py).
         reason (str): Reason for the expense.
-        amount (float): Amount of the expense.
+        amount (Decimal): Amount of the expense in the home currency, stored as integer cents.
         note (str): Optional note for the expense.
+        currency (str): Currency the expense was entered in; None for the home currency.
+        original_amount (Decimal): Amount as entered, for expenses in another currency.
+        content_hash (str): Hash of an imported statement row, used to skip duplicates.
+        tag_names (list): Hashtags of a new expense's reason and note, stored in
+            expense_tags by add_expenses (see Tags.py); empty on loaded rows.
 
     Methods:
         __init__: Initializes an Expense object.
@@ -27,30 +35,50 @@ class Expense(Base):
     """
     
     __tablename__ = "expenses"
+    __table_args__ = (
+        # Serve per-chat monthly range filters, with and without a category
+        Index("ix_expenses_chat_category_date", "chat_id", "category", "date"),
+        Index("ix_expenses_chat_date", "chat_id", "date"),
+        # Statement imports skip rows already stored for the chat
+        Index("ix_expenses_chat_hash", "chat_id", "content_hash", unique=True),
+    )
     
     # Define columns for the expenses table
     id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column("chat_id", BigInteger, nullable=False, server_default="0")
     date = Column("date", Date, nullable=False)
-    category = Column("category", CHAR, nullable=False)
+    category = Column("category", String, nullable=False)
     reason = Column("reason", String, nullable=False)
-    amount = Column("amount", Float, nullable=False)
+    amount = Column("amount", Money, nullable=False)
     note = Column("note", String, nullable=True)
+    currency = Column("currency", String, nullable=True)
+    original_amount = Column("original_amount", Money, nullable=True)
+    content_hash = Column("content_hash", String, nullable=True)
 
-    def __init__(self, category, reason, amount, note=None):
+    # Not a column; set for new expenses only
+    tag_names = ()
+
+    def __init__(self, chat_id, category, reason, amount, note=None, currency=None, day=None):
         """
         Initializes an Expense object with provided details.
         
         Args:
+            chat_id (int): The Telegram chat that owns the expense.
             category (str): The category of the expense.
             reason (str): The reason for the expense.
-            amount (float): The amount of the expense.
+            amount (Decimal, float or str): The amount of the expense, rounded to the cent.
             note (str, optional): Any additional notes for the expense.
+            currency (str, optional): Currency code of the amount; converted to the home currency.
+            day (date, optional): Date of the expense, e.g. of a recurring occurrence. Defaults to today.
         """
+        self.chat_id = chat_id
         self.category = category
         self.reason = reason
-        self.amount = amount
-        self.date = date.today()
+        self.amount = to_money(amount)
+        self.date = day or date.today()
         self.note = None if note == "No additional note" else note
+        self.tag_names = parse_tags(reason, self.note)
+        convert_entry(self, currency)
 
     def __repr__(self) -> str:
         """
@@ -59,18 +87,11 @@ class Expense(Base):
         Returns:
             str: Formatted string representing the Expense object.
         """
-        category_dict = {
-            "G": "Groceries",
-            "B": "Bill and Housing",
-            "F": "Fun (Shopping and Eating out)",
-            "W": "Wellness (Education and Health)",
-            "M": "Miscellaneous"
-        }
         return (f"Expense:\n"
                 f"Date: {self.date}\n"
-                f"Category: {category_dict[self.category]}\n"
+                f"Category: {get_categories(self.chat_id).name(self.category)}\n"
                 f"Spending Reason: {self.reason}\n"
-                f"Amount: {self.amount}\n"
+                f"Amount: {self.amount}{format_original_amount(self)}\n"
                 f"Note: {self.note}")
 
     def get_category(self):
@@ -87,38 +108,56 @@ class Expense(Base):
         Returns the amount of the expense.
         
         Returns:
-            float: Amount of the expense.
+            Decimal: Amount of the expense.
         """
         return self.amount
 
 
-# Database connection and setup
-engine = create_engine('sqlite:///expenses.db', echo=True)
-Base.metadata.create_all(bind=engine)
+class MonthlyExpense(Base):
+    """
+    Running total and count of expenses per (chat, month, category).
 
-Session = sessionmaker(bind=engine)
-session = Session()
+    The rows are maintained in the same transaction as every expense insert and
+    delete, so budget reports read one row per category instead of summing the
+    raw expense history.
 
-category_dict = {
-        "G": "Groceries",
-        "B": "Bill and Housing",
-        "F": "Fun (Shopping and Eating out)",
-        "W": "Wellness (Education and Health)",
-        "M": "Miscellaneous"
-    }
+    Attributes:
+        chat_id (int): Telegram chat that owns the expenses.
+        month (str): Month key in "YYYY-MM" format.
+        category (str): Category code of the expenses.
+        total (Decimal): Sum of the expense amounts, stored as integer cents.
+        count (int): Number of expenses.
+    """
 
-def spend_command(message):
+    __tablename__ = "expense_monthly"
+    __table_args__ = {"info": {"derived": True}}  # Recomputed by rebuild_monthly_totals()
+
+    chat_id = Column("chat_id", BigInteger, primary_key=True)
+    month = Column("month", String, primary_key=True)
+    category = Column("category", String, primary_key=True)
+    total = Column("total", Money, nullable=False, default=0)
+    count = Column("count", Integer, nullable=False, default=0)
+
+
+# Create the expenses tables and their indexes in the shared database
+create_tables()
+
+def parse_spend_entry(entry, categories):
     """
-    Processes a spend command from a user to create and add an expense to the database.
+    Parses and validates one spend entry of the form "category, reason, amount, note (optional)".
+
+    The amount may be followed by a currency code, e.g. "12.50 EUR".
     
     Args:
-        message (obj): User message object containing spend details.
+        entry (str): One line of a spend command, without the "/s " prefix.
+        categories (CategorySet): Categories of the chat, from get_categories().
     
     Returns:
-        new_expense (obj): New Expense object added to the database.
+        tuple: The (category, reason, amount, note, currency) of the entry; currency
+        is None for the home currency.
     """
     # split user data by commas
-    user_data = message.text[3:].split(', ') 
+    user_data = entry.strip().split(', ')
 
     # check if 3 or 4 fields are provided
     if len(user_data) not in [3, 4]:
@@ -128,114 +167,407 @@ def spend_command(message):
     category, reason, amount = user_data[:3]
     note = user_data[3] if len(user_data) == 4 else "No additional note" 
 
-    # Handling error for Category field
-    if category not in ['G', 'B', 'F', 'W', 'M']:
-        raise ValueError("""Invalid category. Category must be in: 
-            G - Groceries
-            B - Bill and Housing
-            F - Fun (Shopping and Eating out)
-            W - Wellness (Education and Health)
-            M - Miscellaneous """) 
+    # Handling error for Category field; codes are matched in any case
+    category = categories.normalize(category)
+
+    # Handling error for Amount field; converts it to an exact Decimal
+    amount, currency = parse_amount_currency(amount)
+
+    return category, reason, amount, note, currency
 
-    # Handling error for Amount field
-    if not amount.replace('.','',1).isdigit():
-        raise ValueError("Invalid amount!")
+def spend_command(message):
+    """
+    Processes a spend command from a user to create and add expenses to the database.
 
-    # Cast amount to float
-    amount = float(amount)
+    The command holds one entry per line, e.g. "/s G, bread, 3.5\nF, movie, 12".
+    Every line is validated before anything is stored, so an invalid line
+    rejects the whole message.
+    
+    Args:
+        message (obj): User message object containing spend details; the expenses
+            are stored for the chat the message came from.
+    
+    Returns:
+        list: The new Expense objects added to the database, in message order.
+    """
+    entries = []
+    categories = get_categories(message.chat.id)
+    lines = [line for line in message.text[2:].splitlines() if line.strip()]
+    for number, line in enumerate(lines, start=1):
+        # Later lines may repeat the command prefix
+        line = line.strip()
+        if line.startswith('/s '):
+            line = line[3:]
+        try:
+            entries.append(parse_spend_entry(line, categories))
+        except ValueError as e:
+            raise ValueError(f"Line {number}: {e}" if len(lines) > 1 else str(e))
 
-    # Create new expense and add it to the database
-    new_expense = add_expense(
-                    category=category,
-                    reason=reason,
-                    amount=amount,
-                    note=note)
-    return new_expense
+    if not entries:
+        raise ValueError("Invalid number of fields!")
+
+    # Create the new expenses and add them to the database in one transaction
+    return add_expenses(message.chat.id, entries)
 
-def add_expense(category, reason, amount, note):
+def add_expense(chat_id, category, reason, amount, note, currency=None, day=None):
     """
     Adds a new expense to the database.
     
     Args:
+        chat_id (int): Telegram chat that owns the expense.
         category (str): Category of the expense.
         reason (str): Reason for the expense.
-        amount (float): Amount of the expense.
+        amount (Decimal, float or str): Amount of the expense.
         note (str): Optional note for the expense.
+        currency (str, optional): Currency code of the amount. Defaults to the home currency.
+        day (date, optional): Date of the expense. Defaults to today.
     
     Returns:
         new_expense (obj): The newly added Expense object.
     """
-    new_expense = Expense(category=category, reason=reason, amount=amount, note=note)
-    session.add(new_expense)
-    session.commit()
-    return new_expense
+    return add_expenses(chat_id, [(category, reason, amount, note, currency, day)])[0]
+
+def add_expenses(chat_id, entries):
+    """
+    Adds several expenses with one bulk insert and a single commit.
+
+    Hashtags in the reasons and notes are stored as the expenses' tags in the same transaction.
+    Once committed, the expenses are checked against the chat's budget alerts (see Alerts.py).
+    
+    Args:
+        chat_id (int): Telegram chat that owns the expenses.
+        entries (list): (category, reason, amount, note) tuples, optionally followed by
+            a currency code and a date; amounts in other currencies are converted to the
+            home currency, and entries without a date are dated today.
+    
+    Returns:
+        list: The newly added Expense objects, in the order of the entries.
+    """
+    # Imported here: alerts read the budget reports, which import this module
+    from Alerts import budget_alerts
+
+    new_expenses = [Expense(chat_id, *entry) for entry in entries]
+
+    # Sum the batch per (month, category) so each aggregate row is updated once,
+    # e.g. once for a month of daily recurring occurrences
+    changes = {}
+    for expense in new_expenses:
+        key = (month_key(expense.date), expense.category)
+        day, total, count = changes.get(key, (expense.date, 0, 0))
+        changes[key] = (day, total + expense.amount, count + 1)
+
+    with session_scope() as session:
+        session.add_all(new_expenses)
+        # The tag links need the ids of the new rows
+        if any(expense.tag_names for expense in new_expenses):
+            session.flush()
+            store_expense_tags(session, chat_id, new_expenses)
+        # Keep the monthly aggregates in the same transaction as the insert
+        for (_, category), (day, total, count) in changes.items():
+            update_monthly_total(session, chat_id, day, category, total, count)
+        bump_data_version(session, chat_id, {month for month, _ in changes})
+        # Budget alerts count the expenses once they are committed
+        after_commit(session, lambda: budget_alerts.record(chat_id, new_expenses))
+    return new_expenses
+
+def format_expenses(expenses):
+    """
+    Formats newly recorded expenses as one confirmation message.
+    
+    Args:
+        expenses (list): Expense objects recorded by one spend command.
+    
+    Returns:
+        str: The single expense's details, or a numbered list with the batch total.
+    """
+    if len(expenses) == 1:
+        return repr(expenses[0])
+
+    categories = get_categories(expenses[0].chat_id)
+    lines = [f"Recorded {len(expenses)} expenses:"]
+    for number, expense in enumerate(expenses, start=1):
+        lines.append(f"{number}. {categories.name(expense.category)} - {expense.reason}: "
+                     f"${expense.amount:.2f}{format_original_amount(expense)}")
+    lines.append(f"Total: ${sum(expense.amount for expense in expenses):.2f}")
+    return "\n".join(lines)
+
+def update_monthly_total(session, chat_id, day, category, amount, count):
+    """
+    Adds an amount and a row count to the (chat, month, category) aggregate.
 
-def expense_summarize_monthly(year=None, month=None):
+    Runs inside the caller's transaction; pass negative values to undo an expense.
+    Rows whose count drops to zero are removed.
+    
+    Args:
+        session (obj): Session of the transaction that changes the expenses.
+        chat_id (int): Telegram chat that owns the expense.
+        day (date): Date of the expense.
+        category (str): Category of the expense.
+        amount (Decimal): Amount to add to the total.
+        count (int): Number of expenses to add to the count.
+    """
+    month = month_key(day)
+    statement = sqlite_insert(MonthlyExpense).values(
+        chat_id=chat_id, month=month, category=category, total=amount, count=count)
+    statement = statement.on_conflict_do_update(
+        index_elements=["chat_id", "month", "category"],
+        set_={
+            "total": MonthlyExpense.total + statement.excluded.total,
+            "count": MonthlyExpense.count + statement.excluded.count,
+        })
+    session.execute(statement)
+
+    if count < 0:
+        session.query(MonthlyExpense).filter(
+            MonthlyExpense.chat_id == chat_id,
+            MonthlyExpense.month == month,
+            MonthlyExpense.category == category,
+            MonthlyExpense.count <= 0
+        ).delete(synchronize_session=False)
+
+def expense_summarize_monthly(chat_id, year=None, month=None):
     """
     Summarizes monthly expenses by category.
     
     Args:
+        chat_id (int): Telegram chat whose expenses are summarized.
         year (int, optional): Year for the summary. Defaults to current year if not provided.
         month (int, optional): Month for the summary. Defaults to current month if not provided.
     
     Returns:
         str: Monthly expense summary as a string.
     """
-    if year is None or month is None:
-        today = datetime.today()
-        year = today.year
-        month = today.month
+    start, end = month_window(year, month)
 
     # Query expenses for the specified month and year
-    summary = session.query(
-        func.strftime("%Y-%m", Expense.date).label('month'),
-        Expense.category,
-        func.sum(Expense.amount).label('total_amount')
-    ).filter(
-        func.strftime("%Y", Expense.date) == str(year),  # Filter by year
-        func.strftime("%m", Expense.date) == f"{month:02}"  # Filter by month (zero-padded)
-    ).group_by('month', Expense.category).all()
+    with session_scope() as session:
+        summary = session.query(
+            Expense.category,
+            func.sum(Expense.amount).label('total_amount')
+        ).filter(
+            Expense.chat_id == chat_id,
+            Expense.date >= start,  # Half-open month range served by the date indexes
+            Expense.date < end
+        ).group_by(Expense.category).all()
 
     # Prepare the summary string
+    categories = get_categories(chat_id)
     summary_str = "Monthly Expense Summary by Category:\n"
-    for month, category, total_amount in summary:
-        summary_str += f"Month: {month}, Category: {category_dict[category]}, Total: ${total_amount:.2f}\n"
+    for category, total_amount in summary:
+        summary_str += f"Month: {start:%Y-%m}, Category: {categories.name(category)}, Total: ${total_amount:.2f}\n"
 
     return summary_str
 
-def get_last_expense():
+def expense_page(chat_id, cursor=None, newer=False, page_size=PAGE_SIZE):
+    """
+    Retrieves one page of a chat's expenses, newest first by date and ID.
+
+    Args:
+        chat_id (int): Telegram chat whose expenses are retrieved.
+        cursor (tuple, optional): (date, id) of the expense the page continues from;
+            None for the latest expenses.
+        newer (bool, optional): Retrieve the expenses after the cursor instead of before it.
+        page_size (int, optional): Expenses per page.
+
+    Returns:
+        tuple: The Expense objects of the page and whether more lie beyond it in the direction read.
+    """
+    with session_scope() as session:
+        return keyset_page(session.query(Expense).filter(Expense.chat_id == chat_id),
+                           Expense.date, Expense.id, cursor, newer, page_size)
+
+def describe_expense(expense, categories):
+    """
+    Formats one stored expense with its ID.
+
+    Args:
+        expense (Expense): Expense loaded from the database.
+        categories (CategorySet): Categories of the expense's chat, from get_categories().
+
+    Returns:
+        str: The expense's ID, date, category, reason, amount and note on separate lines.
+    """
+    return (f"Expense ID: {expense.id}\n"
+            f"Date: {expense.date}\n"
+            f"Category: {categories.name(expense.category)}\n"
+            f"Spending Reason: {expense.reason}\n"
+            f"Amount: {expense.amount}{format_original_amount(expense)}\n"
+            f"Note: {expense.note}")
+
+def get_last_expense(chat_id):
     """
     Retrieves the last 5 expenses from the database.
     
+    Args:
+        chat_id (int): Telegram chat whose expenses are retrieved.
+    
     Returns:
         list: A list of strings representing the last 5 expenses.
     """
-    last_expenses = session.query(Expense).order_by(Expense.id.desc()).limit(5).all()
-    result = []
-    for expense in last_expenses:
-        result.append({
-                f"Expense ID: {expense.id}\n"
-                f"Date: {expense.date}\n"
-                f"Category: {category_dict[expense.category]}\n"
-                f"Spending Reason: {expense.reason}\n"
-                f"Amount: {expense.amount}\n"
-                f"Note: {expense.note}"})
-    return result
+    last_expenses, _ = expense_page(chat_id)
+    categories = get_categories(chat_id)
+    return [describe_expense(expense, categories) for expense in last_expenses]
 
-def expense_delete_by_id(id):
+def expense_delete_by_id(chat_id, id):
     """
     Deletes an expense entry from the database by its ID.
     
     Args:
+        chat_id (int): Telegram chat that owns the expense; other chats' entries are never deleted.
         id (int): ID of the expense to be deleted.
     
     Returns:
         str: Confirmation message of successful or unsuccessful deletion.
     """
-    delete = session.query(Expense).filter(Expense.id == id).first()
-    if delete:
-        session.delete(delete)
-        session.commit()
-        return f"Expense with ID {id} deleted successfully."
-    else:
-        return f"No expense found with ID {id}."
+    with session_scope() as session:
+        delete = session.query(Expense).filter(
+            Expense.chat_id == chat_id,
+            Expense.id == id
+        ).first()
+        if delete:
+            session.delete(delete)
+            delete_expense_tags(session, [delete.id])
+            # Remove the expense from the monthly aggregate in the same transaction
+            update_monthly_total(session, chat_id, delete.date, delete.category, -delete.amount, -1)
+            bump_data_version(session, chat_id, [month_key(delete.date)])
+            # Imported here like in add_expenses; the alert totals are read again on the next insert
+            from Alerts import budget_alerts
+            after_commit(session, lambda: budget_alerts.invalidate(chat_id))
+            return f"Expense with ID {id} deleted successfully."
+        else:
+            return f"No expense found with ID {id}."
+
+def refresh_monthly_totals(session, chat_id, months):
+    """
+    Recomputes the aggregate rows of some months of one chat from the raw expenses.
+
+    Used after bulk inserts whose rows did not go through add_expenses; runs in
+    the caller's transaction and reads only the given months through the
+    (chat_id, date) index.
+    
+    Args:
+        session (obj): Session of the transaction that changed the expenses.
+        chat_id (int): Telegram chat whose aggregates are refreshed.
+        months (iterable): Month keys in "YYYY-MM" format.
+    """
+    for month in months:
+        year, month_number = (int(part) for part in month.split("-"))
+        start, end = month_window(year, month_number)
+        rows = session.query(
+            Expense.category,
+            func.sum(Expense.amount),
+            func.count(Expense.id)
+        ).filter(
+            Expense.chat_id == chat_id,
+            Expense.date >= start,
+            Expense.date < end
+        ).group_by(Expense.category).all()
+
+        session.query(MonthlyExpense).filter(
+            MonthlyExpense.chat_id == chat_id,
+            MonthlyExpense.month == month
+        ).delete(synchronize_session=False)
+        session.add_all([
+            MonthlyExpense(chat_id=chat_id, month=month, category=category, total=total, count=count)
+            for category, total, count in rows
+        ])
+    bump_data_version(session, chat_id, months)
+
+def store_inserted_expense_tags(session, chat_id, condition=None):
+    """
+    Links the hashtags of expenses written without add_expenses, e.g. imported or migrated rows.
+
+    Runs in the caller's transaction. Only the chat's expenses matching the
+    condition whose reason or note holds a "#" are read; links already stored
+    are kept, so running it twice adds nothing.
+
+    Args:
+        session (obj): Session of the transaction that inserted the expenses.
+        chat_id (int): Telegram chat that owns the expenses.
+        condition (obj, optional): SQL condition selecting the inserted expenses; None for every expense of the chat.
+    """
+    query = session.query(Expense).filter(
+        Expense.chat_id == chat_id, or_(Expense.reason.contains("#"), Expense.note.contains("#")))
+    if condition is not None:
+        query = query.filter(condition)
+    expenses = query.all()
+    for expense in expenses:
+        expense.tag_names = parse_tags(expense.reason, expense.note)
+    store_expense_tags(session, chat_id, expenses)
+
+def monthly_totals_from_expenses(session):
+    """
+    Recomputes the (chat, month, category) totals from the raw expense rows.
+    
+    Args:
+        session (obj): Session used to run the aggregate query.
+    
+    Returns:
+        dict: Maps (chat_id, month, category) to a (total, count) tuple.
+    """
+    rows = session.query(
+        Expense.chat_id,
+        func.strftime("%Y-%m", Expense.date),
+        Expense.category,
+        func.sum(Expense.amount),
+        func.count(Expense.id)
+    ).group_by(
+        Expense.chat_id,
+        func.strftime("%Y-%m", Expense.date),
+        Expense.category
+    ).all()
+    return {(chat_id, month, category): (total, count) for chat_id, month, category, total, count in rows}
+
+def rebuild_monthly_totals():
+    """
+    Replaces the monthly aggregate table with totals recomputed from raw expenses.
+    
+    Returns:
+        int: Number of (chat, month, category) rows written.
+    """
+    with session_scope() as session:
+        totals = monthly_totals_from_expenses(session)
+        # Every month present before or after the rebuild may have changed
+        changed = set(session.query(MonthlyExpense.chat_id, MonthlyExpense.month).distinct())
+        changed.update((chat_id, month) for chat_id, month, _ in totals)
+        session.query(MonthlyExpense).delete()
+        session.add_all([
+            MonthlyExpense(chat_id=chat_id, month=month, category=category, total=total, count=count)
+            for (chat_id, month, category), (total, count) in totals.items()
+        ])
+        for chat_id, month in changed:
+            bump_data_version(session, chat_id, [month])
+    return len(totals)
+
+def verify_monthly_totals(tolerance=0):
+    """
+    Compares the monthly aggregate table with totals recomputed from raw expenses.
+
+    Amounts are integer cents, so consistent totals match exactly.
+    
+    Args:
+        tolerance (Decimal, optional): Largest total difference not reported as drift.
+    
+    Returns:
+        list: One (chat_id, month, category, stored (total, count), actual (total, count))
+              tuple per drifted row; empty when the aggregates are consistent.
+    """
+    with session_scope() as session:
+        actual = monthly_totals_from_expenses(session)
+        stored = {
+            (row.chat_id, row.month, row.category): (row.total, row.count)
+            for row in session.query(MonthlyExpense).all()
+        }
+
+    drift = []
+    for key in sorted(set(actual) | set(stored)):
+        stored_total, stored_count = stored.get(key, (0, 0))
+        actual_total, actual_count = actual.get(key, (0, 0))
+        if stored_count != actual_count or abs(stored_total - actual_total) > tolerance:
+            drift.append((*key, (stored_total, stored_count), (actual_total, actual_count)))
+    return drift
+
+# Derived tables are recreated empty when their schema changes; refill them
+with session_scope() as session:
+    if session.query(MonthlyExpense).first() is None and session.query(Expense).first() is not None:
+        rebuild_monthly_totals()
@@ -0,0 +1,145 @@
+import csv
+import io
+import tempfile
+from datetime import date
+from sqlalchemy import select
+from Categories import get_categories
+from Expense import Expense
+from Income import Income
+from Storage import engine
+
+# Streaming export of a chat's ledger to CSV or Parquet.
+# Rows are read through a streaming cursor in fixed-size chunks and written as
+# they arrive, so exporting years of history uses bounded memory and the first
+# bytes are written before the query finishes.
+# Parquet output needs the optional pyarrow package.
+
+# Rows fetched from the cursor and written per chunk (one Parquet row group each)
+CHUNK_SIZE = 5000
+
+# Exported columns per ledger; chat_id and import hashes stay internal
+EXPORT_COLUMNS = {
+    "expenses": [Expense.id, Expense.date, Expense.category, Expense.reason, Expense.amount, Expense.note,
+                 Expense.currency, Expense.original_amount],
+    "income": [Income.id, Income.date, Income.source, Income.amount, Income.note,
+               Income.currency, Income.original_amount],
+}
+
+EXPORT_FORMATS = ["csv", "parquet"]
+
+
+# Builds the export query for one chat
+# Input: Ledger ("expenses" or "income"), chat id, optional first and last day (inclusive)
+#        and optional list of expense category codes of the chat
+# Output: A SQLAlchemy select ordered by date and id; raises ValueError on an unknown category
+def export_query(kind, chat_id, start=None, end=None, categories=None):
+    columns = EXPORT_COLUMNS[kind]
+    table = columns[0].class_
+    query = select(*columns).where(table.chat_id == chat_id)
+    if start is not None:
+        query = query.where(table.date >= start)
+    if end is not None:
+        query = query.where(table.date <= end)
+    if categories:
+        if kind != "expenses":
+            raise ValueError("Category filters only apply to expenses")
+        chat_categories = get_categories(chat_id)
+        query = query.where(Expense.category.in_([chat_categories.normalize(code) for code in categories]))
+    return query.order_by(table.date, table.id)
+
+
+# Streams the rows of an export query in chunks
+# Input: Query built by export_query and the chunk size
+# Output: Yields lists of row tuples, at most chunk_size rows each
+def iter_export_chunks(query, chunk_size=CHUNK_SIZE):
+    with engine.connect() as connection:
+        result = connection.execution_options(yield_per=chunk_size).execute(query)
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+
+
+# Writes an export as CSV
+# Input: Text stream, ledger name and the row chunks
+# Output: Writes a header and every row; returns the number of rows written
+def write_csv(stream, kind, chunks):
+    writer = csv.writer(stream)
+    writer.writerow([column.key for column in EXPORT_COLUMNS[kind]])
+    rows = 0
+    for chunk in chunks:
+        writer.writerows(chunk)
+        rows += len(chunk)
+    return rows
+
+
+# Writes an export as Parquet, one row group per chunk
+# Input: Binary stream or path, ledger name and the row chunks
+# Output: Writes the file; returns the number of rows written
+def write_parquet(stream, kind, chunks):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet export needs the pyarrow package (pip install pyarrow)")
+
+    # Amounts are exact Decimals with two decimal places
+    types = {"id": pa.int64(), "date": pa.date32(), "amount": pa.decimal128(18, 2),
+             "original_amount": pa.decimal128(18, 2)}
+    schema = pa.schema([(column.key, types.get(column.key, pa.string())) for column in EXPORT_COLUMNS[kind]])
+    rows = 0
+    with pq.ParquetWriter(stream, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pylist([dict(zip(schema.names, row)) for row in chunk], schema=schema))
+            rows += len(chunk)
+    return rows
+
+
+# Exports a chat's ledger to an open file
+# Input: Binary stream, ledger, format ("csv" or "parquet"), chat id and filters
+# Output: Writes the export; returns the number of rows written
+def export_ledger(stream, kind, export_format, chat_id, start=None, end=None, categories=None, chunk_size=CHUNK_SIZE):
+    # Build the query first so bad filters fail before anything is written
+    chunks = iter_export_chunks(export_query(kind, chat_id, start, end, categories), chunk_size)
+    if export_format == "parquet":
+        return write_parquet(stream, kind, chunks)
+
+    text_stream = io.TextIOWrapper(stream, encoding="utf-8", newline="", write_through=True)
+    try:
+        return write_csv(text_stream, kind, chunks)
+    finally:
+        text_stream.detach()
+
+
+# Parses the arguments of the /export bot command
+# Input: Message text such as "/export income parquet 2024-01-01..2024-06-30" or "/export G,F 2024-03-01.."
+# Output: Dictionary with kind, export_format, start, end and categories; raises ValueError on bad input.
+#         Any other token is a comma-separated list of category codes, checked against the chat's
+#         categories by export_query
+def parse_export_command(text):
+    options = {"kind": "expenses", "export_format": "csv", "start": None, "end": None, "categories": None}
+    for token in text.split()[1:]:
+        lowered = token.lower()
+        if lowered in EXPORT_COLUMNS:
+            options["kind"] = lowered
+        elif lowered in EXPORT_FORMATS:
+            options["export_format"] = lowered
+        elif ".." in token:
+            first, last = token.split("..", 1)
+            options["start"] = date.fromisoformat(first) if first else None
+            options["end"] = date.fromisoformat(last) if last else None
+        elif options["categories"] is None:
+            options["categories"] = token.upper().split(",")
+        else:
+            raise ValueError(f"Unknown export option: {token}")
+    if options["categories"] and options["kind"] != "expenses":
+        raise ValueError("Category filters only apply to expenses")
+    return options
+
+
+# Exports a chat's ledger to a temporary file, e.g. to send it as a bot document
+# Input: Chat id and the options returned by parse_export_command
+# Output: (open temporary file positioned at the start, file name, number of rows)
+def export_to_tempfile(chat_id, kind, export_format, start=None, end=None, categories=None):
+    export_file = tempfile.TemporaryFile()
+    rows = export_ledger(export_file, kind, export_format, chat_id, start, end, categories)
+    export_file.seek(0)
+    return export_file, f"{kind}.{export_format}", rows
@@ -0,0 +1,89 @@
+from datetime import date
+from Categories import get_categories
+from Expense import describe_expense, expense_page
+from Income import describe_income, income_page
+
+# Browsing a chat's expenses or income a page at a time with /history. Each
+# page message carries "Newer" and "Older" buttons whose callback data holds
+# the (date, id) key of the page's first or last entry, so the next page is
+# read with one index seek from that key (see Storage.keyset_page) and no state
+# is kept between clicks. A click edits the page message in place.
+
+# First word of the callback data of the history buttons
+CALLBACK_PREFIX = "history"
+
+# Entries a history page can show: page function, formatter and title
+HISTORY_KINDS = {
+    "expenses": (expense_page, describe_expense, "Expenses"),
+    "income": (income_page, lambda earning, categories: describe_income(earning), "Income"),
+}
+
+
+def parse_history_command(text):
+    """
+    Parses a /history command.
+
+    Args:
+        text (str): Message text such as "/history", "/history expenses" or "/history income".
+
+    Returns:
+        str: "expenses" or "income"; raises ValueError on anything else.
+    """
+    tokens = text.split()[1:]
+    kind = tokens[0].lower() if tokens else "expenses"
+    if len(tokens) > 1 or kind not in HISTORY_KINDS:
+        raise ValueError("Use /history expenses or /history income")
+    return kind
+
+
+def parse_history_callback(data):
+    """
+    Parses the callback data of a history button.
+
+    Args:
+        data (str): Data such as "history expenses older 2024-03-05 812".
+
+    Returns:
+        tuple: The kind, the (date, id) cursor and whether the newer entries are
+        wanted; raises ValueError on data that is not a history button's.
+    """
+    parts = data.split()
+    if (len(parts) != 5 or parts[0] != CALLBACK_PREFIX or parts[1] not in HISTORY_KINDS
+            or parts[2] not in ("older", "newer")):
+        raise ValueError(f"Not a history button: {data}")
+    return parts[1], (date.fromisoformat(parts[3]), int(parts[4])), parts[2] == "newer"
+
+
+def history_page(chat_id, kind, cursor=None, newer=False):
+    """
+    Formats one page of a chat's history and the buttons leading to the next ones.
+
+    Args:
+        chat_id (int): Telegram chat whose entries are shown.
+        kind (str): "expenses" or "income".
+        cursor (tuple, optional): (date, id) from a history button; None for the newest page.
+        newer (bool, optional): Show the entries newer than the cursor instead of older.
+
+    Returns:
+        tuple: The page text and a list of (label, callback data) buttons, empty
+        when the chat's history fits on the page.
+    """
+    read_page, describe, title = HISTORY_KINDS[kind]
+    entries, more = read_page(chat_id, cursor, newer)
+    if not entries:
+        return f"No {title.lower()} recorded.", []
+
+    # Reading one way, the cursor entry itself lies the other way
+    has_newer = more if newer else cursor is not None
+    has_older = cursor is not None if newer else more
+    categories = get_categories(chat_id)
+    text = f"{title}, newest first:\n\n" + "\n\n".join(describe(entry, categories) for entry in entries)
+
+    buttons = []
+    if has_newer:
+        first = entries[0]
+        buttons.append(("« Newer", f"{CALLBACK_PREFIX} {kind} newer {first.date.isoformat()} {first.id}"))
+    if has_older:
+        last = entries[-1]
+        buttons.append(("Older »", f"{CALLBACK_PREFIX} {kind} older {last.date.isoformat()} {last.id}"))
+    return text, buttons
@@ -0,0 +1,327 @@
+import csv
+import hashlib
+import io
+import re
+import sqlite3
+from datetime import datetime
+from sqlalchemy import insert
+from Alerts import budget_alerts
+from Categories import get_categories
+from Currency import HOME_CURRENCY, rates
+from Expense import Expense, refresh_monthly_totals, store_inserted_expense_tags
+from Income import Income
+from Storage import bump_data_version, month_key, session_scope, to_money
+
+# Streaming import of bank statement exports (CSV or OFX).
+# Rows are read one at a time and inserted in batches, so memory stays bounded
+# by the batch size regardless of file size; identical rows are numbered with
+# counts kept in a temporary SQLite file rather than in memory.
+# Debits become expenses mapped to one of the chat's categories by its keywords,
+# credits become income.
+# Each row gets a content hash; rows whose hash is already stored for the chat
+# are skipped by the unique (chat_id, content_hash) index.
+# Rows in another currency (a CSV currency column, or the OFX CURDEF/CURRENCY
+# tags) are converted to the home currency with the in-memory rate cache.
+
+# Rows inserted per executemany batch (and per transaction)
+BATCH_SIZE = 5000
+
+# Accepted CSV header names for each field (compared lower-cased)
+CSV_COLUMNS = {
+    "date": ["date", "transaction date", "posted date", "posting date", "booking date"],
+    "description": ["description", "name", "payee", "merchant", "details", "transaction"],
+    "amount": ["amount", "transaction amount", "value"],
+    "debit": ["debit", "withdrawal", "withdrawals", "money out"],
+    "credit": ["credit", "deposit", "deposits", "money in"],
+    "memo": ["memo", "note", "notes", "reference"],
+    "currency": ["currency", "currency code", "ccy"],
+}
+
+DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%d.%m.%Y", "%Y/%m/%d", "%Y%m%d"]
+
+EXPENSE_INSERT = insert(Expense.__table__).prefix_with("OR IGNORE")
+INCOME_INSERT = insert(Income.__table__).prefix_with("OR IGNORE")
+
+
+# Parses a statement date in one of the supported formats
+# Input: Date string
+# Output: A date object; raises ValueError if no format matches
+def parse_date(value):
+    value = value.strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date: {value}")
+
+
+# Parses a statement amount such as "-1,234.50", "$12.00" or "(12.00)"
+# Input: Amount string
+# Output: An exact Decimal, negative for debits
+def parse_amount(value):
+    value = value.strip().replace(",", "").replace("$", "")
+    if value.startswith("(") and value.endswith(")"):
+        value = "-" + value[1:-1]
+    return to_money(value)
+
+
+# Reads transactions from a CSV export one row at a time
+# Input: A text stream with a header row
+# Output: Yields (date, description, signed amount, memo, transaction id, currency) tuples;
+#         rows that cannot be parsed are yielded as None
+def read_csv_statement(stream):
+    reader = csv.reader(stream)
+    header = [name.strip().lower() for name in next(reader, [])]
+    columns = {}
+    for field, names in CSV_COLUMNS.items():
+        for index, name in enumerate(header):
+            if name in names:
+                columns[field] = index
+                break
+
+    if "date" not in columns or "description" not in columns or (
+            "amount" not in columns and "debit" not in columns and "credit" not in columns):
+        raise ValueError("CSV header needs a date, a description and an amount (or debit/credit) column")
+
+    for row in reader:
+        if not row:
+            continue
+        try:
+            if "amount" in columns:
+                amount = parse_amount(row[columns["amount"]])
+            else:
+                debit = row[columns["debit"]].strip() if "debit" in columns else ""
+                credit = row[columns["credit"]].strip() if "credit" in columns else ""
+                amount = -abs(parse_amount(debit)) if debit else abs(parse_amount(credit))
+            memo = row[columns["memo"]].strip() if "memo" in columns else None
+            currency = row[columns["currency"]].strip().upper() if "currency" in columns else None
+            yield (parse_date(row[columns["date"]]), row[columns["description"]].strip(), amount, memo or None, None,
+                   currency or None)
+        except (ValueError, IndexError):
+            yield None
+
+
+# Reads transactions from an OFX (SGML or XML) export one <STMTTRN> block at a time
+# Input: A text stream
+# Output: Yields (date, description, signed amount, memo, transaction id, currency) tuples;
+#         blocks that cannot be parsed are yielded as None
+def read_ofx_statement(stream):
+    tag = re.compile(r"<(\w+)>([^<\r\n]*)")
+    transaction = None
+    statement_currency = None
+    for line in stream:
+        for name, value in tag.findall(line):
+            name = name.upper()
+            if name == "STMTTRN":
+                transaction = {}
+            elif transaction is not None:
+                transaction[name] = value.strip()
+            elif name == "CURDEF":
+                statement_currency = value.strip().upper() or None
+        if transaction is not None and "</STMTTRN>" in line.upper():
+            try:
+                description = transaction.get("NAME") or transaction.get("PAYEE") or transaction.get("MEMO", "")
+                # <CURRENCY><CURSYM> marks a transaction in another currency than the statement's
+                currency = (transaction.get("CURSYM") or "").upper() or statement_currency
+                yield (parse_date(transaction["DTPOSTED"][:8]), description, parse_amount(transaction["TRNAMT"]),
+                       transaction.get("MEMO") or None, transaction.get("FITID"), currency)
+            except (KeyError, ValueError):
+                yield None
+            transaction = None
+
+
+# Guesses the statement format from the file name or the first bytes
+# Input: File name and the first line of the file
+# Output: "csv" or "ofx"
+def detect_format(name, first_line):
+    if name and name.lower().endswith((".ofx", ".qfx")):
+        return "ofx"
+    if first_line.lstrip().upper().startswith(("OFXHEADER", "<?XML", "<OFX")):
+        return "ofx"
+    return "csv"
+
+
+# Imports a bank statement into a chat's ledger
+# Input: Chat id, a text stream, the format ("csv", "ofx" or None to detect) and the batch size
+# Output: A dictionary with the number of expenses and income rows inserted,
+#         duplicates skipped, invalid rows and rows without an exchange rate
+def import_statement(chat_id, stream, statement_format=None, name=None, batch_size=BATCH_SIZE):
+    if statement_format is None:
+        first_line = stream.readline()
+        statement_format = detect_format(name, first_line)
+        stream = _prepend(first_line, stream)
+    reader = read_ofx_statement(stream) if statement_format == "ofx" else read_csv_statement(stream)
+
+    stats = {"expenses": 0, "income": 0, "duplicates": 0, "invalid": 0, "no_rate": 0}
+    categories = get_categories(chat_id)
+    expenses, income = [], []
+    # (row, key) of the batch's rows in file order, numbered before the batch is inserted;
+    # the row is None when its hash comes from a transaction id or it is not imported
+    keyed = []
+    counter = OccurrenceCounter()
+
+    try:
+        for transaction in reader:
+            if transaction is None or transaction[2] == 0:
+                stats["invalid"] += 1
+                continue
+            day, description, amount, memo, transaction_id, currency = transaction
+            if currency == HOME_CURRENCY:
+                currency = None
+
+            key = (day, description, str(amount), memo)
+            content_hash = _content_hash(chat_id, transaction_id) if transaction_id else None
+
+            # Convert at the rate of the transaction day; the rates come from memory, not a query per row
+            original_amount = abs(amount) if currency else None
+            try:
+                home_amount = rates.convert(abs(amount), currency, day) if currency else abs(amount)
+            except ValueError:
+                stats["no_rate"] += 1
+                # Still counted, so the rows after it keep their numbers once the rate is loaded
+                keyed.append((None, key))
+                continue
+
+            if amount < 0:
+                row = {
+                    "chat_id": chat_id, "date": day, "category": categories.categorize(description),
+                    "reason": description or "Imported", "amount": home_amount, "note": memo,
+                    "currency": currency, "original_amount": original_amount, "content_hash": content_hash,
+                }
+                expenses.append(row)
+            else:
+                row = {
+                    "chat_id": chat_id, "date": day, "source": description or "Imported",
+                    "amount": home_amount, "note": memo, "currency": currency, "original_amount": original_amount,
+                    "content_hash": content_hash,
+                }
+                income.append(row)
+            keyed.append((None if transaction_id else row, key))
+
+            if len(expenses) + len(income) >= batch_size or len(keyed) >= batch_size:
+                _number_rows(chat_id, counter, keyed)
+                _insert_batch(chat_id, expenses, income, stats)
+                expenses, income, keyed = [], [], []
+
+        _number_rows(chat_id, counter, keyed)
+        _insert_batch(chat_id, expenses, income, stats)
+    finally:
+        counter.close()
+    # Imported rows bypass add_expenses too; the alert totals are read again on the next insert
+    budget_alerts.invalidate(chat_id)
+    return stats
+
+
+class OccurrenceCounter:
+    """
+    Numbers identical rows of a statement: the first is 1, the next identical one 2, and so on.
+
+    Statements are not always ordered by date, so an identical row may come back
+    anywhere in the file. The count of each row is kept under a short digest in a
+    temporary SQLite file (deleted on close), so memory stays bounded by the batch
+    rather than growing with the number of distinct rows.
+    """
+
+    # Digests looked up per query
+    LOOKUP_SIZE = 500
+
+    def __init__(self):
+        self._db = sqlite3.connect("")
+        self._db.execute("CREATE TABLE counts (digest BLOB PRIMARY KEY, count INTEGER NOT NULL) WITHOUT ROWID")
+
+    def number(self, keys):
+        """
+        Numbers a batch of rows, continuing the counts of the batches before it.
+
+        Args:
+            keys (list): Content of each row, in file order, e.g. (day, description, amount, memo).
+
+        Returns:
+            list: The occurrence number of each row.
+        """
+        digests = [hashlib.blake2b(repr(key).encode(), digest_size=8).digest() for key in keys]
+        distinct = list(set(digests))
+        counts = {}
+        for first in range(0, len(distinct), self.LOOKUP_SIZE):
+            chunk = distinct[first:first + self.LOOKUP_SIZE]
+            counts.update(self._db.execute(
+                f"SELECT digest, count FROM counts WHERE digest IN ({', '.join('?' * len(chunk))})", chunk))
+        numbers = []
+        for digest in digests:
+            counts[digest] = counts.get(digest, 0) + 1
+            numbers.append(counts[digest])
+        self._db.executemany("INSERT OR REPLACE INTO counts VALUES (?, ?)", counts.items())
+        return numbers
+
+    def close(self):
+        """Deletes the temporary counts."""
+        self._db.close()
+
+
+# Sets the content hash of rows without a transaction id from their content and occurrence number
+# Input: Chat id, the statement's OccurrenceCounter and (row dictionary, key) pairs in file order;
+#        the row is None for rows that are only counted
+# Output: Sets "content_hash" on each row
+def _number_rows(chat_id, counter, keyed):
+    if not keyed:
+        return
+    for (row, key), number in zip(keyed, counter.number([key for _, key in keyed])):
+        if row is not None:
+            row["content_hash"] = _content_hash(chat_id, (*key, number))
+
+
+# Inserts one batch with executemany, skipping rows whose hash is already stored
+# Input: Chat id, expense and income row dictionaries and the running statistics
+# Output: Commits the batch, refreshes the touched monthly aggregates, links hashtags and updates stats
+def _insert_batch(chat_id, expenses, income, stats):
+    if not expenses and not income:
+        return
+    with session_scope() as session:
+        connection = session.connection()
+        if expenses:
+            inserted = connection.execute(EXPENSE_INSERT, expenses).rowcount
+            stats["expenses"] += inserted
+            stats["duplicates"] += len(expenses) - inserted
+            # Imported rows bypass add_expenses, so refresh the months they touched
+            if inserted:
+                refresh_monthly_totals(session, chat_id, {month_key(row["date"]) for row in expenses})
+                # and link their hashtags, found by the content hash of the rows that have one
+                tagged = [row["content_hash"] for row in expenses if "#" in row["reason"] + (row["note"] or "")]
+                if tagged:
+                    store_inserted_expense_tags(session, chat_id, Expense.content_hash.in_(tagged))
+        if income:
+            inserted = connection.execute(INCOME_INSERT, income).rowcount
+            stats["income"] += inserted
+            stats["duplicates"] += len(income) - inserted
+            if inserted:
+                bump_data_version(session, chat_id, {month_key(row["date"]) for row in income})
+
+
+def _content_hash(chat_id, fields):
+    return hashlib.sha1(repr((chat_id, fields)).encode()).hexdigest()
+
+
+def _prepend(first_line, stream):
+    yield first_line
+    yield from stream
+
+
+# Formats import statistics for a chat reply or the command line
+# Input: Statistics dictionary returned by import_statement
+# Output: A one-paragraph summary string
+def format_import_stats(stats):
+    summary = (f"Imported {stats['expenses']} expenses and {stats['income']} income entries.\n"
+               f"Skipped {stats['duplicates']} duplicates and {stats['invalid']} invalid rows.")
+    if stats.get("no_rate"):
+        summary += (f"\n{stats['no_rate']} rows in another currency had no exchange rate for their date. "
+                    "Load rates with: python Manage.py fx-load rates.csv")
+    return summary
+
+
+# Imports a statement from raw bytes, e.g. a document uploaded to the bot
+# Input: Chat id, file content and file name
+# Output: Statistics dictionary returned by import_statement
+def import_statement_bytes(chat_id, content, name=None):
+    stream = io.TextIOWrapper(io.BytesIO(content), encoding="utf-8-sig", errors="replace", newline="")
+    return import_statement(chat_id, stream, name=name)
@@ -1,10 +1,9 @@
-from sqlalchemy import create_engine, ForeignKey, Column, String, Integer, CHAR, Float, Date, func
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import date, datetime
-
-# Create a base class for declarative class definitions
-Base = declarative_base()
+from sqlalchemy import Column, String, Integer, BigInteger, Date, Index, func
+from datetime import date
+from decimal import Decimal
+from Currency import convert_entry, format_original_amount, parse_amount_currency
+from Storage import (PAGE_SIZE, Base, Money, bump_data_version, create_tables, keyset_page, month_key, month_window,
+                     session_scope, to_money)
 
 # Define the file name for exported income data
 income_file = "exported_income.csv"
@@ -15,25 +14,39 @@ class Income(Base):
 
     Attributes:
         id (int): Unique identifier for the income entry.
+        chat_id (int): Telegram chat that owns the income entry.
         date (Date): Date the income was earned.
         source (str): Source of the income.
-        amount (float): Amount of the income.
+        amount (Decimal): Amount of the income in the home currency, stored as integer cents.
         note (str): Optional note associated with the income entry.
+        currency (str): Currency the income was entered in; None for the home currency.
+        original_amount (Decimal): Amount as entered, for income in another currency.
+        content_hash (str): Hash of an imported statement row, used to skip duplicates.
     """
 
     __tablename__ = "income"  # Define the database table name
+    __table_args__ = (
+        Index("ix_income_chat_date", "chat_id", "date"),  # Serve per-chat monthly range filters
+        Index("ix_income_chat_hash", "chat_id", "content_hash", unique=True),  # Skip re-imported statement rows
+    )
     id = Column(Integer, primary_key=True, autoincrement=True)  # Primary key
+    chat_id = Column("chat_id", BigInteger, nullable=False, server_default="0")  # Owning Telegram chat
     date = Column("date", Date, nullable=False)  # Date column, cannot be null
     source = Column("source", String, nullable=False)  # Source column, cannot be null
-    amount = Column("amount", Float, nullable=False)  # Amount column, cannot be null
+    amount = Column("amount", Money, nullable=False)  # Amount column, cannot be null
     note = Column("note", String, nullable=True)  # Note column, optional
+    currency = Column("currency", String, nullable=True)  # Entered currency, None for the home currency
+    original_amount = Column("original_amount", Money, nullable=True)  # Amount as entered in that currency
+    content_hash = Column("content_hash", String, nullable=True)  # Set for imported statement rows
 
-    def __init__(self, source, amount, note=None):
-        """Initializes an Income object."""
+    def __init__(self, chat_id, source, amount, note=None, currency=None, day=None):
+        """Initializes an Income object, converting amounts in another currency to the home currency."""
+        self.chat_id = chat_id
         self.source = source
-        self.amount = amount
-        self.date = date.today()  # Automatically set the date to today
+        self.amount = to_money(amount)
+        self.date = day or date.today()  # Today unless a date is given, e.g. for a recurring occurrence
         self.note = None if note == "No additional note" else note  # Set note or default
+        convert_entry(self, currency)
 
     def __repr__(self) -> str:
         """Returns a string representation of the Income object."""
@@ -41,34 +54,28 @@ class Income(Base):
             f"Income:\n"
             f"Date: {self.date}\n"
             f"Earned from: {self.source}\n"
-            f"Amount: {self.amount}\n"
+            f"Amount: {self.amount}{format_original_amount(self)}\n"
             f"Note: {self.note}."
         )
 
-# Create an SQLite database engine
-engine = create_engine('sqlite:///income.db', echo=True)
-
-# Create all tables in the engine
-Base.metadata.create_all(bind=engine)
+# Create the income table and its index in the shared database
+create_tables()
 
-# Create a configured "Session" class
-Session = sessionmaker(bind=engine)
-
-# Create a Session instance
-session = Session()
-
-def earn_command(message):
+def parse_earn_entry(entry):
     """
-    Processes an earn command from a user.
+    Parses and validates one earn entry of the form "source, amount, note (optional)".
+
+    The amount may be followed by a currency code, e.g. "300 GBP".
 
     Args:
-        message (obj): User message object containing income details.
+        entry (str): The text of an earn command, without the "/e " prefix.
 
     Returns:
-        new_income (obj): New income object added to the database.
+        tuple: The (source, amount, note, currency) of the entry; currency is None
+        for the home currency.
     """
-    # Extract user data from the message
-    user_data = message.text[3:].split(', ')
+    # Extract user data from the entry
+    user_data = entry.strip().split(', ')
 
     # Check if the correct number of fields is provided
     if len(user_data) not in [2, 3]:
@@ -78,115 +85,170 @@ def earn_command(message):
     source, amount = user_data[:2]
     note = user_data[2] if len(user_data) == 3 else "No additional note"
 
-    # Validate the amount field (must be a valid number)
-    if not amount.replace('.', '', 1).isdigit():
-        raise ValueError("Invalid amount!")
+    # Validate the amount field (a number, optionally followed by a currency code)
+    amount, currency = parse_amount_currency(amount)
 
-    # Convert amount to a float
-    amount = float(amount)
+    return source, amount, note, currency
+
+def earn_command(message):
+    """
+    Processes an earn command from a user.
+
+    Args:
+        message (obj): User message object containing income details; the income
+            is stored for the chat the message came from.
+
+    Returns:
+        new_income (obj): New income object added to the database.
+    """
+    source, amount, note, currency = parse_earn_entry(message.text[3:])
 
     # Create a new income entry
     new_income = add_income(
+        chat_id=message.chat.id,
         source=source,
         amount=amount,
-        note=note
+        note=note,
+        currency=currency
     )
 
     return new_income
 
-def add_income(source, amount, note):
+def add_income(chat_id, source, amount, note, currency=None, day=None):
     """
     Adds a new income entry to the database.
 
     Args:
+        chat_id (int): Telegram chat that owns the income entry.
         source (str): Source of the income.
-        amount (float): Amount of the income.
+        amount (Decimal, float or str): Amount of the income.
         note (str): Optional note associated with the income entry.
+        currency (str, optional): Currency code of the amount. Defaults to the home currency.
+        day (date, optional): Date the income was earned. Defaults to today.
 
     Returns:
         new_income (obj): The newly added Income object.
     """
-    new_income = Income(source=source, amount=amount, note=note)
-    session.add(new_income)  # Add the new income entry to the session
-    session.commit()  # Commit the transaction to the database
-    return new_income
+    return add_incomes(chat_id, [(source, amount, note, currency, day)])[0]
 
-def income_summarize_monthly(year=None, month=None):
+def add_incomes(chat_id, entries):
+    """
+    Adds several income entries with one bulk insert and a single commit.
+
+    Args:
+        chat_id (int): Telegram chat that owns the income entries.
+        entries (list): (source, amount, note) tuples, optionally followed by a currency
+            code and a date; entries without a date are dated today.
+
+    Returns:
+        list: The newly added Income objects, in the order of the entries.
+    """
+    new_incomes = [Income(chat_id, *entry) for entry in entries]
+    with session_scope() as session:
+        session.add_all(new_incomes)  # Committed when the scope exits
+        bump_data_version(session, chat_id, [month_key(income.date) for income in new_incomes])
+    return new_incomes
+
+def income_summarize_monthly(chat_id, year=None, month=None):
     """
     Summarizes monthly income for a specific year and month.
 
     Args:
+        chat_id (int): The Telegram chat whose income is summarized.
         year (int, optional): The year to summarize. Defaults to the current year.
         month (int, optional): The month to summarize. Defaults to the current month.
 
     Returns:
         summary_str (str): A summary of the income for the specified month.
-        total_amount (float): The total income amount for the specified month.
+        total_amount (Decimal): The total income amount for the specified month.
     """
-    if year is None or month is None:
-        today = datetime.today()
-        year = today.year
-        month = today.month
+    start, end = month_window(year, month)
 
     # Query the database for income entries in the specified year and month
-    summary = session.query(
-        func.strftime("%Y-%m", Income.date).label('month'),
-        func.sum(Income.amount).label('total_amount')
-    ).filter(
-        func.strftime("%Y", Income.date) == str(year),  # Filter by year
-        func.strftime("%m", Income.date) == f"{month:02}"  # Filter by month (zero-padded)
-    ).group_by('month').all()
+    with session_scope() as session:
+        total_amount = session.query(
+            func.sum(Income.amount).label('total_amount')
+        ).filter(
+            Income.chat_id == chat_id,
+            Income.date >= start,  # Half-open month range served by the date index
+            Income.date < end
+        ).scalar()
 
     # Generate the summary string
     summary_str = "Monthly Income Summary:\n"
-    for month, total_amount in summary:
-        summary_str += f"Month: {month}, Total: ${total_amount:.2f}\n"
+    if total_amount is not None:
+        summary_str += f"Month: {start:%Y-%m}, Total: ${total_amount:.2f}\n"
+    else:
+        total_amount = Decimal(0)
 
     return summary_str, total_amount
 
-def get_last_earning():
+def income_page(chat_id, cursor=None, newer=False, page_size=PAGE_SIZE):
+    """
+    Retrieves one page of a chat's income entries, newest first by date and ID.
+
+    Args:
+        chat_id (int): The Telegram chat whose income entries are retrieved.
+        cursor (tuple, optional): (date, id) of the entry the page continues from;
+            None for the latest entries.
+        newer (bool, optional): Retrieve the entries after the cursor instead of before it.
+        page_size (int, optional): Entries per page.
+
+    Returns:
+        tuple: The Income objects of the page and whether more lie beyond it in the direction read.
+    """
+    with session_scope() as session:
+        return keyset_page(session.query(Income).filter(Income.chat_id == chat_id),
+                           Income.date, Income.id, cursor, newer, page_size)
+
+def describe_income(earning):
     """
-    Retrieves the last 5 income entries.
+    Formats one stored income entry with its ID.
+
+    Args:
+        earning (Income): Income entry loaded from the database.
 
     Returns:
-        list: A list of the 5 most recent Income objects.
+        str: The entry's ID, date, source, amount and note on separate lines.
     """
-    last_earning = session.query(Income).order_by(Income.id.desc()).limit(5).all()
-    return last_earning
+    return (f"Earning ID: {earning.id}\n"
+            f"Date: {earning.date}\n"
+            f"Earned from: {earning.source}\n"
+            f"Amount: {earning.amount}{format_original_amount(earning)}\n"
+            f"Note: {earning.note}.")
 
-def income_delete_by_id(id):
+def income_delete_by_id(chat_id, id):
     """
     Deletes an income entry by its ID.
 
     Args:
+        chat_id (int): The Telegram chat that owns the entry; other chats' entries are never deleted.
         id (int): The ID of the income entry to delete.
 
     Returns:
         str: Success or error message.
     """
-    delete = session.query(Income).filter(Income.id == id).first()
-    if delete:
-        session.delete(delete)
-        session.commit()
-        return f"Income with ID {id} deleted successfully."
-    else:
-        return f"No income found with ID {id}."
-
-def get_last_income():
+    with session_scope() as session:
+        delete = session.query(Income).filter(
+            Income.chat_id == chat_id,
+            Income.id == id
+        ).first()
+        if delete:
+            session.delete(delete)
+            bump_data_version(session, chat_id, [month_key(delete.date)])
+            return f"Income with ID {id} deleted successfully."
+        else:
+            return f"No income found with ID {id}."
+
+def get_last_income(chat_id):
     """
     Retrieves the last 5 income entries with detailed information.
 
+    Args:
+        chat_id (int): The Telegram chat whose income entries are retrieved.
+
     Returns:
-        list: A list of dictionaries representing the 5 most recent Income entries.
+        list: A list of strings representing the 5 most recent Income entries.
     """
-    last_earnings = session.query(Income).order_by(Income.id.desc()).limit(5).all()
-    result = []
-    for earning in last_earnings:
-        result.append({
-            f"Earning ID: {earning.id}\n"
-            f"Date: {earning.date}\n"
-            f"Earned from: {earning.source}\n"
-            f"Amount: {earning.amount}\n"
-            f"Note: {earning.note}."
-        })
-    return result
+    last_earnings, _ = income_page(chat_id)
+    return [describe_income(earning) for earning in last_earnings]
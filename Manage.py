@@ -0,0 +1,150 @@
+import argparse
+import sys
+from datetime import date
+from Storage import migrate_legacy_databases
+from Expense import rebuild_monthly_totals, verify_monthly_totals
+from Exporter import EXPORT_COLUMNS, EXPORT_FORMATS, export_ledger
+from Importer import BATCH_SIZE, format_import_stats, import_statement
+from Currency import HOME_CURRENCY, load_fx_rates
+from Search import rebuild_search_indexes
+
+# Command line maintenance tasks for the budget tracker database
+# Usage: python Manage.py <command> [options]
+
+
+# Imports the legacy expenses.db, income.db and budget.db files into the shared database
+# Input: Parsed command line arguments
+# Output: Prints the number of rows imported per table
+def migrate_command(args):
+    imported = migrate_legacy_databases({
+        "expenses": args.expenses,
+        "income": args.income,
+        "budget": args.budget,
+    }, chat_id=args.chat_id)
+    for table, count in imported.items():
+        print(f"{table}: {count} rows imported")
+
+    # Imported rows bypass add_expense, so refresh the monthly aggregates
+    print(f"expense_monthly: {rebuild_monthly_totals()} rows rebuilt")
+
+
+# Recomputes the monthly expense aggregates from the raw expense rows
+# Input: Parsed command line arguments
+# Output: Prints the number of aggregate rows written
+def rebuild_totals_command(args):
+    print(f"expense_monthly: {rebuild_monthly_totals()} rows rebuilt")
+
+
+# Reports drift between the monthly expense aggregates and the raw expense rows
+# Input: Parsed command line arguments
+# Output: Prints every drifted row and exits with status 1 when drift is found
+def verify_totals_command(args):
+    drift = verify_monthly_totals()
+    for chat_id, month, category, stored, actual in drift:
+        print(f"chat {chat_id} {month} {category}: stored total {stored[0]:.2f} ({stored[1]} rows), "
+              f"actual total {actual[0]:.2f} ({actual[1]} rows)")
+
+    if drift:
+        print(f"{len(drift)} drifted rows. Run: python Manage.py rebuild-totals")
+        sys.exit(1)
+    print("Monthly totals match the expense rows.")
+
+
+# Refills the full-text search indexes from the expense and income rows
+# Input: Parsed command line arguments
+# Output: Prints the number of indexes rebuilt
+def rebuild_search_command(args):
+    print(f"search indexes: {rebuild_search_indexes()} rebuilt")
+
+
+# Imports a CSV or OFX bank statement into a chat's ledger, skipping rows already imported
+# Input: Parsed command line arguments
+# Output: Prints the number of rows imported, duplicates and invalid rows
+def import_command(args):
+    with open(args.file, encoding="utf-8-sig", errors="replace", newline="") as stream:
+        stats = import_statement(args.chat_id, stream, statement_format=args.format,
+                                 name=args.file, batch_size=args.batch_size)
+    print(format_import_stats(stats))
+
+
+# Loads exchange rates into the home currency from a CSV file with date, currency and rate columns
+# Input: Parsed command line arguments
+# Output: Prints the number of rates loaded
+def fx_load_command(args):
+    with open(args.file, encoding="utf-8-sig", newline="") as stream:
+        try:
+            loaded = load_fx_rates(stream)
+        except ValueError as e:
+            sys.exit(f"Error: {e}")
+    print(f"fx_rates: {loaded} rates loaded (home currency {HOME_CURRENCY})")
+
+
+# Streams a chat's expenses or income to a CSV or Parquet file (CSV goes to stdout by default)
+# Input: Parsed command line arguments
+# Output: Writes the export and prints the number of rows exported
+def export_command(args):
+    if args.output is None and args.format == "parquet":
+        sys.exit("Parquet export needs --output")
+    stream = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        rows = export_ledger(stream, args.kind, args.format, args.chat_id, start=args.start, end=args.end,
+                             categories=args.category)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    finally:
+        if args.output:
+            stream.close()
+    print(f"{args.kind}: {rows} rows exported", file=sys.stderr)
+
+
+# Builds the argument parser with one sub-command per maintenance task
+# Input: None
+# Output: An argparse.ArgumentParser instance
+def build_parser():
+    parser = argparse.ArgumentParser(description="Budget tracker maintenance commands")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate = commands.add_parser("migrate", help="Import the legacy per-table database files")
+    migrate.add_argument("--expenses", default="expenses.db", help="Legacy expenses database file")
+    migrate.add_argument("--income", default="income.db", help="Legacy income database file")
+    migrate.add_argument("--budget", default="budget.db", help="Legacy budget database file")
+    migrate.add_argument("--chat-id", type=int, default=0, help="Telegram chat id that owns the legacy rows")
+    migrate.set_defaults(handler=migrate_command)
+
+    rebuild = commands.add_parser("rebuild-totals", help="Recompute the monthly expense aggregates")
+    rebuild.set_defaults(handler=rebuild_totals_command)
+
+    verify = commands.add_parser("verify-totals", help="Report drift in the monthly expense aggregates")
+    verify.set_defaults(handler=verify_totals_command)
+
+    search = commands.add_parser("rebuild-search", help="Refill the full-text search indexes of /find")
+    search.set_defaults(handler=rebuild_search_command)
+
+    importer = commands.add_parser("import", help="Import a CSV or OFX bank statement")
+    importer.add_argument("file", help="Statement file to import")
+    importer.add_argument("--chat-id", type=int, required=True, help="Telegram chat id that owns the imported rows")
+    importer.add_argument("--format", choices=["csv", "ofx"], help="Statement format (detected when omitted)")
+    importer.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Rows inserted per transaction")
+    importer.set_defaults(handler=import_command)
+
+    fx_load = commands.add_parser("fx-load", help="Load exchange rates from a CSV file")
+    fx_load.add_argument("file", help="CSV file with date, currency and rate (home currency per unit) columns")
+    fx_load.set_defaults(handler=fx_load_command)
+
+    export = commands.add_parser("export", help="Export a chat's expenses or income to CSV or Parquet")
+    export.add_argument("kind", choices=list(EXPORT_COLUMNS), help="Ledger to export")
+    export.add_argument("--chat-id", type=int, required=True, help="Telegram chat id to export")
+    export.add_argument("--format", choices=EXPORT_FORMATS, default="csv", help="Output format")
+    export.add_argument("--output", "-o", help="Output file (CSV defaults to stdout)")
+    export.add_argument("--from", dest="start", type=date.fromisoformat, help="First day to export (YYYY-MM-DD)")
+    export.add_argument("--to", dest="end", type=date.fromisoformat, help="Last day to export (YYYY-MM-DD)")
+    export.add_argument("--category", action="append",
+                        help="Code of an expense category of the chat to export (repeatable)")
+    export.set_defaults(handler=export_command)
+
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+    args.handler(args)
@@ -0,0 +1,328 @@
+import asyncio
+import logging
+from collections import OrderedDict
+import aiohttp
+
+# Telegram accepts about one message per second in a chat, with short bursts,
+# and 30 per second over all chats; faster senders get 429 Too Many Requests.
+# Each limit is a token bucket: a rate and the burst sent at once after a pause.
+# The global rate plus its burst stays within 30 sends in any one second.
+CHAT_RATE = 1.0
+CHAT_BURST = 3
+GLOBAL_RATE = 25
+GLOBAL_BURST = 5
+
+# Sends in flight at once; telebot's pooled session keeps up to 50 connections
+# open, so every send reuses a persistent connection
+MAX_IN_FLIGHT = 20
+
+# Attempts per message; failed sends are retried after BACKOFF_SECONDS, doubled
+# each attempt, or after the retry_after a 429 response asks for
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 0.5
+
+# Longest text Telegram accepts in one message
+MESSAGE_LIMIT = 4096
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Rate limit allowing a burst of sends, refilled at a steady rate.
+
+    Attributes:
+        rate (float): Tokens added per second.
+        capacity (float): Most tokens held, i.e. the largest burst.
+        tokens (float): Tokens available at updated_at.
+        updated_at (float): Loop time of the last refill.
+    """
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = now
+
+    def wait(self, now):
+        """Returns the seconds until a token is available; 0 when one is."""
+        if now > self.updated_at:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+            self.updated_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        """Uses one token; call after wait() returned 0."""
+        self.tokens -= 1
+
+    def pause(self, now, seconds):
+        """Empties the bucket for a number of seconds, e.g. after a 429 response."""
+        self.wait(now)
+        self.tokens = min(self.tokens, 0.0) - seconds * self.rate
+
+    def full(self, now):
+        """True when the bucket is full again at a given time, so it can be forgotten."""
+        return self.tokens + (now - self.updated_at) * self.rate >= self.capacity
+
+
+class Outbox:
+    """
+    Per-chat queue of outgoing bot messages, sent in the background within Telegram's rate limits.
+
+    Handlers queue their replies with put() instead of awaiting a send each.
+    Consecutive messages waiting for a chat that answer the same message (or
+    none) go out joined into one message (up to MESSAGE_LIMIT characters), so
+    a handler that answers with several texts costs one round trip, and a busy
+    chat gets one send per token. A chat has at most one send in flight, so
+    its messages arrive in the order they were queued. Sends are limited by a
+    token bucket per chat and one over all chats, and run concurrently, at
+    most MAX_IN_FLIGHT at once. A send rejected with 429 Too Many Requests, or
+    failing on the network, goes back in front of the chat's queue and is
+    retried after a backoff.
+
+    Attributes:
+        queued (int): Texts queued.
+        sent (int): Telegram messages sent.
+        retried (int): Sends retried after a 429 response or a network error.
+        failed (int): Messages dropped after an error or MAX_ATTEMPTS attempts.
+    """
+
+    def __init__(self, send, chat_rate=CHAT_RATE, chat_burst=CHAT_BURST, global_rate=GLOBAL_RATE,
+                 global_burst=GLOBAL_BURST, max_in_flight=MAX_IN_FLIGHT):
+        """
+        Args:
+            send (coroutine function): Sends one text to a chat, e.g. bot.send_message;
+                called with reply_to_message_id when the text answers a message.
+            chat_rate (float, optional): Sends per second to one chat.
+            chat_burst (int, optional): Sends to one chat at once after a pause.
+            global_rate (float, optional): Sends per second over all chats.
+            global_burst (int, optional): Sends over all chats at once after a pause.
+            max_in_flight (int, optional): Sends awaiting a response at once.
+        """
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.queued = 0
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self._send = send
+        self._global_rate = global_rate
+        self._global_burst = global_burst
+        self._max_in_flight = max_in_flight
+        self._pending = OrderedDict()  # chat id -> [text, reply to message id, attempts] waiting, oldest chat first
+        self._buckets = {}  # chat id -> TokenBucket
+        self._sending = set()  # chat ids with a send in flight
+        self._flushes = {}  # chat id -> futures of flush() calls waiting for the chat's queue to empty
+        self._drains = []  # futures of drain() calls waiting for every queue to empty
+        self._global = None
+        self._wakeup = None
+        self._loop = None
+        self._task = None
+
+    def start(self):
+        """Starts sending on the running event loop."""
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._global = TokenBucket(self._global_rate, self._global_burst, self._loop.time())
+        self._task = self._loop.create_task(self._run())
+
+    def stop(self):
+        """Stops sending; messages still waiting are dropped and flush() and drain() calls fail."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        waiters = [waiter for waiters in self._flushes.values() for waiter in waiters] + self._drains
+        self._flushes, self._drains = {}, []
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_exception(RuntimeError("Outbox stopped before its messages were sent"))
+
+    @property
+    def started(self):
+        """True while the outbox is sending."""
+        return self._task is not None
+
+    def put(self, chat_id, text, reply_to=None):
+        """
+        Queues a message; call from the event loop.
+
+        Args:
+            chat_id (int): Telegram chat to send to.
+            text (str): Text of the message; other objects are sent as str(). Texts
+                longer than one message are split between lines.
+            reply_to (int, optional): Id of the message this one answers.
+        """
+        pieces = split_message(str(text))
+        if not pieces:
+            return
+        self._pending.setdefault(chat_id, []).extend([piece, reply_to, 0] for piece in pieces)
+        self.queued += len(pieces)
+        # Messages queued before start() are sent once it runs
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def put_threadsafe(self, chat_id, text):
+        """
+        Queues a message from a worker thread.
+
+        The message is handed to the loop the outbox runs on, so this raises
+        RuntimeError before start(); threads queue nothing until the bot sends.
+        """
+        if self._loop is None:
+            raise RuntimeError("Outbox is not started")
+        self._loop.call_soon_threadsafe(self.put, chat_id, text)
+
+    async def flush(self, chat_id):
+        """
+        Waits until the messages queued for a chat were sent, e.g. before sending it a photo.
+
+        Raises RuntimeError when the outbox is not started, since nothing would send them.
+        """
+        if not self.started:
+            raise RuntimeError("Outbox is not started")
+        if chat_id in self._pending or chat_id in self._sending:
+            waiter = self._loop.create_future()
+            self._flushes.setdefault(chat_id, []).append(waiter)
+            await waiter
+
+    async def drain(self):
+        """
+        Waits until every queued message has been sent.
+
+        Raises RuntimeError when the outbox is not started, since nothing would send them.
+        """
+        if not self.started:
+            raise RuntimeError("Outbox is not started")
+        if self._pending or self._sending:
+            waiter = self._loop.create_future()
+            self._drains.append(waiter)
+            await waiter
+
+    def _next_ready(self, now):
+        # The oldest chat that may be sent to now, or the seconds until the first one may
+        wait = None
+        for chat_id in self._pending:
+            if chat_id in self._sending:
+                continue
+            bucket = self._buckets.get(chat_id)
+            chat_wait = bucket.wait(now) if bucket is not None else 0.0
+            if chat_wait == 0:
+                return chat_id, 0.0
+            wait = chat_wait if wait is None else min(wait, chat_wait)
+        return None, wait
+
+    def _take(self, chat_id):
+        # Joins consecutive waiting texts that answer the same message and fit in one message;
+        # the rest wait for the next send
+        waiting = self._pending.pop(chat_id)
+        text, reply_to, attempts = waiting.pop(0)
+        while waiting and waiting[0][1] == reply_to and len(text) + 2 + len(waiting[0][0]) <= MESSAGE_LIMIT:
+            next_text, _, next_attempts = waiting.pop(0)
+            text += "\n\n" + next_text
+            attempts = max(attempts, next_attempts)
+        if waiting:
+            self._pending[chat_id] = waiting
+        return [text, reply_to, attempts]
+
+    async def _run(self):
+        while True:
+            now = self._loop.time()
+            chat_id, wait = None, None
+            if len(self._sending) < self._max_in_flight:
+                chat_id, wait = self._next_ready(now)
+            if chat_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            global_wait = self._global.wait(now)
+            if global_wait:
+                await asyncio.sleep(global_wait)
+                continue
+            self._global.take()
+            bucket = self._buckets.setdefault(chat_id, TokenBucket(self.chat_rate, self.chat_burst, now))
+            bucket.take()
+            self._sending.add(chat_id)
+            self._loop.create_task(self._deliver(chat_id, self._take(chat_id)))
+
+    async def _deliver(self, chat_id, message):
+        text, reply_to, attempts = message
+        try:
+            if reply_to is None:
+                await self._send(chat_id, text)
+            else:
+                await self._send(chat_id, text, reply_to_message_id=reply_to)
+            self.sent += 1
+        except Exception as e:
+            backoff = _retry_after(e, attempts)
+            if backoff is not None and attempts + 1 < MAX_ATTEMPTS:
+                # Back in front of the chat's queue, sent again once the backoff has passed
+                self.retried += 1
+                message[2] = attempts + 1
+                self._pending[chat_id] = [message] + self._pending.pop(chat_id, [])
+                self._pending.move_to_end(chat_id, last=False)
+                self._buckets[chat_id].pause(self._loop.time(), backoff)
+                logger.warning("Send to chat %s retried in %.1f s: %s", chat_id, backoff, e)
+            else:
+                self.failed += 1
+                logger.exception("Could not send a queued message to chat %s", chat_id)
+        finally:
+            self._sending.discard(chat_id)
+            # A chat's queue only empties when a send ends, so the waiting flushes are woken here
+            if chat_id not in self._pending:
+                _wake(self._flushes.pop(chat_id, ()))
+                if not self._pending and not self._sending:
+                    _wake(self._drains)
+                    self._drains = []
+            # Forget idle chats whose bucket refilled so the table does not grow with every chat
+            if len(self._buckets) > 2 * len(self._pending) + 1000:
+                now = self._loop.time()
+                self._buckets = {chat: bucket for chat, bucket in self._buckets.items()
+                                 if chat in self._pending or chat in self._sending or not bucket.full(now)}
+            self._wakeup.set()
+
+
+def _wake(waiters):
+    # Resolves the futures of flush() or drain() calls; a caller may have stopped waiting already
+    for waiter in waiters:
+        if not waiter.done():
+            waiter.set_result(None)
+
+
+def _retry_after(error, attempts):
+    # Seconds before retrying a failed send, or None when a retry would not help
+    if getattr(error, "error_code", None) == 429:
+        parameters = error.result_json.get("parameters") or {}
+        return parameters.get("retry_after") or BACKOFF_SECONDS * 2 ** attempts
+    network_errors = (aiohttp.ClientError, asyncio.TimeoutError)
+    if isinstance(error, network_errors) or isinstance(error.__cause__, network_errors):
+        return BACKOFF_SECONDS * 2 ** attempts
+    return None
+
+
+def split_message(text):
+    """
+    Splits a text into pieces that fit in one Telegram message, between lines where possible.
+
+    Args:
+        text (str): Text of any length.
+
+    Returns:
+        list: Pieces of at most MESSAGE_LIMIT characters; empty for a blank text.
+    """
+    pieces, chunk = [], ""
+    for line in text.splitlines(keepends=True):
+        if chunk and len(chunk) + len(line) > MESSAGE_LIMIT:
+            pieces.append(chunk.rstrip("\n"))
+            chunk = ""
+        # A line longer than a whole message is sent in pieces
+        while len(line) > MESSAGE_LIMIT:
+            pieces.append(line[:MESSAGE_LIMIT])
+            line = line[MESSAGE_LIMIT:]
+        chunk += line
+    if chunk.strip():
+        pieces.append(chunk.rstrip("\n"))
+    return pieces
@@ -0,0 +1,446 @@
+import asyncio
+import logging
+import os
+import re
+from calendar import monthrange
+from datetime import date, timedelta
+from sqlalchemy import BigInteger, Column, Date, Index, Integer, String
+from Categories import get_categories
+from Currency import format_original_amount, rates
+from Expense import add_expenses, parse_spend_entry
+from Income import add_incomes, parse_earn_entry
+from Runtime import workers
+from Storage import Base, Money, create_tables, session_scope
+
+# Recurring expenses and income, e.g. rent on the 1st of every month or a salary every two weeks.
+# Each rule stores the date of its next occurrence in an indexed next_run
+# column. A scheduler in the bot process wakes up every RECURRING_TICK_SECONDS,
+# reads only the rules due by today through that index and inserts every
+# occurrence from their next_run on, each with its own date, so occurrences
+# missed while the bot was down are caught up. next_run moves past today in
+# the same transaction as the inserts, so an occurrence is never inserted twice.
+# Override the tick with the RECURRINGTICKBUDGET environment variable.
+
+RECURRING_TICK_SECONDS = int(os.getenv('RECURRINGTICKBUDGET', '60'))
+
+# Due rules materialized per transaction
+RULE_BATCH_SIZE = 500
+
+# Occurrences of one rule inserted per transaction; a rule further behind continues in the next one
+MAX_CATCH_UP = 1000
+
+# Recorded entries listed one by one in a notification; the rest are counted
+LISTED_ENTRIES = 20
+
+# Schedule units as typed, mapped to the stored unit
+UNITS = {
+    "day": "day", "days": "day", "daily": "day",
+    "week": "week", "weeks": "week", "weekly": "week",
+    "month": "month", "months": "month", "monthly": "month",
+}
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# "/every <schedule> /s <entry>" or "/every <schedule> /e <entry>"
+COMMAND_PATTERN = re.compile(r"^/every(?:@\w+)?\s+(.*?)\s*(/[se])\s+(.+)$")
+
+EXPENSE = "expense"
+INCOME = "income"
+
+logger = logging.getLogger(__name__)
+
+
+class RecurringRule(Base):
+    """
+    A recurring expense or income of a chat.
+
+    Attributes:
+        id (int): Unique identifier, used by /recurring_remove.
+        chat_id (int): Telegram chat that owns the rule.
+        kind (str): EXPENSE or INCOME.
+        category (str): Category code of a recurring expense; None for income.
+        reason (str): Reason of the expense, or source of the income.
+        amount (Decimal): Amount as entered, in the rule's currency; converted on each occurrence's date.
+        note (str): Optional note copied to every occurrence.
+        currency (str): Currency code of the amount; None for the home currency.
+        unit (str): "day", "week" or "month".
+        every (int): Number of units between occurrences.
+        month_day (int): Day of the month of a monthly rule; shorter months use their last day.
+        next_run (Date): Date of the next occurrence not yet recorded.
+    """
+
+    __tablename__ = "recurring_rules"
+    __table_args__ = (
+        # The scheduler reads only the rules due by today
+        Index("ix_recurring_rules_next_run", "next_run"),
+        Index("ix_recurring_rules_chat", "chat_id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column("chat_id", BigInteger, nullable=False)
+    kind = Column("kind", String, nullable=False)
+    category = Column("category", String, nullable=True)
+    reason = Column("reason", String, nullable=False)
+    amount = Column("amount", Money, nullable=False)
+    note = Column("note", String, nullable=True)
+    currency = Column("currency", String, nullable=True)
+    unit = Column("unit", String, nullable=False)
+    every = Column("every", Integer, nullable=False, default=1)
+    month_day = Column("month_day", Integer, nullable=True)
+    next_run = Column("next_run", Date, nullable=False)
+
+    def advance(self, day):
+        """Returns the occurrence after the one on a given day."""
+        if self.unit == "day":
+            return day + timedelta(days=self.every)
+        if self.unit == "week":
+            return day + timedelta(weeks=self.every)
+        return month_occurrence(day.year, day.month + self.every, self.month_day)
+
+    def due_days(self, today, limit=MAX_CATCH_UP):
+        """
+        Returns the occurrences due by a day and the occurrence after them.
+
+        Args:
+            today (date): Last day whose occurrences are due.
+            limit (int, optional): Most occurrences returned.
+
+        Returns:
+            tuple: The due dates from next_run on, oldest first, and the next date not returned.
+        """
+        days, day = [], self.next_run
+        while day <= today and len(days) < limit:
+            days.append(day)
+            day = self.advance(day)
+        return days, day
+
+    def entry(self, day):
+        """Returns the add_expenses() or add_incomes() entry of the occurrence on a day."""
+        if self.kind == EXPENSE:
+            return self.category, self.reason, self.amount, self.note, self.currency, day
+        return self.reason, self.amount, self.note, self.currency, day
+
+    def describe(self):
+        """Returns the schedule in words, e.g. "every 2 weeks on Friday" or "every month on day 31"."""
+        units = self.unit if self.every == 1 else f"{self.every} {self.unit}s"
+        if self.unit == "week":
+            return f"every {units} on {WEEKDAYS[self.next_run.weekday()].capitalize()}"
+        if self.unit == "month":
+            return f"every {units} on day {self.month_day}"
+        return f"every {units}"
+
+
+# Create the recurring rules table in the shared database
+create_tables()
+
+
+def month_occurrence(year, month, month_day):
+    """
+    Returns the day of a month a monthly rule occurs on.
+
+    Args:
+        year (int): Year of the month.
+        month (int): Month number; values past 12 roll over into later years.
+        month_day (int): Day of the month of the rule.
+
+    Returns:
+        date: The rule's day in that month, or the month's last day when it is shorter.
+    """
+    year, month = year + (month - 1) // 12, (month - 1) % 12 + 1
+    return date(year, month, min(month_day, monthrange(year, month)[1]))
+
+
+def parse_schedule(schedule, today):
+    """
+    Parses the schedule of an /every command.
+
+    Args:
+        schedule (str): Text such as "month 1", "2 weeks friday", "10 days" or
+            "month 15 from 2024-01-01".
+        today (date): Day the rule starts on when no "from" date is given.
+
+    Returns:
+        dict: The unit, every, month_day and next_run of the rule; raises ValueError on a bad schedule.
+    """
+    tokens = schedule.lower().split()
+    every = int(tokens.pop(0)) if tokens and tokens[0].isdigit() else 1
+    if not tokens or tokens[0] not in UNITS:
+        raise ValueError("Schedule must be 'month [DAY]', 'week [WEEKDAY]' or 'N days'")
+    unit = UNITS[tokens.pop(0)]
+    if not 1 <= every <= 366:
+        raise ValueError("Repeat every 1 to 366 units")
+
+    start, day = today, None
+    while tokens:
+        token = tokens.pop(0)
+        if token == "from" and tokens:
+            try:
+                start = date.fromisoformat(tokens.pop(0))
+            except ValueError:
+                raise ValueError("Start date must be in the format YYYY-MM-DD")
+        elif token != "on" and day is None:
+            day = token
+        else:
+            raise ValueError(f"Unknown schedule option: {token}")
+
+    if unit == "month":
+        month_day = int(re.sub(r"(st|nd|rd|th)$", "", day)) if day else start.day
+        if not 1 <= month_day <= 31:
+            raise ValueError("Day of the month must be between 1 and 31")
+        next_run = month_occurrence(start.year, start.month, month_day)
+        if next_run < start:
+            next_run = month_occurrence(start.year, start.month + 1, month_day)
+        return {"unit": unit, "every": every, "month_day": month_day, "next_run": next_run}
+
+    if unit == "week" and day is not None:
+        weekdays = [name for name in WEEKDAYS if name.startswith(day)]
+        if len(day) < 3 or len(weekdays) != 1:
+            raise ValueError(f"Unknown weekday: {day}")
+        start += timedelta(days=(WEEKDAYS.index(weekdays[0]) - start.weekday()) % 7)
+    elif day is not None:
+        raise ValueError(f"Unknown schedule option: {day}")
+    return {"unit": unit, "every": every, "month_day": None, "next_run": start}
+
+
+def parse_recurring_command(text, categories, today=None):
+    """
+    Parses an /every command into the fields of a RecurringRule.
+
+    Args:
+        text (str): Message text such as "/every month 1 /s B, rent, 1500" or
+            "/every 2 weeks friday /e salary, 2500".
+        categories (CategorySet): Categories of the chat, from get_categories().
+        today (date, optional): Day the rule starts on without a "from" date. Defaults to today.
+
+    Returns:
+        dict: Keyword arguments of RecurringRule, without the chat; raises ValueError on bad input.
+    """
+    match = COMMAND_PATTERN.match(text.strip())
+    if match is None or "\n" in match.group(3):
+        raise ValueError("Give the schedule followed by one /s or /e entry.")
+    schedule, command, entry = match.groups()
+    fields = parse_schedule(schedule, today or date.today())
+    if command == "/s":
+        category, reason, amount, note, currency = parse_spend_entry(entry, categories)
+        fields.update(kind=EXPENSE, category=category)
+    else:
+        reason, amount, note, currency = parse_earn_entry(entry)
+        fields.update(kind=INCOME, category=None)
+    fields.update(reason=reason, amount=amount, currency=currency,
+                  note=None if note == "No additional note" else note)
+    return fields
+
+
+def add_rule(chat_id, fields, today=None):
+    """
+    Stores a recurring rule and records its occurrences due by today.
+
+    A rule starting today, or on an earlier "from" date, is caught up at once
+    instead of on the scheduler's next tick.
+
+    Args:
+        chat_id (int): Telegram chat that owns the rule.
+        fields (dict): Result of parse_recurring_command().
+        today (date, optional): Last day whose occurrences are recorded. Defaults to today.
+
+    Returns:
+        tuple: The new RecurringRule and the list of Expense or Income objects recorded;
+        raises ValueError when there is no exchange rate for the rule's currency.
+    """
+    if fields["currency"]:
+        # Fail now rather than skipping every occurrence; raises ValueError without a rate
+        rates.rate(fields["currency"], fields["next_run"])
+    with session_scope() as session:
+        rule = RecurringRule(chat_id=chat_id, **fields)
+        session.add(rule)
+        session.flush()
+        # Only the new rule: the chat's other rules belong to the scheduler, which may be
+        # recording them right now from rows read before this transaction commits
+        created = run_due_rules(today, rule_id=rule.id).get(chat_id, [])
+    return rule, created
+
+
+def get_rules(chat_id):
+    """Returns the recurring rules of a chat, in the order they were added."""
+    with session_scope() as session:
+        return session.query(RecurringRule).filter(
+            RecurringRule.chat_id == chat_id
+        ).order_by(RecurringRule.id).all()
+
+
+def remove_rule(chat_id, rule_id):
+    """
+    Removes a recurring rule of a chat; entries it already recorded are kept.
+
+    Args:
+        chat_id (int): Telegram chat that owns the rule; other chats' rules are never removed.
+        rule_id (int): Id of the rule.
+
+    Returns:
+        str: Confirmation message of successful or unsuccessful removal.
+    """
+    with session_scope() as session:
+        removed = session.query(RecurringRule).filter(
+            RecurringRule.chat_id == chat_id,
+            RecurringRule.id == rule_id
+        ).delete()
+    if removed:
+        return f"Recurring rule {rule_id} removed. Entries it already recorded are kept."
+    return f"No recurring rule with ID {rule_id}."
+
+
+def run_due_rules(today=None, rule_id=None, batch_size=RULE_BATCH_SIZE):
+    """
+    Records every occurrence due by today and moves the rules past today.
+
+    Due rules are read through the next_run index, batch_size at a time. Each
+    batch inserts the occurrences of all its rules with one add_expenses() and
+    one add_incomes() call per chat and advances the rules' next_run in the
+    same transaction, so running it again (or after a crash) records nothing
+    twice. A rule in another currency without an exchange rate for its date is
+    skipped and retried on the next run.
+
+    Args:
+        today (date, optional): Last day whose occurrences are recorded. Defaults to today.
+        rule_id (int, optional): Only run this rule, e.g. one just added.
+        batch_size (int, optional): Rules materialized per transaction.
+
+    Returns:
+        dict: Maps each chat with new entries to its new Expense and Income objects.
+    """
+    today = today or date.today()
+    created, skipped = {}, set()
+    while True:
+        with session_scope() as session:
+            query = session.query(RecurringRule).filter(RecurringRule.next_run <= today)
+            if rule_id is not None:
+                query = query.filter(RecurringRule.id == rule_id)
+            if skipped:
+                query = query.filter(RecurringRule.id.notin_(skipped))
+            rules = query.order_by(RecurringRule.next_run, RecurringRule.id).limit(batch_size).all()
+            if not rules:
+                return created
+
+            entries = {EXPENSE: {}, INCOME: {}}
+            for rule in rules:
+                days, next_run = rule.due_days(today)
+                if rule.currency:
+                    try:
+                        # Rates only grow more available over time; the first day is the one that may lack one
+                        rates.rate(rule.currency, days[0])
+                    except ValueError as e:
+                        logger.warning("Recurring rule %s skipped: %s", rule.id, e)
+                        skipped.add(rule.id)
+                        continue
+                entries[rule.kind].setdefault(rule.chat_id, []).extend(rule.entry(day) for day in days)
+                rule.next_run = next_run
+
+            for rule_chat, chat_entries in entries[EXPENSE].items():
+                created.setdefault(rule_chat, []).extend(add_expenses(rule_chat, chat_entries))
+            for rule_chat, chat_entries in entries[INCOME].items():
+                created.setdefault(rule_chat, []).extend(add_incomes(rule_chat, chat_entries))
+
+
+def format_rules(chat_id, rules):
+    """
+    Formats a chat's recurring rules for the /recurring command.
+
+    Args:
+        chat_id (int): Telegram chat that owns the rules.
+        rules (list): RecurringRule objects, from get_rules().
+
+    Returns:
+        str: One line per rule with its id, entry, schedule and next occurrence.
+    """
+    if not rules:
+        return ("No recurring rules. Add one with e.g.\n"
+                "/every month 1 /s B, rent, 1500\n/every 2 weeks friday /e salary, 2500")
+    categories = get_categories(chat_id)
+    lines = ["Your recurring rules:"]
+    for rule in rules:
+        what = (f"{categories.name(rule.category)} - {rule.reason}" if rule.kind == EXPENSE
+                else f"Income from {rule.reason}")
+        amount = f"{rule.amount:.2f} {rule.currency}" if rule.currency else f"${rule.amount:.2f}"
+        lines.append(f"{rule.id}. {what}: {amount}, {rule.describe()}, next on {rule.next_run}")
+    return "\n".join(lines)
+
+
+def format_recorded_entries(chat_id, entries):
+    """
+    Formats the entries recorded by recurring rules, e.g. for a chat notification.
+
+    Args:
+        chat_id (int): Telegram chat that owns the entries.
+        entries (list): Expense and Income objects recorded by run_due_rules().
+
+    Returns:
+        str: The first LISTED_ENTRIES entries with their dates, and the number of the others.
+    """
+    categories = get_categories(chat_id)
+    lines = [f"Recorded {len(entries)} recurring {'entry' if len(entries) == 1 else 'entries'}:"]
+    for entry in entries[:LISTED_ENTRIES]:
+        what = (f"Income from {entry.source}" if entry.__tablename__ == "income"
+                else f"{categories.name(entry.category)} - {entry.reason}")
+        lines.append(f"{entry.date} {what}: ${entry.amount:.2f}{format_original_amount(entry)}")
+    if len(entries) > LISTED_ENTRIES:
+        lines.append(f"... and {len(entries) - LISTED_ENTRIES} more")
+    return "\n".join(lines)
+
+
+class RecurringScheduler:
+    """
+    Runs the due recurring rules every few seconds inside the bot process.
+
+    Each tick is one indexed query when nothing is due; the rules run on the
+    bot's worker pool, so a large catch-up never blocks the event loop.
+
+    Attributes:
+        tick_seconds (float): Pause between two ticks.
+        ticks (int): Ticks run since the scheduler started.
+    """
+
+    def __init__(self, tick_seconds=RECURRING_TICK_SECONDS):
+        self.tick_seconds = tick_seconds
+        self.ticks = 0
+        self._task = None
+
+    def start(self, on_recorded=None):
+        """
+        Starts ticking on the running event loop.
+
+        Args:
+            on_recorded (coroutine function, optional): Awaited with (chat_id, entries)
+                for every chat that got new entries in a tick.
+        """
+        self._task = asyncio.get_running_loop().create_task(self._run(on_recorded))
+
+    async def tick(self, today=None):
+        """Records the occurrences due by today; returns run_due_rules()'s result."""
+        self.ticks += 1
+        return await workers.run(run_due_rules, today)
+
+    async def _run(self, on_recorded):
+        while True:
+            try:
+                recorded = await self.tick()
+            except Exception:
+                # A failed batch was rolled back and is retried on the next tick
+                logger.exception("Recurring rules tick failed")
+                recorded = {}
+            for chat_id, entries in recorded.items() if on_recorded is not None else ():
+                try:
+                    await on_recorded(chat_id, entries)
+                except Exception:
+                    # e.g. a chat that blocked the bot; its entries are recorded all the same
+                    logger.exception("Could not notify chat %s of recurring entries", chat_id)
+            await asyncio.sleep(self.tick_seconds)
+
+    def stop(self):
+        """Stops ticking."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+
+# Scheduler started by the bot
+scheduler = RecurringScheduler()
@@ -0,0 +1,87 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Size of the thread pool that runs blocking database and reporting calls.
+# Keep it at or below the engine pool (5 connections + 10 overflow).
+# Override with the WORKERSBUDGET environment variable.
+MAX_WORKERS = int(os.getenv('WORKERSBUDGET', '8'))
+
+
+class ChatWorkers:
+    """
+    Runs blocking work off the event loop while keeping each chat's requests in order.
+
+    Blocking calls (SQLAlchemy queries, report and chart building) are submitted
+    to a bounded thread pool, so a slow request only occupies one worker instead
+    of stalling the bot. Requests from the same chat are serialized with a FIFO
+    asyncio.Lock, so a '/s' followed by '/check_budget' is always answered in
+    that order; different chats run concurrently.
+
+    Attributes:
+        executor (ThreadPoolExecutor): Bounded pool running the blocking calls.
+    """
+
+    def __init__(self, max_workers=MAX_WORKERS):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="budget-worker")
+        self._locks = {}  # chat id -> [lock, number of holders and waiters]
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs a blocking callable on the worker pool and awaits its result.
+
+        Args:
+            func (callable): The blocking function to run.
+            *args: Positional arguments for the function.
+            **kwargs: Keyword arguments for the function.
+
+        Returns:
+            The function's return value; its exceptions are re-raised here.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def _acquire(self, chat_id):
+        entry = self._locks.setdefault(chat_id, [asyncio.Lock(), 0])
+        entry[1] += 1
+        await entry[0].acquire()
+
+    def _release(self, chat_id):
+        entry = self._locks[chat_id]
+        entry[0].release()
+        entry[1] -= 1
+        # Forget idle chats so the table does not grow with every chat ever seen
+        if entry[1] == 0:
+            del self._locks[chat_id]
+
+    def in_chat_order(self, handler):
+        """
+        Decorates an async message handler so a chat's messages run one at a time.
+
+        The lock is taken before the handler's first await. Telegram updates are
+        dispatched in arrival order, so lock waiters queue in arrival order too.
+
+        Args:
+            handler (coroutine function): Handler taking the Telegram message.
+
+        Returns:
+            coroutine function: The wrapped handler.
+        """
+        @functools.wraps(handler)
+        async def wrapper(message, *args, **kwargs):
+            chat_id = message.chat.id
+            await self._acquire(chat_id)
+            try:
+                return await handler(message, *args, **kwargs)
+            finally:
+                self._release(chat_id)
+        return wrapper
+
+    def shutdown(self):
+        """Waits for running calls to finish and stops the worker threads."""
+        self.executor.shutdown(wait=True)
+
+
+# Worker pool shared by the bot handlers
+workers = ChatWorkers()
@@ -0,0 +1,221 @@
+import re
+from datetime import date
+from sqlalchemy import Integer, text
+from Categories import get_categories
+from Expense import Expense
+from Income import Income
+from Storage import Money, engine, parse_period, session_scope, to_money
+
+# Full-text search over the words of a chat's entries: expense reasons and
+# notes, income sources and notes. Each table has an SQLite FTS5 index of those
+# columns that keeps no copy of the text (content= points at the table itself)
+# and is updated by triggers on insert, update and delete, so every writer
+# (the bot, statement imports, recurring rules, plain SQL) keeps it in step
+# within its own transaction. A search reads the matching ids from the index
+# and only those rows from the table, instead of a LIKE scan of every row; its
+# cost grows with the number of matches, not with the size of the ledger.
+
+# FTS5 index -> (table, indexed text columns, model)
+SEARCH_INDEXES = {
+    "expenses_fts": ("expenses", ("reason", "note"), Expense),
+    "income_fts": ("income", ("source", "note"), Income),
+}
+
+# Matching entries listed per table; the count and total cover every match
+LISTED_MATCHES = 10
+
+# A /find token that is a period, "YYYY-MM" or a range of days with either end left
+# out; other tokens, e.g. "7-eleven" or "3.5mm", are searched for
+PERIOD_PATTERN = re.compile(r"^(\d{4}-\d{1,2}|(\d{4}-\d{2}-\d{2})?\.\.(\d{4}-\d{2}-\d{2})?)$")
+
+# A /find token that may be a year, e.g. "2024"
+YEAR_PATTERN = re.compile(r"^[1-9]\d{3}$")
+
+
+def create_search_indexes():
+    """
+    Creates the full-text indexes and their triggers when missing.
+
+    A new index is filled from the rows already stored. Triggers are created
+    again on every start, since rebuilding a table (see Storage.create_tables)
+    drops them.
+    """
+    with engine.begin() as connection:
+        existing = set(connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).scalars())
+        for index, (table, columns, _) in SEARCH_INDEXES.items():
+            names = ", ".join(columns)
+            new_values = ", ".join(f"new.{column}" for column in columns)
+            old_values = ", ".join(f"old.{column}" for column in columns)
+            if index not in existing:
+                # unicode61 folds case and accents, and splits words on punctuation, e.g. "#uber" matches uber
+                connection.execute(text(
+                    f"CREATE VIRTUAL TABLE {index} USING fts5({names}, content='{table}', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2')"))
+                connection.execute(text(f"INSERT INTO {index}({index}) VALUES ('rebuild')"))
+            # An external-content index is told the old text of a row to remove it
+            connection.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {index}_insert AFTER INSERT ON {table} BEGIN "
+                f"INSERT INTO {index}(rowid, {names}) VALUES (new.id, {new_values}); END"))
+            connection.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {index}_delete AFTER DELETE ON {table} BEGIN "
+                f"INSERT INTO {index}({index}, rowid, {names}) VALUES ('delete', old.id, {old_values}); END"))
+            connection.execute(text(
+                f"CREATE TRIGGER IF NOT EXISTS {index}_update AFTER UPDATE OF {names} ON {table} BEGIN "
+                f"INSERT INTO {index}({index}, rowid, {names}) VALUES ('delete', old.id, {old_values}); "
+                f"INSERT INTO {index}(rowid, {names}) VALUES (new.id, {new_values}); END"))
+
+
+def rebuild_search_indexes():
+    """
+    Refills the full-text indexes from the stored rows.
+
+    Returns:
+        int: Number of indexes rebuilt.
+    """
+    create_search_indexes()
+    with engine.begin() as connection:
+        for index in SEARCH_INDEXES:
+            connection.execute(text(f"INSERT INTO {index}({index}) VALUES ('rebuild')"))
+    return len(SEARCH_INDEXES)
+
+
+# Create the indexes next to the tables they search
+create_search_indexes()
+
+
+def parse_find_command(message_text):
+    """
+    Parses a /find command.
+
+    Args:
+        message_text (str): Message text such as "/find uber", "/find coffee work 2024" or
+            "/find taxi* 2024-01-01..2024-06-30". A period is a month "YYYY-MM", a
+            range of days or, next to other search words, a year "YYYY"; any other
+            token is a search word, so "/find 2024" searches for the number. Words
+            ending in "*" match any word they start.
+
+    Returns:
+        tuple: The search words, the first day and the day after the last day
+        (None for no limit) and a label of the period; raises ValueError on bad input.
+    """
+    words, period = [], None
+    for token in message_text.split()[1:]:
+        if PERIOD_PATTERN.match(token):
+            if period is not None:
+                raise ValueError(f"Unknown option: {token}")
+            period = token
+        else:
+            words.append(token)
+    if period is None:
+        # The last year-like word is the year when other words are left to search for,
+        # as in "/find coffee 2024"
+        for index, word in reversed(list(enumerate(words))):
+            others = words[:index] + words[index + 1:]
+            if YEAR_PATTERN.match(word) and any(other.strip('"*') for other in others):
+                words, period = others, f"{word}-01-01..{word}-12-31"
+                break
+    if not any(word.strip('"*') for word in words):
+        raise ValueError("Give the words to search for")
+    if period is None:
+        return words, None, None, "all time"
+    return (words, *parse_period(period))
+
+
+def match_expression(words):
+    """
+    Turns search words into an FTS5 query that matches entries containing all of them.
+
+    Each word is quoted, so FTS5 operators and punctuation in it are searched as
+    text; a trailing "*" is kept as a prefix search.
+
+    Args:
+        words (list): Words as typed, e.g. ["uber", "air*"].
+
+    Returns:
+        str: An FTS5 MATCH expression such as '"uber" "air"*'.
+    """
+    terms = []
+    for word in words:
+        prefix = word.endswith("*")
+        word = word.strip('"*').replace('"', '""')
+        if word:
+            terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def search_entries(chat_id, words, start=None, end=None, limit=LISTED_MATCHES):
+    """
+    Finds a chat's expenses and income whose text contains every search word.
+
+    Args:
+        chat_id (int): Telegram chat whose entries are searched.
+        words (list): Search words, as returned by parse_find_command().
+        start (date, optional): First day of the period; None for no limit.
+        end (date, optional): Day after the last day of the period; None for no limit.
+        limit (int, optional): Matching entries returned per table, the last recorded first.
+
+    Returns:
+        dict: Maps "expenses" and "income" to (entries, count, total): the last
+        recorded matching Expense or Income objects and the number and sum of all matches.
+    """
+    params = {
+        "query": match_expression(words),
+        "chat_id": chat_id,
+        "start": (start or date.min).isoformat(),
+        "end": (end or date.max).isoformat(),
+        "limit": limit,
+    }
+    results = {}
+    with session_scope() as session:
+        for index, (table, _, model) in SEARCH_INDEXES.items():
+            # CROSS JOIN keeps the index first: read the matching ids, then only those rows
+            matches = (f"FROM {index} CROSS JOIN {table} AS entry ON entry.id = {index}.rowid "
+                       f"WHERE {index} MATCH :query AND entry.chat_id = :chat_id "
+                       f"AND entry.date >= :start AND entry.date < :end")
+            count, total = session.execute(text(f"SELECT count(*) AS count, sum(entry.amount) AS total {matches}")
+                                           .columns(count=Integer, total=Money), params).one()
+            # Listed by id, which the index returns in order, so listing stops after the first matches
+            entries = session.query(model).from_statement(text(
+                f"SELECT entry.* {matches} ORDER BY {index}.rowid DESC LIMIT :limit")
+            ).params(**params).all() if count else []
+            results[table] = (entries, count, total if total is not None else to_money(0))
+    return results
+
+
+def format_search_results(chat_id, words, label, results):
+    """
+    Formats the results of a /find command.
+
+    Args:
+        chat_id (int): Telegram chat that searched.
+        words (list): Search words.
+        label (str): Label of the period searched.
+        results (dict): Results of search_entries().
+
+    Returns:
+        str: The number and sum of the matching expenses and income, and the last recorded of them.
+    """
+    query = " ".join(words)
+    expenses, expense_count, expense_total = results["expenses"]
+    earnings, income_count, income_total = results["income"]
+    if not expense_count and not income_count:
+        return f"Nothing matches \"{query}\" in {label}."
+
+    categories = get_categories(chat_id)
+    lines = []
+    if expense_count:
+        lines.append(f"Expenses matching \"{query}\" in {label}: ${expense_total:.2f} over {expense_count}")
+        for expense in expenses:
+            lines.append(f"{expense.date} {categories.name(expense.category)} - {expense.reason}: "
+                         f"${expense.amount:.2f} (ID {expense.id})")
+        if expense_count > len(expenses):
+            lines.append(f"... and {expense_count - len(expenses)} more")
+    if income_count:
+        if lines:
+            lines.append("")
+        lines.append(f"Income matching \"{query}\" in {label}: ${income_total:.2f} over {income_count}")
+        for earning in earnings:
+            lines.append(f"{earning.date} {earning.source}: ${earning.amount:.2f} (ID {earning.id})")
+        if income_count > len(earnings):
+            lines.append(f"... and {income_count - len(earnings)} more")
+    return "\n".join(lines)
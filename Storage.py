@@ -0,0 +1,565 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from sqlalchemy import (BigInteger, Column, Integer, String, TypeDecorator, create_engine, event, func, inspect, or_,
+                        select, text, tuple_)
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker, scoped_session
+
+# Single database shared by the expense, income and budget tables.
+# Override with the DBBUDGET environment variable (e.g. "sqlite:///other.db").
+DATABASE_URL = os.getenv('DBBUDGET', 'sqlite:///budget_tracker.db')
+
+# Legacy per-table database files, imported once by migrate_legacy_databases()
+LEGACY_DATABASES = {
+    "expenses": "expenses.db",
+    "income": "income.db",
+    "budget": "budget.db",
+}
+
+# Define the SQLAlchemy Base shared by every model
+Base = declarative_base()
+
+# One pooled engine for the whole application
+engine = create_engine(
+    DATABASE_URL,
+    pool_size=5,
+    max_overflow=10,
+    pool_pre_ping=True,
+    connect_args={"check_same_thread": False, "timeout": 30},
+)
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragma(dbapi_connection, connection_record):
+    """
+    Configures every new SQLite connection for concurrent readers and a single writer.
+
+    WAL lets the dashboard read while the bot writes, and NORMAL synchronous mode
+    is durable under WAL while skipping an fsync per commit.
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+class QueryCounter:
+    """
+    Counts the SQL statements executed by the current thread while it is active.
+
+    Used as a context manager around a command to measure how many queries it
+    runs, e.g. `with QueryCounter() as queries: check_budget(chat_id)` followed
+    by `queries.count`. Counters nest; every active counter sees each statement.
+
+    Attributes:
+        count (int): Statements executed since the counter was entered.
+    """
+
+    _active = threading.local()
+
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        self._counters().append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        self._counters().remove(self)
+
+    @classmethod
+    def _counters(cls):
+        if not hasattr(cls._active, "counters"):
+            cls._active.counters = []
+        return cls._active.counters
+
+    @classmethod
+    def record(cls):
+        """Counts one statement for the active counters of the current thread."""
+        for counter in getattr(cls._active, "counters", ()):
+            counter.count += 1
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _count_query(connection, cursor, statement, parameters, context, executemany):
+    QueryCounter.record()
+
+
+# Smallest money unit; amounts are rounded to it
+CENT = Decimal("0.01")
+
+
+def to_money(value):
+    """
+    Converts an amount to an exact Decimal rounded to the cent.
+
+    Args:
+        value (Decimal, int, float or str): Amount such as "12.5", 12.5 or Decimal("12.50").
+
+    Returns:
+        Decimal: The amount with two decimal places; raises ValueError when it is not a number.
+    """
+    try:
+        money = Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount: {value}")
+    if not money.is_finite():
+        raise ValueError(f"Invalid amount: {value}")
+    return money
+
+
+class Money(TypeDecorator):
+    """
+    Money amount stored as an INTEGER number of cents and read back as a Decimal.
+
+    Integer cents keep SUM() exact in SQLite, and the Decimal values keep the
+    arithmetic exact in Python. Values are converted with to_money() on the way in,
+    so ints, floats and strings are accepted as well. Expressions over Money
+    columns, such as func.sum(Expense.amount), are read back as Decimal too.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    # Converts a column that still holds REAL amounts from before integer cents
+    legacy_conversion = "CAST(ROUND({column} * 100) AS INTEGER)"
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return int(to_money(value).scaleb(2))
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return Decimal(int(value)).scaleb(-2)
+
+
+# Version key counting budget changes; a budget change affects every month
+BUDGET_VERSION_KEY = "budget"
+
+
+class DataVersion(Base):
+    """
+    Change counter per (chat, month).
+
+    Every transaction that changes a month's expenses or income increments the
+    month's counter, and budget changes increment the chat's BUDGET_VERSION_KEY
+    row. Readers in other processes, such as the dashboard, compare counters to
+    know whether anything they computed earlier is stale.
+
+    Attributes:
+        chat_id (int): Telegram chat that owns the data.
+        month (str): Month key in "YYYY-MM" format, or BUDGET_VERSION_KEY.
+        version (int): Number of committed changes.
+    """
+
+    __tablename__ = "data_versions"
+
+    chat_id = Column("chat_id", BigInteger, primary_key=True)
+    month = Column("month", String, primary_key=True)
+    version = Column("version", Integer, nullable=False, default=0)
+
+
+# Thread-local session registry; every request gets its own session
+Session = scoped_session(sessionmaker(bind=engine, expire_on_commit=False))
+
+
+@contextmanager
+def session_scope():
+    """
+    Provides a transactional session for the duration of one request.
+
+    The session commits on success, rolls back on error and is released back to
+    the pool afterwards. Nested calls on the same thread reuse the outer session,
+    so a report built from several queries runs on one connection.
+
+    Callbacks registered with after_commit() run once the outermost scope has
+    committed and released its session.
+
+    Yields:
+        session (obj): The SQLAlchemy session bound to the current thread.
+    """
+    session = Session()
+    if session.info.get("in_scope"):
+        yield session
+        return
+
+    session.info["in_scope"] = True
+    try:
+        yield session
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+    finally:
+        session.info.pop("in_scope", None)
+        callbacks = session.info.pop("after_commit", [])
+        Session.remove()
+    # Only reached on commit; a rolled back transaction drops its callbacks
+    for callback in callbacks:
+        callback()
+
+
+def after_commit(session, callback):
+    """
+    Runs a callback after the transaction of a session_scope() commits.
+
+    Used to act on data only once it is committed, e.g. to update in-memory
+    state from new rows, even when the change runs inside an outer scope.
+
+    Args:
+        session (obj): Session of the current session_scope().
+        callback (callable): Zero-argument function; not run when the transaction rolls back.
+    """
+    session.info.setdefault("after_commit", []).append(callback)
+
+
+def create_tables():
+    """
+    Creates missing tables, columns and indexes for every registered model.
+
+    create_all() never alters an existing table, so columns added to a model are
+    appended with ALTER TABLE (using their server default for existing rows), and
+    indexes are created or dropped to match the model. Tables marked with
+    info={"derived": True} only hold data recomputed from other tables; they are
+    dropped and recreated empty when their columns change.
+    """
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+
+            present = {column["name"]: column for column in inspector.get_columns(table.name)}
+            missing = [column for column in table.columns if column.name not in present]
+            retyped = [
+                column for column in table.columns
+                if column.name in present and isinstance(column.type, Money)
+                and not isinstance(present[column.name]["type"], Integer)
+            ]
+            if (missing or retyped) and table.info.get("derived"):
+                table.drop(connection)
+                continue
+            if retyped:
+                _rebuild_table(connection, inspector, table, present)
+                continue
+
+            for column in missing:
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                if column.server_default is not None:
+                    ddl += f" NOT NULL DEFAULT {column.server_default.arg}"
+                connection.execute(text(ddl))
+
+            # Drop our own indexes that the model no longer declares
+            declared = {index.name for index in table.indexes}
+            for index in inspector.get_indexes(table.name):
+                if index["name"].startswith("ix_") and index["name"] not in declared:
+                    connection.execute(text(f"DROP INDEX {index['name']}"))
+
+    Base.metadata.create_all(bind=engine)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+
+def _rebuild_table(connection, inspector, table, present):
+    """
+    Recreates a table with the model's column types and copies its rows over.
+
+    SQLite cannot change a column's type in place. Money columns that still hold
+    REAL amounts are converted to integer cents while copying; columns the old
+    table lacks get their server default. Runs in the caller's transaction.
+
+    Args:
+        connection (obj): Connection of the schema migration transaction.
+        inspector (obj): Inspector of the database before the migration.
+        table (Table): Model table to rebuild.
+        present (dict): Columns of the existing table, keyed by name.
+    """
+    old_name = f"{table.name}__old"
+    # Index names are global; drop the old ones so the new table can create them
+    for index in inspector.get_indexes(table.name):
+        connection.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+    connection.execute(text(f"ALTER TABLE {table.name} RENAME TO {old_name}"))
+    table.create(connection)
+
+    columns = [column for column in table.columns if column.name in present]
+    values = [
+        column.type.legacy_conversion.format(column=column.name)
+        if isinstance(column.type, Money) and not isinstance(present[column.name]["type"], Integer)
+        else column.name
+        for column in columns
+    ]
+    connection.execute(text(
+        f"INSERT INTO {table.name} ({', '.join(column.name for column in columns)}) "
+        f"SELECT {', '.join(values)} FROM {old_name}"
+    ))
+    connection.execute(text(f"DROP TABLE {old_name}"))
+
+
+def bump_data_version(session, chat_id, months):
+    """
+    Increments the change counter of some months of one chat.
+
+    Runs inside the caller's transaction, so the new version becomes visible
+    together with the data change.
+
+    Args:
+        session (obj): Session of the transaction that changes the data.
+        chat_id (int): Telegram chat whose data changed.
+        months (iterable): Month keys in "YYYY-MM" format, or BUDGET_VERSION_KEY.
+    """
+    for month in set(months):
+        statement = sqlite_insert(DataVersion).values(chat_id=chat_id, month=month, version=1)
+        statement = statement.on_conflict_do_update(
+            index_elements=["chat_id", "month"],
+            set_={"version": DataVersion.version + 1})
+        session.execute(statement)
+
+
+def get_data_version(chat_id, month, last_month=None):
+    """
+    Returns the version of the data shown for one chat and month (or range of months).
+
+    The month counters and the budget counter only ever grow, so their sum
+    changes whenever the entries of any month in the range or the budget change.
+
+    Args:
+        chat_id (int): Telegram chat whose data is read.
+        month (str): Month key in "YYYY-MM" format; the first month of a range.
+        last_month (str, optional): Last month key of a range. Defaults to month.
+
+    Returns:
+        int: The data version; 0 when nothing was ever recorded.
+    """
+    with session_scope() as session:
+        version = session.query(func.sum(DataVersion.version)).filter(
+            DataVersion.chat_id == chat_id,
+            or_(DataVersion.month == BUDGET_VERSION_KEY,
+                DataVersion.month.between(month, last_month or month))
+        ).scalar()
+    return version or 0
+
+
+def month_window(year=None, month=None):
+    """
+    Returns the half-open date range [start, end) covering one calendar month.
+
+    Filtering with `column >= start, column < end` lets SQLite answer monthly
+    queries from an index on the date column instead of scanning every row.
+
+    Args:
+        year (int, optional): Year of the month. Defaults to the current year.
+        month (int, optional): Month number (1-12). Defaults to the current month.
+
+    Returns:
+        tuple: The first day of the month and the first day of the next month.
+    """
+    if year is None or month is None:
+        today = date.today()
+        year = today.year
+        month = today.month
+
+    start = date(year, month, 1)
+    end = date(year + 1, 1, 1) if month == 12 else date(year, month + 1, 1)
+    return start, end
+
+
+def month_key(day):
+    """
+    Returns the "YYYY-MM" key of the month containing a date.
+
+    Args:
+        day (date): Any day of the month.
+
+    Returns:
+        str: The month key used by the monthly aggregate table.
+    """
+    return f"{day:%Y-%m}"
+
+
+def parse_period(token=None, today=None):
+    """
+    Parses the period argument of a report command into a half-open date range.
+
+    Args:
+        token (str, optional): "YYYY-MM" for one month, or "YYYY-MM-DD..YYYY-MM-DD"
+            for a range of days; either end of a range may be left out. Defaults to
+            the current month.
+        today (date, optional): Day an open range ends on. Defaults to today.
+
+    Returns:
+        tuple: The first day, the day after the last day and a label such as
+        "2024-03" or "2024-01-01..2024-03-31"; raises ValueError on a bad period.
+    """
+    today = today or date.today()
+    if token is None:
+        start, end = month_window(today.year, today.month)
+        return start, end, month_key(start)
+    try:
+        if ".." not in token:
+            year, month = (int(part) for part in token.split("-"))
+            start, end = month_window(year, month)
+            return start, end, month_key(start)
+        first, last = token.split("..", 1)
+        start = date.fromisoformat(first) if first else date.min
+        last = date.fromisoformat(last) if last else today
+    except ValueError:
+        raise ValueError("Period must be YYYY-MM or YYYY-MM-DD..YYYY-MM-DD")
+    if last < start:
+        raise ValueError("The period ends before it starts")
+    return start, last + timedelta(days=1), f"{first}..{last}"
+
+
+# Entries shown per page of a chat's history
+PAGE_SIZE = 5
+
+
+def keyset_page(query, date_column, id_column, cursor=None, newer=False, page_size=PAGE_SIZE):
+    """
+    Reads one page of entries ordered newest first by (date, id), next to a cursor entry.
+
+    The page starts right after the cursor's (date, id) key instead of skipping
+    rows with OFFSET, so the (chat_id, date) index (which ends in the rowid id)
+    reaches any page with one seek, however deep into the history it is.
+
+    Args:
+        query (Query): Query of one chat's entries, e.g. session.query(Expense).filter(...).
+        date_column (Column): Date column of the entries.
+        id_column (Column): Integer primary key of the entries.
+        cursor (tuple, optional): (date, id) of the entry the page continues from;
+            None for the newest page.
+        newer (bool, optional): Read the entries newer than the cursor instead of older.
+        page_size (int, optional): Entries per page.
+
+    Returns:
+        tuple: The page's entries, newest first, and whether more entries lie
+        beyond the page in the direction read.
+    """
+    key = tuple_(date_column, id_column)
+    if cursor is not None:
+        bound = tuple_(*cursor)
+        query = query.filter(key > bound if newer else key < bound)
+    if newer:
+        query = query.order_by(date_column.asc(), id_column.asc())
+    else:
+        query = query.order_by(date_column.desc(), id_column.desc())
+    entries = query.limit(page_size + 1).all()
+    more = len(entries) > page_size
+    entries = entries[:page_size]
+    if newer:
+        entries.reverse()
+    return entries, more
+
+
+class LegacyRow(Base):
+    """
+    A row of a legacy database file that was migrated, so migrating again skips it.
+
+    Attributes:
+        table_name (str): Table the row was copied to.
+        chat_id (int): Telegram chat the row was assigned to.
+        legacy_id (int): Id of the row in the legacy file.
+        row_id (int): Id of the copy; None when the copy was ignored, e.g. a
+            budget category the chat already had.
+    """
+
+    __tablename__ = "legacy_rows"
+
+    table_name = Column("table_name", String, primary_key=True)
+    chat_id = Column("chat_id", BigInteger, primary_key=True)
+    legacy_id = Column("legacy_id", Integer, primary_key=True)
+    row_id = Column("row_id", Integer, nullable=True)
+
+
+def migrate_legacy_databases(legacy_databases=None, chat_id=0):
+    """
+    Imports rows from the old expenses.db, income.db and budget.db files.
+
+    Rows get new ids, so they never collide with rows already in the shared
+    database, e.g. entries made before the migration or another legacy set
+    migrated for another chat. Each migrated row is recorded in legacy_rows by
+    its legacy id, so running the migration twice for a chat does not duplicate
+    data. Missing legacy files are skipped. The legacy files hold a single shared
+    ledger, so every imported row is assigned to one chat. Budget categories the
+    chat already has are kept. Hashtags in the reasons and notes of imported
+    expenses are linked as their tags.
+
+    Args:
+        legacy_databases (dict, optional): Maps table name to legacy file path.
+            Defaults to LEGACY_DATABASES.
+        chat_id (int, optional): Telegram chat id that owns the imported rows.
+
+    Returns:
+        dict: Number of rows imported per table.
+    """
+    # Make sure every model is registered before creating the tables
+    import Expense, Income, Budget  # noqa: F401
+    create_tables()
+
+    if legacy_databases is None:
+        legacy_databases = LEGACY_DATABASES
+
+    imported = {}
+    for table, path in legacy_databases.items():
+        if not os.path.exists(path):
+            imported[table] = 0
+            continue
+
+        # Read the legacy rows with the plain sqlite3 driver
+        legacy = sqlite3.connect(path)
+        try:
+            cursor = legacy.execute(f"SELECT * FROM {table}")
+            columns = [column[0] for column in cursor.description]
+            rows = [dict(zip(columns, row), chat_id=chat_id) for row in cursor.fetchall()]
+            # The legacy files store amounts as REAL; the shared database stores cents
+            if "amount" in columns:
+                for row in rows:
+                    row["amount"] = Money().process_bind_param(row["amount"], None)
+            if "chat_id" not in columns:
+                columns.append("chat_id")
+            columns.remove("id")
+        except sqlite3.OperationalError:
+            rows = []
+        finally:
+            legacy.close()
+
+        if not rows:
+            imported[table] = 0
+            continue
+
+        # Inserted without the legacy id; OR IGNORE keeps a budget category the chat already has
+        statement = text(
+            f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+            f"VALUES ({', '.join(':' + column for column in columns)})"
+        )
+        with session_scope() as session:
+            migrated = set(session.execute(select(LegacyRow.legacy_id).where(
+                LegacyRow.table_name == table, LegacyRow.chat_id == chat_id)).scalars())
+            connection = session.connection()
+            copies = []
+            for row in rows:
+                if row["id"] in migrated:
+                    continue
+                # One row at a time, since the id of each copy is recorded
+                result = connection.execute(statement, row)
+                copies.append({"table_name": table, "chat_id": chat_id, "legacy_id": row["id"],
+                               "row_id": result.lastrowid if result.rowcount else None})
+            if copies:
+                session.execute(sqlite_insert(LegacyRow), copies)
+            imported[table] = sum(copy["row_id"] is not None for copy in copies)
+            # Raw inserts skip add_expenses, which links the hashtags of new expenses
+            if table == "expenses" and imported[table]:
+                Expense.store_inserted_expense_tags(session, chat_id)
+
+    return imported
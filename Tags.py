@@ -0,0 +1,186 @@
+import re
+from sqlalchemy import BigInteger, Column, Date, Index, Integer, String, delete, or_, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from Storage import Base, create_tables, parse_period
+
+# Free-form tags on expenses, written as hashtags in the reason or note of an
+# entry, e.g. "/s F, latte #coffee #work, 4.50". Tags nest with "/": an expense
+# tagged #travel/japan also counts towards #travel. Tag names are stored once
+# per chat in the tags table and linked to expenses through expense_tags, so
+# summing a tag reads its links through an index instead of scanning reasons.
+
+# A hashtag starts with a letter; nested tags separate their parts with "/"
+TAG_PATTERN = re.compile(r"(?<![\w#])#([^\W\d_][\w-]*(?:/[\w-]+)*)")
+
+# Separates the parts of a nested tag
+TAG_SEPARATOR = "/"
+
+
+class Tag(Base):
+    """
+    A tag used by a chat.
+
+    Attributes:
+        id (int): Unique identifier, referenced by expense_tags.
+        chat_id (int): Telegram chat that uses the tag.
+        name (str): Lower-case tag without the "#", e.g. "coffee" or "travel/japan".
+    """
+
+    __tablename__ = "tags"
+    __table_args__ = (
+        # Looks a tag up by name, and a nested tag's subtree by name range
+        Index("ix_tags_chat_name", "chat_id", "name", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    chat_id = Column("chat_id", BigInteger, nullable=False)
+    name = Column("name", String, nullable=False)
+
+
+class ExpenseTag(Base):
+    """
+    Link between an expense and one of its tags.
+
+    The link carries the expense's date (expenses are never edited), and the
+    primary key leads with the tag and the date, so the expenses of a tag in a
+    period are one index range. The expense index removes an expense's links
+    when it is deleted.
+
+    Attributes:
+        tag_id (int): Id of the tag.
+        date (Date): Date of the tagged expense.
+        expense_id (int): Id of the tagged expense.
+    """
+
+    __tablename__ = "expense_tags"
+    __table_args__ = (Index("ix_expense_tags_expense", "expense_id"),)
+
+    tag_id = Column("tag_id", Integer, primary_key=True)
+    date = Column("date", Date, primary_key=True)
+    expense_id = Column("expense_id", Integer, primary_key=True)
+
+
+# Create the tag tables in the shared database
+create_tables()
+
+
+def parse_tags(*texts):
+    """
+    Returns the hashtags found in some texts.
+
+    Args:
+        *texts (str): Texts such as the reason and note of an expense; None is skipped.
+
+    Returns:
+        list: Distinct lower-case tag names without the "#", in the order they appear.
+    """
+    tags = []
+    for text in texts:
+        for tag in TAG_PATTERN.findall(text or ""):
+            tag = tag.lower()
+            if tag not in tags:
+                tags.append(tag)
+    return tags
+
+
+def normalize_tag(tag):
+    """
+    Returns the stored name of a tag typed by the user, e.g. "#Travel" -> "travel".
+
+    Args:
+        tag (str): Tag with or without the leading "#".
+
+    Returns:
+        str: The lower-case tag name; raises ValueError when it is not a valid tag.
+    """
+    tags = parse_tags("#" + tag.strip().lstrip("#"))
+    if len(tags) != 1 or len(tags[0]) != len(tag.strip().lstrip("#")):
+        raise ValueError(f"Invalid tag {tag}. Tags start with a letter, e.g. #coffee or #travel/japan")
+    return tags[0]
+
+
+def parse_tag_sum_command(text):
+    """
+    Parses a /tag_sum command.
+
+    Args:
+        text (str): Message text such as "/tag_sum", "/tag_sum #travel 2024-03" or
+            "/tag_sum coffee 2024-01-01..2024-06-30".
+
+    Returns:
+        tuple: The lower-case tag (None for every tag), the first day, the day after
+        the last day and a label of the period; raises ValueError on bad input.
+    """
+    tag, period = None, None
+    for token in text.split()[1:]:
+        # Periods start with a digit or "..", tags with a letter
+        if token[0].isdigit() or token.startswith(".."):
+            if period is not None:
+                raise ValueError(f"Unknown option: {token}")
+            period = token
+        elif tag is None:
+            tag = normalize_tag(token)
+        else:
+            raise ValueError(f"Unknown option: {token}")
+    return (tag, *parse_period(period))
+
+
+def tag_subtree_filter(chat_id, tag):
+    """
+    Returns the SQL condition selecting a tag and every tag nested below it.
+
+    Args:
+        chat_id (int): Telegram chat that uses the tag.
+        tag (str): Lower-case tag name.
+
+    Returns:
+        obj: A condition on the tags table served by the (chat_id, name) index.
+    """
+    # Nested names start with tag + "/"; "0" is the character after the separator.
+    # One range keeps the index usable; it also holds names like "tag-x", excluded after.
+    return (Tag.chat_id == chat_id) & (Tag.name >= tag) & (Tag.name < tag + "0") & or_(
+        Tag.name == tag, Tag.name >= tag + TAG_SEPARATOR)
+
+
+def tag_ancestors(tag):
+    """Returns a tag and the tags it is nested in, e.g. "travel/japan" -> ["travel", "travel/japan"]."""
+    parts = tag.split(TAG_SEPARATOR)
+    return [TAG_SEPARATOR.join(parts[:depth]) for depth in range(1, len(parts) + 1)]
+
+
+def store_expense_tags(session, chat_id, expenses):
+    """
+    Stores the tags of new expenses and links them to the expenses.
+
+    Runs in the transaction that inserts the expenses, after they were flushed
+    and have ids. Missing tag names are inserted with one statement, the ids of
+    every name are read with one query and the links written with one more.
+
+    Args:
+        session (obj): Session of the transaction that adds the expenses.
+        chat_id (int): Telegram chat that owns the expenses.
+        expenses (list): New Expense objects; their tag_names are stored.
+    """
+    names = {name for expense in expenses for name in expense.tag_names}
+    if not names:
+        return
+    session.execute(
+        sqlite_insert(Tag).on_conflict_do_nothing(),
+        [{"chat_id": chat_id, "name": name} for name in names])
+    tag_ids = dict(session.execute(
+        select(Tag.name, Tag.id).where(Tag.chat_id == chat_id, Tag.name.in_(names))).all())
+    session.execute(
+        sqlite_insert(ExpenseTag).on_conflict_do_nothing(),
+        [{"tag_id": tag_ids[name], "date": expense.date, "expense_id": expense.id}
+         for expense in expenses for name in expense.tag_names])
+
+
+def delete_expense_tags(session, expense_ids):
+    """
+    Removes the tag links of deleted expenses; runs in the transaction that deletes them.
+
+    Args:
+        session (obj): Session of the transaction that deletes the expenses.
+        expense_ids (list): Ids of the deleted expenses.
+    """
+    session.execute(delete(ExpenseTag).where(ExpenseTag.expense_id.in_(expense_ids)))
@@ -1,75 +1,338 @@
+import json
+import os
+from datetime import date
 import dash
-from dash import dcc, html
+from dash import dcc, html, Input, Output, State
+from dash.exceptions import PreventUpdate
 import plotly.graph_objs as go
+from plotly.utils import PlotlyJSONEncoder
 import dash_table
+from flask import jsonify
+from Cache import LRUCache
 from Expense import Expense
 from Income import income_summarize_monthly
 from Budget import get_budget
-from Data_Processing import overall_spending_vs_budget, category_spending_vs_budget
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from Categories import get_categories
+from Data_Processing import category_lines, get_expense_months, month_snapshot, spending_trends
+from Storage import get_data_version, month_key, session_scope
 
 # Setup Dash app
 app = dash.Dash(__name__)
 
-# SQLAlchemy setup
-engine = create_engine('sqlite:///expenses.db', echo=True)
-Session = sessionmaker(bind=engine)
-session = Session()
+# Telegram chat shown by the dashboard
+DASHBOARD_CHAT_ID = int(os.getenv('CHATBUDGET', '0'))
 
-category_dict = {
-    "G": "Groceries",
-    "B": "Bill and Housing",
-    "F": "Fun (Shopping and Eating out)",
-    "W": "Wellness (Education and Health)",
-    "M": "Miscellaneous"
-}
+# How often open pages check whether the data changed
+REFRESH_INTERVAL_MS = 5000
+
+# Months shown by the trend charts when the page opens
+DEFAULT_TREND_MONTHS = 12
+
+# Serialized dashboard outputs keyed by (month, chat, data version). Viewers of an
+# unchanged month share one computation and one serialization of the figures.
+FIGURE_CACHE_SIZE = 128
+figure_cache = LRUCache(maxsize=FIGURE_CACHE_SIZE)
 
 # Visualization function
-def visual_by_month():
+def visual_by_month(chat_id=DASHBOARD_CHAT_ID, month=None):
     """
-    Visualizes the monthly spending and budget data.
+    Computes the tables and figures of the monthly spending and budget page.
+
+    Args:
+        chat_id (int, optional): Telegram chat whose data is shown. Defaults to the
+            CHATBUDGET environment variable.
+        month (str, optional): Month key in "YYYY-MM" format. Defaults to the current month.
+
+    Returns:
+        tuple: The data version the page was computed from, followed by the summary
+            table rows, the category table rows, the total pie, the income bar chart,
+            the category pie graphs, the two category bar charts and the category treemap.
     """
-    # Get overall spending vs budget data
-    overall_message, overall_data = overall_spending_vs_budget()
+    month = month or month_key(date.today())
+    year, month_number = (int(part) for part in month.split("-"))
+
+    # Run every report query of this page on one session and connection
+    with session_scope():
+        # Read the version before the data: a change committed in between only
+        # makes the next refresh recompute once more
+        version = get_data_version(chat_id, month)
+
+        # Budget and spending per category and in total, from one query
+        snapshot = month_snapshot(chat_id, month)
 
-    # Get category-specific spending vs budget data
-    category_message, category_data = category_spending_vs_budget()
+        a, total_income = income_summarize_monthly(chat_id, year, month_number)
+
+        # Category names; reloaded when the version changed, as the bot process renames them
+        category_names = get_categories(chat_id, version)
 
     # Extract overall data
-    total_budget = overall_data[0][0]
-    total_spent = overall_data[0][1]
-    overall_percentage_spent = overall_data[0][2]
-    overspent_amount = overall_data[0][3]
-    remaining_budget = total_budget - total_spent
+    total_budget = snapshot.budget
+    total_spent = snapshot.spent
+    overall_percentage_spent = snapshot.percentage_spent
+    overspent_amount = snapshot.overspent
+    remaining_budget = snapshot.remaining
     status_spent = (
         "You are within the budget."
         if overspent_amount == 0
         else f"OVERSPENT! (${overspent_amount:.2f} over)"
     )
 
-    # Extract category data
-    categories = [category_dict.get(cat, cat) for cat in category_data[:, 0]]
-    category_budget = category_data[:, 1]
-    category_spent = category_data[:, 2]
-    category_remaining = category_budget - category_spent
+    # Extract category data (float64 columns of the budgeted categories)
+    budgeted = snapshot.budgeted()
+    category_codes = budgeted.category
+    categories = [category_names.name(cat) for cat in category_codes]
+    category_budget = budgeted.budget
+    category_spent = budgeted.spent
+    category_remaining = budgeted.remaining
+
+    # Overall Summary
+    summary_rows = [
+        {"Metric": "Total Budget", "Value": f"${total_budget:.2f}"},
+        {"Metric": "Total Spent", "Value": f"${total_spent:.2f}"},
+        {"Metric": "Percentage Spent", "Value": f"{overall_percentage_spent:.2f}%"},
+        {"Metric": "Status", "Value": status_spent},
+    ]
+
+    # Category Spending vs Budget
+    category_rows = [
+        {
+            "Category": category_names.name(line.category),
+            "Budgeted": f"${line.budget:.2f}",
+            "Spent": f"${line.spent:.2f}",
+            "% Spent": f"{line.percentage_spent:.2f}%",
+            "Status": (
+                f"OVERSPENT! (${line.overspent:.2f} over)" if line.overspent
+                else "Within Budget"
+            )
+        }
+        for line in category_lines(budgeted)
+    ]
+
+    # Total Spending vs Total Budget (Pie Chart)
+    total_pie = {
+        "data": [
+            go.Pie(
+                labels=["Spent", "Remaining"],
+                values=[float(total_spent), float(remaining_budget)],
+                hole=0.1,
+                marker_colors=["orange", "lightblue"]
+            )
+        ],
+        "layout": go.Layout(
+            title="Total Spending vs Total Budget",
+            showlegend=True
+        )
+    }
+
+    # Income vs Total Spending (Bar Chart)
+    income_bar = {
+        "data": [
+            go.Bar(
+                name="Income", 
+                x=["Income"], 
+                y=[float(total_income)], 
+                marker_color="green"
+            ),
+            go.Bar(
+                name="Total Spending", 
+                x=["Spending"], 
+                y=[float(total_spent)], 
+                marker_color="red"
+            )
+        ],
+        "layout": go.Layout(
+            title="Income vs Total Spending",
+            barmode="group",
+            xaxis={"title": "Category"},
+            yaxis={"title": "Amount ($)"},
+            showlegend=True
+        )
+    }
+
+    # Category Pie Charts (one per budgeted category, smaller size)
+    category_pies = [
+        dcc.Graph(
+            id=f"category-pie-{i}",
+            figure={
+                "data": [
+                    go.Pie(
+                        labels=["Spent", "Remaining"],
+                        values=[spent, max(0, budget - spent)],
+                        hole=0.1,
+                        marker_colors=["red" if spent > budget else "orange", "lightblue"]
+                    )
+                ],
+                "layout": go.Layout(
+                    title=f"{category_names.name(cat)}",
+                    showlegend=True,
+                )
+            }, style={"height": "300px", "width": "300px"}
+        )
+        for i, (cat, spent, budget) in enumerate(zip(category_codes, category_spent, category_budget))
+    ]
+
+    # Category-Specific Spending vs Budget (Bar Chart)
+    category_bars = {
+        "data": [
+            go.Bar(name="Spent", x=categories, y=category_spent, marker_color="orange"),
+            go.Bar(name="Budget", x=categories, y=category_budget, marker_color="lightblue")
+        ],
+        "layout": go.Layout(
+            title="Category-Specific Spending vs Budget",
+            barmode="group",
+            xaxis={"title": "Categories"},
+            yaxis={"title": "Amount ($)"},
+            showlegend=True
+        )
+    }
+
+    # Remaining Budget by Category (Bar Chart)
+    remaining_bars = {
+        "data": [
+            go.Bar(
+                name="Remaining Budget",
+                x=categories,
+                y=category_remaining,
+                marker_color="lightgreen",
+                text=category_remaining,
+                textposition="outside"
+            )
+        ],
+        "layout": go.Layout(
+            title="Remaining Budget by Category",
+            xaxis={"title": "Categories"},
+            yaxis={"title": "Amount ($)", "range": [-300, 800]},
+            showlegend=True
+        )
+    }
+
+    # Spending by Category Tree (Treemap): subcategories nested inside their parent,
+    # each box sized by its subtree's spending; clicking a category drills down into it
+    own_spent = {line.category: line.spent for line in category_lines(snapshot.recorded())}
+    tree_codes = list(category_names.rollup(own_spent))
+    category_tree = {
+        "data": [
+            go.Treemap(
+                ids=tree_codes,
+                labels=[category_names.name(code) for code in tree_codes],
+                parents=[category_names.parent(code) or "" for code in tree_codes],
+                values=[own_spent.get(code, 0.0) for code in tree_codes],
+                branchvalues="remainder",
+                textinfo="label+value+percent root",
+                maxdepth=3
+            )
+        ],
+        "layout": go.Layout(
+            title="Spending by Category Tree",
+            margin={"t": 50, "l": 10, "r": 10, "b": 10}
+        )
+    }
+
+    return (version, summary_rows, category_rows, total_pie, income_bar,
+            category_pies, category_bars, remaining_bars, category_tree)
+
+
+# Trend charts over a date range
+def visual_trends(chat_id, start, end, version=None):
+    """
+    Computes the trend charts of a date range: spending per category, income
+    against spending and budget adherence, bucketed by day, week or month.
+
+    Args:
+        chat_id (int): Telegram chat whose data is shown.
+        start (date): First day of the range.
+        end (date): Last day of the range (inclusive).
+        version (int, optional): Data version of the range, so renamed categories are picked up.
+
+    Returns:
+        tuple: The category trend, income vs spending trend and budget adherence figures.
+    """
+    trends = spending_trends(chat_id, start, end)
+    category_names = get_categories(chat_id, version)
+    buckets = trends["buckets"]
+    per = trends["granularity"]
+
+    # Spending per Category over Time (Stacked Area Chart)
+    category_trend = {
+        "data": [
+            go.Scatter(name=category_names.name(cat), x=buckets, y=values, mode="lines", stackgroup="spent")
+            for cat, values in sorted(trends["by_category"].items())
+        ],
+        "layout": go.Layout(
+            title=f"Spending per Category by {per.capitalize()}",
+            xaxis={"title": per.capitalize()},
+            yaxis={"title": "Amount ($)"},
+            showlegend=True
+        )
+    }
+
+    # Income vs Spending over Time (Bar Chart)
+    income_trend = {
+        "data": [
+            go.Bar(name="Income", x=buckets, y=trends["income"], marker_color="green"),
+            go.Bar(name="Spending", x=buckets, y=trends["spent"], marker_color="red")
+        ],
+        "layout": go.Layout(
+            title=f"Income vs Spending by {per.capitalize()}",
+            barmode="group",
+            xaxis={"title": per.capitalize()},
+            yaxis={"title": "Amount ($)"},
+            showlegend=True
+        )
+    }
 
-    a, total_income = income_summarize_monthly()
+    # Budget Adherence over Time (Line Chart, 100% = spending exactly the pro-rated budget)
+    adherence_trend = {
+        "data": [
+            go.Scatter(name="% of Budget Spent", x=buckets, y=trends["adherence"], mode="lines+markers",
+                       marker_color="orange"),
+            go.Scatter(name="Budget", x=[buckets[0], buckets[-1]], y=[100, 100], mode="lines",
+                       line={"dash": "dash", "color": "gray"})
+        ],
+        "layout": go.Layout(
+            title=f"Budget Adherence by {per.capitalize()}",
+            xaxis={"title": per.capitalize()},
+            yaxis={"title": "% of Budget Spent"},
+            showlegend=True
+        )
+    }
 
-    # Dash Layout
-    app.layout = html.Div([
+    return category_trend, income_trend, adherence_trend
+
+
+def default_trend_range(today=None):
+    """Returns (first day, last day) of the last DEFAULT_TREND_MONTHS months, including this one."""
+    today = today or date.today()
+    months_back = today.year * 12 + today.month - 1 - (DEFAULT_TREND_MONTHS - 1)
+    return date(months_back // 12, months_back % 12 + 1, 1), today
+
+
+# Dash Layout
+# Built for every page load so the month list is current. The tables and graphs start
+# empty; refresh_dashboard and refresh_trends fill them and keep them up to date.
+def serve_layout():
+    current_month = month_key(date.today())
+    months = get_expense_months(DASHBOARD_CHAT_ID)
+    if current_month not in months:
+        months.insert(0, current_month)
+    trend_start, trend_end = default_trend_range()
+
+    return html.Div([
 
         # Overall Summary
         html.Div([
             html.H1("Monthly Spending Summary", style={"textAlign": "center"}),
+            dcc.Dropdown(
+                id="month-picker",
+                options=[{"label": month, "value": month} for month in months],
+                value=current_month,
+                clearable=False,
+                style={"width": "200px", "margin": "0 auto 20px auto"},
+            ),
             dash_table.DataTable(
+                id="summary-table",
                 columns=[{"name": "Metric", "id": "Metric"}, {"name": "Value", "id": "Value"}],
-                data=[
-                    {"Metric": "Total Budget", "Value": f"${total_budget:.2f}"},
-                    {"Metric": "Total Spent", "Value": f"${total_spent:.2f}"},
-                    {"Metric": "Percentage Spent", "Value": f"{overall_percentage_spent:.2f}%"},
-                    {"Metric": "Status", "Value": status_spent},
-                ],
+                data=[],
                 style_table={"overflowX": "auto", "width": "60%", "margin": "auto"},
                 style_header={"backgroundColor": "lightblue", "fontWeight": "bold", "textAlign": "center"},
                 style_cell={"textAlign": "center", "padding": "10px", "fontSize": "16px"},
@@ -88,19 +351,7 @@ def visual_by_month():
                     {"name": "% Spent", "id": "% Spent"},
                     {"name": "Status", "id": "Status"}
                 ],
-                data=[
-                    {
-                        "Category": category_dict.get(cat, cat),
-                        "Budgeted": f"${budget:.2f}",
-                        "Spent": f"${spent:.2f}",
-                        "% Spent": f"{(spent / budget) * 100:.2f}%",
-                        "Status": (
-                            f"OVERSPENT! (${spent - budget:.2f} over)" if spent > budget
-                            else "Within Budget"
-                        )
-                    }
-                    for cat, budget, spent in zip(category_data[:, 0], category_budget, category_spent)
-                ],
+                data=[],
                 style_table={"overflowX": "auto", "width": "100%", "margin": "auto"},
                 style_header={"backgroundColor": "lightblue", "fontWeight": "bold", "textAlign": "center"},
                 style_cell={"textAlign": "center", "padding": "10px", "fontSize": "14px"},
@@ -112,77 +363,18 @@ def visual_by_month():
 
             # Graphs side by side
             html.Div([
-                # Total Spending vs Total Budget (Pie Chart)
                 dcc.Graph(
                     id="total-spending-vs-budget",
-                    figure={
-                        "data": [
-                            go.Pie(
-                                labels=["Spent", "Remaining"],
-                                values=[total_spent, remaining_budget],
-                                hole=0.1,
-                                marker_colors=["orange", "lightblue"]
-                            )
-                        ],
-                        "layout": go.Layout(
-                            title="Total Spending vs Total Budget",
-                            showlegend=True
-                        )
-                    },
                     style={"width": "48%", "display": "inline-block", "padding": "10px"}
                 ),
-
-                # Income vs Total Spending (Bar Chart)
                 dcc.Graph(
                     id="total-spending-vs-income",
-                    figure={
-                        "data": [
-                            go.Bar(
-                                name="Income", 
-                                x=["Income"], 
-                                y=[total_income], 
-                                marker_color="green"
-                            ),
-                            go.Bar(
-                                name="Total Spending", 
-                                x=["Spending"], 
-                                y=[total_spent], 
-                                marker_color="red"
-                            )
-                        ],
-                        "layout": go.Layout(
-                            title="Income vs Total Spending",
-                            barmode="group",
-                            xaxis={"title": "Category"},
-                            yaxis={"title": "Amount ($)"},
-                            showlegend=True
-                        )
-                    }, 
-                     style={"height": "500px", "width": "700px"}
+                    style={"height": "500px", "width": "700px"}
                 ),
             ], style={"display": "flex", "justifyContent": "space-between", "flexWrap": "wrap", "marginTop": "20px"}),
 
-            # Category Pie Charts (5 charts in a block, smaller size)
-            html.Div([
-                dcc.Graph(
-                    id=f"category-pie-{i}",
-                    figure={
-                        "data": [
-                            go.Pie(
-                                labels=["Spent", "Remaining"],
-                                values=[spent, max(0, budget - spent)],
-                                hole=0.1,
-                                marker_colors=["red" if spent > budget else "orange", "lightblue"]
-                            )
-                        ],
-                        "layout": go.Layout(
-                            title=f"{category_dict.get(cat, cat)}",
-                            showlegend=True,
-                        )
-                    }, style={"height": "300px", "width": "300px"}
-                )
-                for i, (cat, spent, budget) in enumerate(zip(category_data[:, 0], category_spent, category_budget))
-            ], style={
+            # Category Pie Charts
+            html.Div(id="category-pies", style={
                 "display": "flex", 
                 "flexWrap": "wrap", 
                 "justifyContent": "space-between", 
@@ -190,61 +382,139 @@ def visual_by_month():
                 "marginTop": "20px"
             }),
 
-            # Category-Specific Spending vs Budget (Bar Chart)
             html.Div(
-                dcc.Graph(
-                    id="category-spending-vs-budget",
-                    figure={
-                        "data": [
-                            go.Bar(name="Spent", x=categories, y=category_spent, marker_color="orange"),
-                            go.Bar(name="Budget", x=categories, y=category_budget, marker_color="lightblue")
-                        ],
-                        "layout": go.Layout(
-                            title="Category-Specific Spending vs Budget",
-                            barmode="group",
-                            xaxis={"title": "Categories"},
-                            yaxis={"title": "Amount ($)"},
-                            showlegend=True
-                        )
-                    },
-                    style={"height": "500px", "width": "700px"}
-                ),
+                dcc.Graph(id="category-spending-vs-budget", style={"height": "500px", "width": "700px"}),
                 style={"width": "48%", "display": "inline-block", "padding": "10px"}
             ),
 
-            # Remaining Budget by Category (Bar Chart)
             html.Div(
-                dcc.Graph(
-                    id="remaining-budget",
-                    figure={
-                        "data": [
-                            go.Bar(
-                                name="Remaining Budget",
-                                x=categories,
-                                y=category_remaining,
-                                marker_color="lightgreen",
-                                text=category_remaining,
-                                textposition="outside"
-                            )
-                        ],
-                        "layout": go.Layout(
-                            title="Remaining Budget by Category",
-                            xaxis={"title": "Categories"},
-                            yaxis={"title": "Amount ($)", "range": [-300, 800]},
-                            showlegend=True
-                        )
-                    },
-                    style={"height": "500px", "width": "700px"}
-                ),
+                dcc.Graph(id="remaining-budget", style={"height": "500px", "width": "700px"}),
                 style={"width": "48%", "display": "inline-block", "padding": "10px"}
-            )
+            ),
 
-        ])  # End of graphs container
+            # Category tree; click a category to see its subcategories
+            dcc.Graph(id="category-treemap", style={"height": "600px"})
+
+        ]),  # End of graphs container
+
+        # Trends over a date range
+        html.Div([
+            html.H3("Trends", style={"textAlign": "center", "marginBottom": "10px"}),
+            dcc.DatePickerRange(
+                id="trend-range",
+                start_date=trend_start,
+                end_date=trend_end,
+                display_format="YYYY-MM-DD",
+                style={"display": "flex", "justifyContent": "center", "marginBottom": "10px"},
+            ),
+            dcc.Graph(id="category-trend", style={"height": "500px"}),
+            dcc.Graph(id="income-trend", style={"height": "500px"}),
+            dcc.Graph(id="budget-adherence-trend", style={"height": "500px"}),
+        ], style={"marginTop": "30px"}),
+
+        # Polls the data version; fires once immediately on page load
+        dcc.Interval(id="refresh-interval", interval=REFRESH_INTERVAL_MS),
+        # (month, data version) and (start, end, data version) currently shown by this page
+        dcc.Store(id="shown-version"),
+        dcc.Store(id="shown-trend-version"),
 
     ])  # End of main layout
 
-if __name__ == '__main__':
-    visual_by_month()  # Initialize the layout
 
+app.layout = serve_layout
+
+
+@app.callback(
+    Output("summary-table", "data"),
+    Output("category-spending-table", "data"),
+    Output("total-spending-vs-budget", "figure"),
+    Output("total-spending-vs-income", "figure"),
+    Output("category-pies", "children"),
+    Output("category-spending-vs-budget", "figure"),
+    Output("remaining-budget", "figure"),
+    Output("category-treemap", "figure"),
+    Output("shown-version", "data"),
+    Input("refresh-interval", "n_intervals"),
+    Input("month-picker", "value"),
+    State("shown-version", "data"),
+)
+def refresh_dashboard(n_intervals, month, shown_version):
+    """
+    Updates the page when the picked month or its data version differs from the one shown.
+
+    A tick where nothing changed costs one small version query and sends nothing
+    back. Other page loads for the same version are answered from figure_cache.
+    """
+    month = month or month_key(date.today())
+    version = get_data_version(DASHBOARD_CHAT_ID, month)
+    if shown_version == [month, version]:
+        raise PreventUpdate
+
+    outputs = json.loads(dashboard_json(DASHBOARD_CHAT_ID, month, version))
+    return (*outputs, [month, version])
+
+
+def dashboard_json(chat_id, month, version):
+    """
+    Returns the monthly dashboard outputs for one data version as a Plotly JSON string.
+
+    Building the go.* figures and encoding them is the expensive part of a page
+    load; it runs once per (month, chat, version) and later loads decode the
+    cached string into plain lists and dicts, which Dash re-encodes cheaply.
+
+    Args:
+        chat_id (int): Telegram chat whose data is shown.
+        month (str): Month key in "YYYY-MM" format (the current month).
+        version (int): Data version returned by get_data_version().
+
+    Returns:
+        str: JSON array of the callback outputs, without the version.
+    """
+    return figure_cache.get_or_compute(
+        (month, chat_id, version),
+        lambda: json.dumps(visual_by_month(chat_id, month)[1:], cls=PlotlyJSONEncoder))
+
+
+@app.callback(
+    Output("category-trend", "figure"),
+    Output("income-trend", "figure"),
+    Output("budget-adherence-trend", "figure"),
+    Output("shown-trend-version", "data"),
+    Input("refresh-interval", "n_intervals"),
+    Input("trend-range", "start_date"),
+    Input("trend-range", "end_date"),
+    State("shown-trend-version", "data"),
+)
+def refresh_trends(n_intervals, start_date, end_date, shown_version):
+    """
+    Updates the trend charts when the range or the data of any month in it changes.
+
+    The charts of a (range, data version) are computed once and shared through
+    figure_cache like the monthly page.
+    """
+    if not start_date or not end_date:
+        raise PreventUpdate
+    start, end = date.fromisoformat(start_date[:10]), date.fromisoformat(end_date[:10])
+    if start > end:
+        raise PreventUpdate
+
+    version = get_data_version(DASHBOARD_CHAT_ID, month_key(start), month_key(end))
+    shown = [start.isoformat(), end.isoformat(), version]
+    if shown_version == shown:
+        raise PreventUpdate
+
+    figures = figure_cache.get_or_compute(
+        ("trends", start, end, DASHBOARD_CHAT_ID, version),
+        lambda: json.dumps(visual_trends(DASHBOARD_CHAT_ID, start, end, version), cls=PlotlyJSONEncoder))
+    return (*json.loads(figures), shown)
+
+
+# Figure cache hit/miss counters
+@app.server.route("/cache-stats")
+def cache_stats():
+    return jsonify(figure_cache.stats())
+
+
+if __name__ == '__main__':
     # Run the app
     app.run_server(debug=True, port=8057)
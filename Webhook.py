@@ -0,0 +1,127 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import secrets
+import time
+from aiohttp import web
+from telebot import types
+
+# Webhook ingestion for the bot: Telegram POSTs each update to an embedded HTTP
+# endpoint instead of the bot long-polling getUpdates. Updates are acknowledged
+# immediately and handed to a pool of dispatcher tasks through a bounded queue.
+# Configure with the WEBHOOKURLBUDGET, WEBHOOKPORTBUDGET and WEBHOOKSECRETBUDGET
+# environment variables; without WEBHOOKURLBUDGET the bot keeps using polling.
+
+WEBHOOK_URL = os.getenv('WEBHOOKURLBUDGET')
+WEBHOOK_HOST = os.getenv('WEBHOOKHOSTBUDGET', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOKPORTBUDGET', '8080'))
+WEBHOOK_SECRET = os.getenv('WEBHOOKSECRETBUDGET')
+WEBHOOK_PATH = '/telegram/webhook'
+
+# Header Telegram uses to echo the secret token given to setWebhook
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookServer:
+    """
+    Embedded HTTP endpoint receiving Telegram updates for an AsyncTeleBot.
+
+    Requests without the expected secret token are rejected with 403. Accepted
+    updates are queued and processed by `dispatchers` tasks; the queue is bounded,
+    so a burst waits for room instead of growing memory without limit. Updates
+    are dequeued in arrival order, which keeps the per-chat ordering of the
+    handlers (see Runtime.ChatWorkers.in_chat_order).
+
+    Attributes:
+        bot (AsyncTeleBot): Bot whose handlers process the updates.
+        secret_token (str): Value expected in the secret token header.
+        on_handled (callable): Optional hook called with (update, received, handled)
+            monotonic times after each update is processed.
+    """
+
+    def __init__(self, bot, secret_token, path=WEBHOOK_PATH, dispatchers=16, queue_size=1000, on_handled=None):
+        self.bot = bot
+        self.secret_token = secret_token
+        self.path = path
+        self.dispatchers = dispatchers
+        self.on_handled = on_handled
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks = []
+        self._runner = None
+        self.port = None
+
+    def create_app(self):
+        """Returns the aiohttp application serving the webhook path."""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        return app
+
+    async def handle_update(self, request):
+        """Validates the secret token, parses the update and queues it."""
+        received = time.monotonic()
+        token = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            return web.Response(status=403)
+
+        try:
+            update = types.Update.de_json(await request.text())
+        except (ValueError, KeyError, json.JSONDecodeError):
+            return web.Response(status=400)
+
+        await self.queue.put((update, received))
+        return web.Response()
+
+    async def _dispatch(self):
+        while True:
+            update, received = await self.queue.get()
+            try:
+                await self.bot.process_new_updates([update])
+            except Exception:
+                logger.exception("Failed to process update %s", update.update_id)
+            finally:
+                self.queue.task_done()
+                if self.on_handled:
+                    self.on_handled(update, received, time.monotonic())
+
+    async def start(self, host=WEBHOOK_HOST, port=WEBHOOK_PORT):
+        """Starts the dispatcher tasks and the HTTP server."""
+        self._tasks = [asyncio.create_task(self._dispatch()) for _ in range(self.dispatchers)]
+        self._runner = web.AppRunner(self.create_app())
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """Stops accepting updates, drains the queue and stops the dispatchers."""
+        await self._runner.cleanup()
+        await self.queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+async def run_webhook(bot, url=WEBHOOK_URL, secret_token=WEBHOOK_SECRET):
+    """
+    Registers the webhook with Telegram and serves updates until cancelled.
+
+    Args:
+        bot (AsyncTeleBot): Bot whose handlers process the updates.
+        url (str): Public HTTPS URL that forwards to this server's webhook path.
+        secret_token (str, optional): Shared secret; a random one is generated if missing.
+    """
+    secret_token = secret_token or secrets.token_urlsafe(32)
+    server = WebhookServer(bot, secret_token)
+    await server.start()
+    await bot.set_webhook(url=url, secret_token=secret_token, drop_pending_updates=False)
+    logger.info("Webhook listening on port %s for %s", server.port, url)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await bot.delete_webhook()
+        await server.stop()
+        await bot.close_session()
@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# Benchmarks never touch the real ledger: point the shared engine at a scratch
+# database before any model module is imported.
+# Run a benchmark with: python -m benchmarks.<name>
+os.environ.setdefault(
+    "DBBUDGET",
+    "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="budget-bench-"), "bench.db"),
+)
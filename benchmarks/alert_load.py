@@ -0,0 +1,133 @@
+import os
+
+# The bot module reads its token at import time; any well-formed token works
+# against the fake API.
+os.environ.setdefault("APIBUDGET", "123456:benchmark")
+
+import argparse
+import asyncio
+import random
+import time
+from sqlalchemy import text
+from telebot import asyncio_helper
+from Alerts import budget_alerts
+from Data_Processing import month_snapshot
+from Expense import Expense, add_expense
+from Storage import QueryCounter, engine
+from benchmarks.common import CATEGORIES, percentiles, time_call
+from benchmarks.fake_telegram import FLOOD_CHAT_LIMIT, FLOOD_TOTAL_LIMIT, FakeTelegramAPI
+
+# Budget alerts under load.
+# Gives --chats chats a small budget per category, then inserts expenses at
+# --rate inserts per minute for --seconds seconds through add_expense() on the
+# bot's worker pool, with the alerts delivered through the bot's outbox to a
+# local fake Telegram API. Reports the insert latency (insert and alert check),
+# the queries per insert, the alerts fired and the messages they took, and the
+# highest send rates seen per chat and in total, which must stay within the
+# limits the fake API enforces (FLOOD_CHAT_LIMIT messages per second per chat,
+# FLOOD_TOTAL_LIMIT in total).
+# Usage: python -m benchmarks.alert_load [--rate 10000] [--seconds 60] [--chats 200]
+
+BUDGET_CENTS = 8000
+
+
+def store_budgets(chats):
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO budget (chat_id, category, amount) VALUES (:chat_id, :category, :amount)"),
+                           [{"chat_id": chat_id, "category": category, "amount": BUDGET_CENTS}
+                            for chat_id in range(1, chats + 1) for category in CATEGORIES])
+
+
+def insert(chat_id, category, amount):
+    # Runs on a worker thread; the counter sees the insert and the alert check
+    start = time.perf_counter()
+    with QueryCounter() as queries:
+        add_expense(chat_id, category, "load", amount, None)
+    return (time.perf_counter() - start) * 1000, queries.count
+
+
+def most_within_second(times):
+    # Largest number of sorted times within any one-second window
+    most, first = 0, 0
+    for last in range(len(times)):
+        while times[last] - times[first] >= 1.0:
+            first += 1
+        most = max(most, last - first + 1)
+    return most
+
+
+def send_rates(sent):
+    # Most sends to one chat within a second, and in total within any second
+    times_by_chat = {}
+    for chat_id, _, at in sent:
+        times_by_chat.setdefault(chat_id, []).append(at)
+    per_chat = max((most_within_second(times) for times in times_by_chat.values()), default=0)
+    return per_chat, most_within_second(sorted(at for _, _, at in sent))
+
+
+async def run(args):
+    import BotHandler
+    from Runtime import workers
+
+    api = FakeTelegramAPI(latency=args.api_latency_ms / 1000, flood_limits=True)
+    await api.start()
+    asyncio_helper.API_URL = api.api_url
+    BotHandler.outbox.start()
+    budget_alerts.deliver = BotHandler.outbox.put_threadsafe
+
+    rng = random.Random(7)
+    total = args.rate * args.seconds // 60
+    interval = 60 / args.rate
+    tasks = []
+    start = time.monotonic()
+    for number in range(total):
+        # Keep to the schedule: sleep until this insert is due
+        delay = start + number * interval - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(workers.run(
+            insert, rng.randint(1, args.chats), rng.choice(CATEGORIES), f"{rng.randint(100, 2000) / 100:.2f}")))
+    results = await asyncio.gather(*tasks)
+    inserted = time.monotonic()
+    await BotHandler.outbox.drain()
+    drained = time.monotonic()
+
+    BotHandler.outbox.stop()
+    await BotHandler.bot.close_session()
+    await api.stop()
+    return results, inserted - start, drained - inserted, api.sent, api.rejected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=int, default=10_000, help="Inserts per minute")
+    parser.add_argument("--seconds", type=int, default=60, help="Length of the run")
+    parser.add_argument("--chats", type=int, default=200, help="Chats the inserts are spread over")
+    parser.add_argument("--api-latency-ms", type=float, default=20, help="Latency of each fake sendMessage")
+    args = parser.parse_args()
+
+    store_budgets(args.chats)
+    results, elapsed, drain, sent, rejected = asyncio.run(run(args))
+
+    latencies = [latency for latency, _ in results]
+    queries = sum(count for _, count in results)
+    points = percentiles(latencies, (50, 99))
+    print(f"inserts            {len(results)} in {elapsed:.1f} s ({len(results) / elapsed * 60:.0f}/min)")
+    print(f"insert latency     p50 {points[50]:.2f} ms, p99 {points[99]:.2f} ms")
+    print(f"queries per insert {queries / len(results):.2f} ({budget_alerts.loads} chat totals read)")
+    print(f"alerts             {budget_alerts.fired} fired, sent in {len(sent)} messages; "
+          f"outbox drained {drain:.1f} s after the last insert")
+    per_chat, total = send_rates(sent)
+    print(f"most sends         {per_chat} per chat per second, {total} per second in total, "
+          f"{rejected} rejected with 429")
+    assert per_chat <= FLOOD_CHAT_LIMIT and total <= FLOOD_TOTAL_LIMIT, "Telegram send limits exceeded"
+
+    # The alert check on the running totals next to re-reading the month for it
+    expense = Expense(1, CATEGORIES[0], "load", "0.01")
+    expense.id = 2 ** 62  # Not stored; an id after every stored one, so it counts as new
+    print(f"alert check        {time_call(lambda: budget_alerts.record(1, [expense])):.3f} ms on running totals, "
+          f"{time_call(lambda: month_snapshot(1)):.3f} ms to re-read the month")
+
+
+if __name__ == '__main__':
+    main()
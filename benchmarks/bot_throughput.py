@@ -0,0 +1,108 @@
+import os
+
+# The bot module reads its token at import time; any well-formed token works
+# against the fake API.
+os.environ.setdefault("APIBUDGET", "123456:benchmark")
+
+import argparse
+import asyncio
+import time
+from telebot import asyncio_helper
+from benchmarks.fake_telegram import FakeTelegramAPI, make_update
+
+# End-to-end bot throughput against a local fake Telegram API.
+# Every chat sends the same short script; all chats send at once. The benchmark
+# reports updates/sec and checks that each chat's replies came back in order.
+# The fake API has no send limits, so the bot's outbox runs without them here;
+# it still joins replies waiting for the same chat into one message.
+# Usage: python -m benchmarks.bot_throughput [--chats 500] [--api-latency-ms 20]
+
+# (command, number of replies, prefix of the first reply)
+SCRIPT = [
+    ("/setbud G 400, B 1500, F 300, W 200, M 100", 2, "Budget is set with"),
+    ("/s G, bread, 3.50", 1, "Expense:"),
+    ("/check_budget", 2, "Monthly Expense Summary"),
+    ("/s F, movie, 12\nG, milk, 2.25", 1, "Recorded 2 expenses"),
+    ("/expense_sum", 1, "Monthly Expense Summary"),
+]
+
+
+def build_updates(chats):
+    updates = []
+    update_id = 1
+    for command, _, _ in SCRIPT:
+        for chat_id in range(1, chats + 1):
+            updates.append(make_update(update_id, chat_id, command))
+            update_id += 1
+    return updates
+
+
+def check_order(sent, chats):
+    expected = []
+    for _, replies, prefix in SCRIPT:
+        expected.append(prefix)
+        expected.extend([None] * (replies - 1))
+
+    by_chat = {}
+    for chat_id, text, _ in sent:
+        by_chat.setdefault(chat_id, []).append(text)
+
+    # The outbox may join consecutive replies into one message, so the replies
+    # are looked for in order in everything the chat received
+    violations = 0
+    for chat_id in range(1, chats + 1):
+        received = "\n\n".join(by_chat.get(chat_id, []))
+        position = 0
+        for prefix in filter(None, expected):
+            position = received.find(prefix, position)
+            if position < 0:
+                violations += 1
+                break
+            position += len(prefix)
+    return violations
+
+
+async def run(chats, latency):
+    api = FakeTelegramAPI(latency=latency)
+    await api.start()
+    asyncio_helper.API_URL = api.api_url
+
+    import BotHandler
+    from Outbox import Outbox
+    unlimited = float(chats * len(SCRIPT))
+    BotHandler.outbox = outbox = Outbox(BotHandler.bot.send_message, chat_rate=unlimited, chat_burst=unlimited,
+                                        global_rate=unlimited, global_burst=unlimited)
+    outbox.start()
+    expected = chats * sum(replies for _, replies, _ in SCRIPT)
+    updates = build_updates(chats)
+
+    start = time.monotonic()
+    api.push_updates(updates)
+    polling = asyncio.create_task(BotHandler.bot.polling(non_stop=True, timeout=1))
+    while outbox.queued < expected and time.monotonic() - start < 300:
+        await asyncio.sleep(0.05)
+    await outbox.drain()
+    elapsed = time.monotonic() - start
+
+    # Cancelling polling also closes the bot's HTTP session
+    outbox.stop()
+    polling.cancel()
+    await asyncio.gather(polling, return_exceptions=True)
+    await api.stop()
+    return len(updates), outbox.queued, len(api.sent), expected, elapsed, check_order(api.sent, chats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=500, help="Number of concurrent chats")
+    parser.add_argument("--api-latency-ms", type=float, default=20, help="Simulated latency per sent message")
+    args = parser.parse_args()
+
+    updates, replies, sent, expected, elapsed, violations = asyncio.run(run(args.chats, args.api_latency_ms / 1000))
+    print(f"chats: {args.chats}, updates: {updates}, replies: {replies}/{expected} in {sent} messages")
+    print(f"elapsed: {elapsed:.2f} s, {updates / elapsed:.0f} updates/s, {replies / elapsed:.0f} replies/s")
+    print(f"chats with out-of-order or missing replies: {violations}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+import argparse
+import random
+import sys
+import time
+import numpy as np
+from Data_Processing import category_table
+
+# Per-category month tables as dtype=object arrays versus NumPy record arrays.
+# For every month, builds the table from the grouped query's rows (computing
+# remaining budget, percentage spent and overspend), then aggregates its
+# columns the way the reports do. The object version is the representation the
+# reports used before: a Python loop per row and boxed floats in every cell.
+# Usage: python -m benchmarks.category_arrays [--categories 10000] [--months 120]
+
+
+# The former representation: one Python list per category, boxed in an object array
+# Input: Rows of (category, budget, spent, budgeted, recorded)
+# Output: Object array with the category, budget, spent, percentage and overspend columns
+def object_table(rows):
+    data = []
+    for category, budget, spent, _, _ in rows:
+        percentage = (spent / budget) * 100 if budget > 0 else 0
+        overspent = spent - budget if spent > budget else 0
+        data.append([category, budget, spent, percentage, overspent])
+    return np.array(data, dtype=object)
+
+
+def object_aggregate(table):
+    budget, spent = table[:, 1], table[:, 2]
+    remaining = budget - spent
+    return budget.sum(), spent.sum(), remaining.min(), (table[:, 4] > 0).sum()
+
+
+def record_table(rows):
+    categories, budget, spent, budgeted, recorded = zip(*rows)
+    return category_table(categories, budget, spent, budgeted, recorded)
+
+
+def record_aggregate(table):
+    return table.budget.sum(), table.spent.sum(), table.remaining.min(), (table.overspent > 0).sum()
+
+
+def object_bytes(table):
+    # The array holds pointers; every distinct cell object is allocated separately
+    cells = {id(cell): cell for cell in table.flat}
+    return table.nbytes + sum(sys.getsizeof(cell) for cell in cells.values())
+
+
+def run(name, months, build, aggregate, size):
+    start = time.perf_counter()
+    tables = [build(rows) for rows in months]
+    built = time.perf_counter() - start
+
+    start = time.perf_counter()
+    totals = [aggregate(table) for table in tables]
+    aggregated = time.perf_counter() - start
+
+    memory = size(tables[0]) / 2 ** 20
+    print(f"{name:<14} {built * 1000:10.1f} {aggregated * 1000:12.1f} {memory:14.2f}")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--categories", type=int, default=10_000, help="Categories per month")
+    parser.add_argument("--months", type=int, default=120, help="Months")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    codes = [f"C{index}" for index in range(args.categories)]
+    budgets = [round(rng.uniform(0, 500), 2) for _ in codes]
+    months = [
+        [(code, budget, round(rng.uniform(0, 600), 2), True, True) for code, budget in zip(codes, budgets)]
+        for _ in range(args.months)
+    ]
+
+    print(f"{args.categories} categories x {args.months} months")
+    print(f"{'representation':<14} {'build ms':>10} {'aggregate ms':>12} {'MB per month':>14}")
+    old = run("dtype=object", months, object_table, object_aggregate, object_bytes)
+    new = run("record array", months, record_table, record_aggregate, lambda table: table.nbytes)
+
+    # Both representations must agree
+    assert np.allclose(np.array(old, dtype=float), np.array(new, dtype=float))
+
+
+if __name__ == '__main__':
+    main()
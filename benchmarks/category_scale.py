@@ -0,0 +1,68 @@
+import argparse
+from datetime import date
+import Visualization
+from Budget import BudgetManager
+from Categories import category_cache, set_category
+from Data_Processing import (category_spending_vs_budget, check_budget, get_budget_delta_message,
+                             month_snapshot, overall_spending_vs_budget)
+from Expense import Expense
+from Storage import QueryCounter
+from benchmarks.common import CATEGORIES, insert_synthetic_expenses, time_call
+
+# Budget reports of a chat with hundreds of user-defined categories.
+# One chat keeps the five default categories, the other gets --categories
+# categories, each with a budget and expenses. Every report reads the month
+# with one grouped query and takes the category names from the in-memory
+# resolver, so the number of queries does not grow with the categories.
+# Usage: python -m benchmarks.category_scale [--categories 500]
+
+DEFAULT_CHAT = 1
+LARGE_CHAT = 2
+
+
+def budget_summarize(chat_id):
+    snapshot = month_snapshot(chat_id)
+    overall_spending_vs_budget(chat_id, snapshot=snapshot)
+    category_spending_vs_budget(chat_id, snapshot=snapshot)
+
+
+def setup(chat_id, codes):
+    BudgetManager(chat_id).parse_message("/setbud " + ", ".join(f"{code} {100 + index}" for index, code in enumerate(codes)))
+    insert_synthetic_expenses(30, 200, date.today(), chat_id=chat_id, categories=codes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--categories", type=int, default=500, help="Categories of the large chat")
+    args = parser.parse_args()
+
+    codes = [f"C{index}" for index in range(args.categories)]
+    for code in codes:
+        set_category(LARGE_CHAT, code, f"Category {code}")
+    setup(DEFAULT_CHAT, CATEGORIES)
+    setup(LARGE_CHAT, codes)
+
+    print(f"{'command':<18} {'categories':>10} {'queries':>8} {'median ms':>10}")
+    for chat_id, count in [(DEFAULT_CHAT, len(CATEGORIES)), (LARGE_CHAT, len(CATEGORIES) + args.categories)]:
+        new_expenses = [Expense(chat_id, code, "benchmark", 10.0, None) for code in ["G", "M"]]
+        commands = {
+            "/check_budget": lambda: check_budget(chat_id),
+            "/budget_summarize": lambda: budget_summarize(chat_id),
+            "/s budget report": lambda: get_budget_delta_message(chat_id, new_expenses),
+            "dashboard page": lambda: Visualization.visual_by_month(chat_id),
+        }
+        for name, command in commands.items():
+            command()  # The category names are cached after the first lookup
+            with QueryCounter() as queries:
+                command()
+            print(f"{name:<18} {count:10} {queries.count:8} {time_call(command):10.2f}")
+
+    # Reading a chat's categories again, as after a change
+    def reload():
+        category_cache.invalidate(LARGE_CHAT)
+        category_cache.get(LARGE_CHAT)
+    print(f"reloading {len(CATEGORIES) + args.categories} categories: {time_call(reload):.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
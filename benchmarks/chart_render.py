@@ -0,0 +1,72 @@
+import argparse
+import asyncio
+import time
+from datetime import date
+from Charts import CHART_COMMANDS, ChartRenderer
+from Expense import add_expense
+from Storage import month_key
+from benchmarks.common import insert_synthetic_expenses, percentiles, set_benchmark_budget
+
+# Latency of the /chart commands: cold renders, cached repeats and renders after a change.
+# Every chat requests every chart at once, as many chats using the bot together would.
+# Cold requests build the figure and render it in the process pool; repeated
+# requests for unchanged data are answered from the PNG cache; after an expense
+# only the charts of the changed chat are rendered again.
+# Usage: python -m benchmarks.chart_render [--chats 20] [--workers 2]
+
+
+async def request_all(renderer, chats, month):
+    async def request(chat_id, command):
+        start = time.perf_counter()
+        png = await renderer.render(chat_id, command, month)
+        assert png.startswith(b"\x89PNG")
+        return (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    latencies = await asyncio.gather(*(request(chat_id, command)
+                                       for chat_id in chats for command in CHART_COMMANDS))
+    return latencies, time.perf_counter() - start
+
+
+def report(name, latencies, elapsed, renders):
+    points = percentiles(latencies)
+    print(f"{name:<14} {len(latencies):6} {elapsed:7.2f} {points[50]:8.1f} {points[90]:8.1f} {points[99]:8.1f} {renders:8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=20, help="Chats requesting charts")
+    parser.add_argument("--workers", type=int, default=2, help="Render processes")
+    args = parser.parse_args()
+
+    chats = list(range(1, args.chats + 1))
+    for chat_id in chats:
+        set_benchmark_budget(chat_id)
+        insert_synthetic_expenses(60, 20, date.today(), chat_id=chat_id)
+    month = month_key(date.today())
+
+    renderer = ChartRenderer(max_workers=args.workers)
+    # Start the render processes (and their headless browsers) outside the measurement
+    for future in [renderer.pool.submit(time.sleep, 0.5) for _ in range(args.workers)]:
+        future.result()
+
+    async def run():
+        print(f"{len(chats)} chats x {len(CHART_COMMANDS)} charts, {args.workers} render processes")
+        print(f"{'round':<14} {'charts':>6} {'wall s':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'renders':>8}")
+        rounds = [("cold", None), ("cached", None), ("after change", chats[0])]
+        for name, changed_chat in rounds:
+            if changed_chat is not None:
+                add_expense(changed_chat, "G", "benchmark", 1.0, None)
+            rendered = len(renderer.render_ms)
+            latencies, elapsed = await request_all(renderer, chats, month)
+            report(name, latencies, elapsed, len(renderer.render_ms) - rendered)
+
+    asyncio.run(run())
+    points = percentiles(renderer.render_ms)
+    print(f"render time in the pool: p50 {points[50]:.1f} ms, p90 {points[90]:.1f} ms, p99 {points[99]:.1f} ms")
+    print(f"cache stats: {renderer.cache.stats()}")
+    renderer.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import argparse
+import tempfile
+import time
+from datetime import date, timedelta
+from Clean_data import return_clean_csv
+from benchmarks.common import insert_synthetic_expenses
+
+# Full versus incremental cleaning of the expense history.
+# Cleans a large history from scratch, appends a small batch of new rows and
+# cleans again. The incremental run reads only the rows past the high-water mark
+# and checks them against the stored hash index, so it should take a small,
+# roughly constant time while the full run grows with the history.
+# Usage: python -m benchmarks.clean_incremental [--rows 5000000] [--new-rows 10000]
+
+ROWS_PER_DAY = 100
+CHAT_ID = 1
+
+
+def timed_clean(output_dir, full):
+    start = time.perf_counter()
+    result = return_clean_csv(output_dir, full=full)
+    return result["expenses"], time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=5_000_000, help="Rows in the expense history")
+    parser.add_argument("--new-rows", type=int, default=10_000, help="Rows added before the incremental run")
+    args = parser.parse_args()
+
+    output_dir = tempfile.mkdtemp(prefix="budget-clean-")
+    newest_day = date.today() - timedelta(days=args.new_rows // ROWS_PER_DAY + 1)
+    insert_synthetic_expenses(args.rows // ROWS_PER_DAY, ROWS_PER_DAY, newest_day, chat_id=CHAT_ID)
+
+    (read, written), elapsed = timed_clean(output_dir, full=True)
+    print(f"full run:        {elapsed:7.2f} s, {read} rows read, {written} written")
+
+    insert_synthetic_expenses(args.new_rows // ROWS_PER_DAY, ROWS_PER_DAY, date.today(), chat_id=CHAT_ID)
+    (read, written), elapsed = timed_clean(output_dir, full=False)
+    print(f"incremental run: {elapsed:7.2f} s, {read} rows read, {written} written")
+
+    (read, written), elapsed = timed_clean(output_dir, full=True)
+    print(f"full run again:  {elapsed:7.2f} s, {read} rows read, {written} written")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import random
+import time
+from datetime import date, timedelta
+from sqlalchemy import text
+from Storage import engine
+from Budget import BudgetManager
+from Expense import rebuild_monthly_totals
+
+CATEGORIES = ['G', 'B', 'F', 'W', 'M']
+
+
+# Returns the median wall time of a callable in milliseconds
+# Input: A zero-argument callable and the number of repetitions
+# Output: Median duration in milliseconds
+def time_call(func, repeat=20):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+# Returns the given percentiles of a list of samples
+# Input: A list of numbers and the percentiles to report (e.g. [50, 99])
+# Output: A dictionary mapping each percentile to its value
+def percentiles(samples, points=(50, 90, 99)):
+    ordered = sorted(samples)
+    result = {}
+    for point in points:
+        index = min(len(ordered) - 1, int(round(point / 100 * (len(ordered) - 1))))
+        result[point] = ordered[index]
+    return result
+
+
+# Stores a fixed budget so the budget reports have something to compare against
+# Input: Telegram chat id owning the budget
+# Output: Saves a budget for every category
+def set_benchmark_budget(chat_id=1):
+    BudgetManager(chat_id).parse_message("/setbud G 400, B 1500, F 300, W 200, M 100")
+
+
+# Inserts synthetic expenses, rows_per_day per day, walking backwards from a start date
+# Input: Number of days, rows per day, the first (most recent) day, the owning chat id
+#        and the category codes to spread the rows over
+# Output: Bulk inserts the rows, refreshes the monthly aggregates and returns the oldest day written
+def insert_synthetic_expenses(days, rows_per_day, newest_day, chat_id=1, rng=None, categories=CATEGORIES):
+    rng = rng or random.Random(7)
+    batch = []
+    day = newest_day
+    with engine.begin() as connection:
+        for _ in range(days):
+            for _ in range(rows_per_day):
+                batch.append({
+                    "chat_id": chat_id,
+                    "date": day.isoformat(),
+                    "category": rng.choice(categories),
+                    "reason": "synthetic",
+                    "amount": rng.randint(100, 20000),  # Integer cents
+                })
+            if len(batch) >= 50000:
+                connection.execute(_EXPENSE_INSERT, batch)
+                batch = []
+            day -= timedelta(days=1)
+        if batch:
+            connection.execute(_EXPENSE_INSERT, batch)
+    rebuild_monthly_totals()
+    return day + timedelta(days=1)
+
+
+_EXPENSE_INSERT = text(
+    "INSERT INTO expenses (chat_id, date, category, reason, amount) "
+    "VALUES (:chat_id, :date, :category, :reason, :amount)"
+)
@@ -0,0 +1,117 @@
+import os
+
+# The dashboard reads the chat it shows at import time
+os.environ["CHATBUDGET"] = "1"
+
+import argparse
+import asyncio
+import logging
+import threading
+import time
+from datetime import date
+import aiohttp
+from werkzeug.serving import make_server
+import Visualization
+from Expense import add_expense
+from benchmarks.common import insert_synthetic_expenses, percentiles, set_benchmark_budget
+
+# Concurrent dashboard page loads with and without the server-side figure cache.
+# Each page load is the initial refresh_dashboard callback request a browser sends.
+# Without the cache every load rebuilds and serializes the figures; with it, the
+# first load of a data version computes them once and the concurrent loads wait
+# for that result, and later loads are answered from the cache.
+# Usage: python -m benchmarks.dashboard_cache [--pages 100] [--rows 100000]
+
+CHAT_ID = 1
+OUTPUTS = [
+    ("summary-table", "data"),
+    ("category-spending-table", "data"),
+    ("total-spending-vs-budget", "figure"),
+    ("total-spending-vs-income", "figure"),
+    ("category-pies", "children"),
+    ("category-spending-vs-budget", "figure"),
+    ("remaining-budget", "figure"),
+    ("shown-version", "data"),
+]
+
+# Callback request sent by a freshly opened page
+PAGE_LOAD = {
+    "output": "...".join(f"{component}.{prop}" for component, prop in OUTPUTS).join(["..", ".."]),
+    "outputs": [{"id": component, "property": prop} for component, prop in OUTPUTS],
+    "inputs": [
+        {"id": "refresh-interval", "property": "n_intervals", "value": None},
+        {"id": "month-picker", "property": "value", "value": None},
+    ],
+    "state": [{"id": "shown-version", "property": "data", "value": None}],
+    "changedPropIds": [],
+}
+
+
+class NoCache:
+    """Computes on every lookup, like the dashboard before the figure cache."""
+
+    def get_or_compute(self, key, compute):
+        return compute()
+
+
+async def load_pages(url, pages):
+    async def load(session):
+        start = time.perf_counter()
+        async with session.post(url, json=PAGE_LOAD) as response:
+            await response.read()
+            assert response.status == 200, response.status
+        return (time.perf_counter() - start) * 1000
+
+    connector = aiohttp.TCPConnector(limit=pages)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        start = time.perf_counter()
+        latencies = await asyncio.gather(*(load(session) for _ in range(pages)))
+        return latencies, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=100, help="Concurrent page loads per round")
+    parser.add_argument("--rows", type=int, default=100_000, help="Expense history size")
+    args = parser.parse_args()
+
+    set_benchmark_budget(CHAT_ID)
+    insert_synthetic_expenses(args.rows // 100, 100, date.today(), chat_id=CHAT_ID)
+
+    # Count how often the figures are actually built
+    builds = [0]
+    visual_by_month = Visualization.visual_by_month
+
+    def counted(*args):
+        builds[0] += 1
+        return visual_by_month(*args)
+    Visualization.visual_by_month = counted
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, Visualization.app.server, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.port}/_dash-update-component"
+
+    rounds = [
+        ("no cache", NoCache()),
+        ("cold cache", Visualization.figure_cache),
+        ("warm cache", Visualization.figure_cache),
+    ]
+    print(f"{args.pages} concurrent page loads, {args.rows} expense rows")
+    print(f"{'round':<12} {'wall s':>8} {'p50 ms':>8} {'p99 ms':>8} {'builds':>7}")
+    for name, cache in rounds:
+        if name == "cold cache":
+            # A new expense moves the month to a new data version
+            add_expense(CHAT_ID, "G", "benchmark", 1.0, None)
+        Visualization.figure_cache = cache
+        builds[0] = 0
+        latencies, elapsed = asyncio.run(load_pages(url, args.pages))
+        points = percentiles(latencies, (50, 99))
+        print(f"{name:<12} {elapsed:8.2f} {points[50]:8.1f} {points[99]:8.1f} {builds[0]:7}")
+
+    print(f"cache stats: {Visualization.figure_cache.stats()}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
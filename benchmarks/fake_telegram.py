@@ -0,0 +1,153 @@
+import asyncio
+import json
+import time
+from urllib.parse import parse_qsl
+from aiohttp import web
+
+# A minimal local stand-in for the Telegram Bot API, used by the bot benchmarks.
+# It serves getUpdates from an in-memory queue (with long polling), records every
+# outgoing message and answers other methods with a generic success. With
+# flood limits on it rejects sends beyond Telegram's limits with 429 Too Many
+# Requests, as the real API does.
+
+# Sends accepted per chat, and over all chats, within any one second when flood limits are on
+FLOOD_CHAT_LIMIT = 3
+FLOOD_TOTAL_LIMIT = 30
+
+
+# Builds a Telegram update carrying a text message from a private chat
+# Input: Update id, chat id and message text
+# Output: A dictionary in the Telegram Update JSON format
+def make_update(update_id, chat_id, text):
+    sender = {"id": chat_id, "is_bot": False, "first_name": f"User{chat_id}"}
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private", "first_name": sender["first_name"]},
+            "from": sender,
+            "text": text,
+        },
+    }
+
+
+class FakeTelegramAPI:
+    """
+    In-process Telegram Bot API server.
+
+    Attributes:
+        latency (float): Seconds added to every sendMessage call to mimic the network.
+        sent (list): (chat_id, text, monotonic time) for every message the bot sent.
+        calls (dict): Number of requests per API method.
+        flood_limits (bool): Whether sends beyond the limits are rejected with 429.
+        rejected (int): Sends rejected with 429.
+        connections (set): Client (host, port) pairs seen, one per TCP connection.
+    """
+
+    def __init__(self, latency=0.0, flood_limits=False):
+        self.latency = latency
+        self.flood_limits = flood_limits
+        self.sent = []
+        self.calls = {}
+        self.rejected = 0
+        self.connections = set()
+        self._recent = []  # (chat_id, monotonic time) of the sends accepted in the last second
+        self._updates = []
+        self._new_updates = asyncio.Event()
+        self._message_id = 0
+        self._runner = None
+        self.port = None
+
+    @property
+    def api_url(self):
+        """URL template for telebot's asyncio_helper.API_URL."""
+        return f"http://127.0.0.1:{self.port}/bot{{0}}/{{1}}"
+
+    def push_updates(self, updates):
+        """Queues updates to be returned by getUpdates."""
+        self._updates.extend(updates)
+        self._new_updates.set()
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+    async def _params(self, request):
+        # telebot sends form fields in the body, even on GET requests
+        params = dict(request.query)
+        if request.content_type == "application/json":
+            params.update(await request.json())
+        elif request.content_type.startswith("multipart/"):
+            params.update({key: value for key, value in (await request.post()).items()
+                           if isinstance(value, str)})
+        elif request.can_read_body:
+            params.update(parse_qsl((await request.read()).decode()))
+        return params
+
+    async def _handle(self, request):
+        method = request.match_info["method"]
+        self.calls[method] = self.calls.get(method, 0) + 1
+        self.connections.add(request.transport.get_extra_info("peername"))
+        params = await self._params(request)
+
+        if method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+        elif method == "getUpdates":
+            result = await self._get_updates(params)
+        elif method in ("sendMessage", "sendPhoto", "sendDocument", "editMessageText"):
+            if self.flood_limits and self._flooded(int(params["chat_id"])):
+                self.rejected += 1
+                return web.json_response({"ok": False, "error_code": 429,
+                                          "description": "Too Many Requests: retry after 1",
+                                          "parameters": {"retry_after": 1}}, status=429)
+            result = await self._send(method, params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        self._updates = [update for update in self._updates if update["update_id"] >= offset]
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), timeout=float(params.get("timeout") or 0))
+            except asyncio.TimeoutError:
+                pass
+        return self._updates[:100]
+
+    def _flooded(self, chat_id):
+        # Counts the send against the limits unless it would exceed one of them
+        now = time.monotonic()
+        self._recent = [(chat, at) for chat, at in self._recent if now - at < 1.0]
+        if (len(self._recent) >= FLOOD_TOTAL_LIMIT
+                or sum(chat == chat_id for chat, _ in self._recent) >= FLOOD_CHAT_LIMIT):
+            return True
+        self._recent.append((chat_id, now))
+        return False
+
+    async def _send(self, method, params):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        chat_id = int(params["chat_id"])
+        text = params.get("text") or params.get("caption") or ""
+        self.sent.append((chat_id, text, time.monotonic()))
+        self._message_id += 1
+        message = {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "text": text,
+        }
+        if "reply_markup" in params:
+            message["reply_markup"] = json.loads(params["reply_markup"])
+        return message
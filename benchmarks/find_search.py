@@ -0,0 +1,92 @@
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from sqlalchemy import text
+from Search import format_search_results, parse_find_command, search_entries
+from Storage import engine
+from benchmarks.common import CATEGORIES, time_call
+
+# /find on a large ledger: the FTS5 index against a LIKE scan.
+# Builds one chat with --rows expenses over ten years, inserted through the
+# search triggers. Reasons and notes are drawn from a vocabulary of --words
+# words, plus three searched words in a fixed share of the entries: "ferry"
+# in 0.01%, "taxi" in 0.1% and "uber" in 1%. Then times /find (search, sum and
+# listing of expenses and income) for each of them over all time and over
+# this year, next to the same count, sum and listing done with LIKE.
+# Usage: python -m benchmarks.find_search [--rows 1000000] [--words 5000]
+
+CHAT_ID = 1
+BATCH_SIZE = 50_000
+SEARCHED = {"ferry": 0.0001, "taxi": 0.001, "uber": 0.01}
+
+
+def reason(vocabulary, rng):
+    for word, share in SEARCHED.items():
+        if rng.random() < share:
+            return f"{word} {rng.choice(vocabulary)}"
+    return f"{rng.choice(vocabulary)} {rng.choice(vocabulary)}"
+
+
+def insert_expenses(rows, words, rng):
+    vocabulary = [f"word{number}" for number in range(words)]
+    newest = date.today()
+    insert = text("INSERT INTO expenses (chat_id, date, category, reason, amount, note) "
+                  "VALUES (:chat_id, :date, :category, :reason, :amount, :note)")
+    with engine.begin() as connection:
+        for first in range(0, rows, BATCH_SIZE):
+            connection.execute(insert, [{
+                "chat_id": CHAT_ID,
+                "date": (newest - timedelta(days=rng.randrange(3650))).isoformat(),
+                "category": rng.choice(CATEGORIES),
+                "reason": reason(vocabulary, rng),
+                "amount": rng.randint(100, 20000),  # Integer cents
+                "note": rng.choice(vocabulary) if rng.random() < 0.3 else None,
+            } for _ in range(min(BATCH_SIZE, rows - first))])
+
+
+def like_search(word, start, end):
+    # The same results without the index: count, sum and newest rows by LIKE
+    params = {"chat_id": CHAT_ID, "pattern": f"%{word}%", "start": start.isoformat(), "end": end.isoformat()}
+    matches = ("FROM {table} WHERE chat_id = :chat_id AND date >= :start AND date < :end "
+               "AND ({column} LIKE :pattern OR note LIKE :pattern)")
+    with engine.connect() as connection:
+        for table, column in (("expenses", "reason"), ("income", "source")):
+            connection.execute(text(f"SELECT count(*), sum(amount) {matches}".format(table=table, column=column)),
+                               params).one()
+            connection.execute(text(f"SELECT * {matches} ORDER BY date DESC, id DESC LIMIT 10".format(
+                table=table, column=column)), params).all()
+
+
+def find(command):
+    words, start, end, label = parse_find_command(command)
+    return format_search_results(CHAT_ID, words, label, search_entries(CHAT_ID, words, start, end))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Expenses of the chat")
+    parser.add_argument("--words", type=int, default=5000, help="Other distinct words in reasons and notes")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    insert_expenses(args.rows, args.words, random.Random(7))
+    elapsed = time.perf_counter() - start
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+    print(f"expenses: {args.rows} inserted through the search triggers in {elapsed:.1f} s "
+          f"({args.rows / elapsed:.0f} rows/s)")
+
+    year = date.today().year
+    print(f"{'word':>6} {'period':>8} {'matches':>8} {'/find ms':>9} {'LIKE ms':>9}")
+    for word in SEARCHED:
+        for label, period, first, end in (("all time", "", date.min, date.max),
+                                          (str(year), f" {year}", date(year, 1, 1), date(year + 1, 1, 1))):
+            command = f"/find {word}{period}"
+            words, start, stop, _ = parse_find_command(command)
+            matches = search_entries(CHAT_ID, words, start, stop)["expenses"][1]
+            print(f"{word:>6} {label:>8} {matches:>8} {time_call(lambda: find(command)):>9.2f} "
+                  f"{time_call(lambda: like_search(word, first, end), repeat=5):>9.2f}")
+
+if __name__ == '__main__':
+    main()
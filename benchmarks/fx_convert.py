@@ -0,0 +1,95 @@
+import argparse
+import io
+import random
+import time
+from datetime import date, timedelta
+from Currency import FxRate, RateCache, load_fx_rates
+from Importer import import_statement
+from Storage import QueryCounter, session_scope, to_money
+
+# Cost of converting foreign-currency rows to the home currency.
+# Loads daily rates for a few currencies over ten years, then converts rows with
+# random currencies and days twice: through the in-memory RateCache (one query
+# per currency, then a binary search per row) and with one "latest rate on or
+# before the day" query per row. Finally imports a statement whose rows all
+# carry a currency, next to the same statement in the home currency.
+# Usage: python -m benchmarks.fx_convert [--rows 100000]
+
+CHAT_ID = 1
+CURRENCIES = ["EUR", "GBP", "JPY", "CAD", "CHF"]
+FIRST_DAY = date(2016, 1, 1)
+DAYS = 3650
+
+
+def rate_file(rng):
+    lines = ["date,currency,rate"]
+    for currency in CURRENCIES:
+        rate = rng.uniform(0.5, 1.5)
+        for offset in range(DAYS):
+            rate *= rng.uniform(0.99, 1.01)
+            lines.append(f"{FIRST_DAY + timedelta(days=offset)},{currency},{rate:.6f}")
+    return "\n".join(lines) + "\n"
+
+
+def convert_with_query(amount, currency, day):
+    with session_scope() as session:
+        rate = session.query(FxRate.rate).filter(
+            FxRate.currency == currency,
+            FxRate.date <= day
+        ).order_by(FxRate.date.desc()).limit(1).scalar()
+    return to_money(to_money(amount) * rate)
+
+
+def timed(name, rows, convert):
+    with QueryCounter() as queries:
+        start = time.perf_counter()
+        results = [convert(amount, currency, day) for amount, currency, day in rows]
+        elapsed = time.perf_counter() - start
+    print(f"{name:<16} {len(rows) / elapsed:12.0f} {elapsed / len(rows) * 1e6:10.2f} {queries.count:9}")
+    return results
+
+
+def statement(rows, with_currency):
+    lines = ["Date,Description,Amount,Currency"]
+    for number, (amount, currency, day) in enumerate(rows):
+        lines.append(f"{day},shop {number},-{amount},{currency if with_currency else ''}")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="Rows converted")
+    parser.add_argument("--query-rows", type=int, default=10_000,
+                        help="Rows converted with a query each (slower, so fewer)")
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    start = time.perf_counter()
+    loaded = load_fx_rates(io.StringIO(rate_file(rng)))
+    print(f"loaded {loaded} rates in {time.perf_counter() - start:.2f} s")
+
+    rows = [
+        (f"{rng.randint(100, 20000) / 100:.2f}", rng.choice(CURRENCIES),
+         FIRST_DAY + timedelta(days=rng.randrange(DAYS)))
+        for _ in range(args.rows)
+    ]
+
+    print(f"{'conversion':<16} {'rows/s':>12} {'us/row':>10} {'queries':>9}")
+    cache = RateCache()
+    cached = timed("rate cache", rows, cache.convert)
+    queried = timed("query per row", rows[:args.query_rows], convert_with_query)
+    assert cached[:args.query_rows] == queried
+
+    print(f"{'import':<16} {'rows/s':>12}")
+    for name, with_currency in [("home currency", False), ("foreign currency", True)]:
+        # Distinct descriptions per run, so the second import is not skipped as duplicates
+        text = statement(rows, with_currency).replace("shop ", f"{name} ")
+        start = time.perf_counter()
+        stats = import_statement(CHAT_ID, io.StringIO(text), statement_format="csv")
+        elapsed = time.perf_counter() - start
+        assert stats["expenses"] == len(rows), stats
+        print(f"{name:<16} {len(rows) / elapsed:12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import argparse
+from datetime import date
+from sqlalchemy import text
+from Expense import Expense, expense_page
+from Storage import engine, session_scope
+from benchmarks.common import insert_synthetic_expenses, time_call
+
+# /history pages deep into a long expense history.
+# Builds one chat with --rows expenses, then times reading the page that
+# starts at growing depths: with the (date, id) keyset cursor /history uses,
+# and with the ORDER BY ... OFFSET query it replaces. A keyset page costs one
+# index seek at any depth; OFFSET walks every row before the page.
+# Usage: python -m benchmarks.history_pages [--rows 1000000]
+
+CHAT_ID = 1
+ROWS_PER_DAY = 100
+
+
+def cursor_at(depth):
+    # (date, id) of the entry just before the page at a depth, newest first
+    with engine.connect() as connection:
+        row = connection.execute(text(
+            "SELECT date, id FROM expenses WHERE chat_id = :chat_id ORDER BY date DESC, id DESC LIMIT 1 OFFSET :offset"
+        ), {"chat_id": CHAT_ID, "offset": depth - 1}).one()
+    return date.fromisoformat(row.date), row.id
+
+
+def offset_page(depth):
+    with session_scope() as session:
+        return session.query(Expense).filter(Expense.chat_id == CHAT_ID).order_by(
+            Expense.date.desc(), Expense.id.desc()).offset(depth).limit(6).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Expenses of the chat")
+    args = parser.parse_args()
+
+    insert_synthetic_expenses(args.rows // ROWS_PER_DAY, ROWS_PER_DAY, date.today(), chat_id=CHAT_ID)
+    with engine.begin() as connection:
+        connection.execute(text("ANALYZE"))
+
+    print(f"expenses: {args.rows}")
+    print(f"{'depth':>10} {'keyset ms':>10} {'offset ms':>10}")
+    depths = [10 ** power for power in range(1, len(str(args.rows))) if 10 ** power < args.rows] + [args.rows - 10]
+    for depth in depths:
+        cursor = cursor_at(depth)
+        keyset = expense_page(CHAT_ID, cursor)[0]
+        assert [expense.id for expense in keyset] == [expense.id for expense in offset_page(depth)[:5]]
+        print(f"{depth:>10} {time_call(lambda: expense_page(CHAT_ID, cursor)):>10.3f} "
+              f"{time_call(lambda: offset_page(depth), repeat=5):>10.3f}")
+
+
+if __name__ == '__main__':
+    main()
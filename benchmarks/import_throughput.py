@@ -0,0 +1,76 @@
+import argparse
+import csv
+import os
+import random
+import resource
+import tempfile
+import time
+from datetime import date, timedelta
+from Importer import import_statement
+
+# Bulk statement import throughput.
+# Writes a synthetic CSV bank statement, imports it, then imports it again.
+# The first pass reports rows/sec and peak memory growth (which should stay flat,
+# since rows are streamed and inserted in bounded batches); the second pass
+# should insert nothing and report every row as a duplicate.
+# Usage: python -m benchmarks.import_throughput [--rows 1000000] [--batch-size 5000]
+
+CHAT_ID = 1
+DESCRIPTIONS = ["Safeway groceries", "Rent payment", "Starbucks coffee", "Pharmacy", "ATM withdrawal",
+                "Hydro bill", "Netflix", "Gym membership", "Aldi market", "Payroll deposit"]
+
+
+# Writes a date-ordered CSV statement with a mix of debits and credits
+# Input: File path and number of rows
+# Output: Writes the file
+def write_statement(path, rows, rng):
+    day = date.today() - timedelta(days=rows // 100)
+    with open(path, "w", newline="") as stream:
+        writer = csv.writer(stream)
+        writer.writerow(["Date", "Description", "Amount", "Memo"])
+        for index in range(rows):
+            if index and index % 100 == 0:
+                day += timedelta(days=1)
+            description = rng.choice(DESCRIPTIONS)
+            amount = round(rng.uniform(1, 200), 2)
+            if description != "Payroll deposit":
+                amount = -amount
+            writer.writerow([day.strftime("%m/%d/%Y"), description, f"{amount:.2f}", ""])
+
+
+def max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def timed_import(path, batch_size):
+    start = time.perf_counter()
+    with open(path, newline="") as stream:
+        stats = import_statement(CHAT_ID, stream, statement_format="csv", batch_size=batch_size)
+    return stats, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows in the synthetic statement")
+    parser.add_argument("--batch-size", type=int, default=5000, help="Rows inserted per transaction")
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(prefix="budget-import-"), "statement.csv")
+    write_statement(path, args.rows, random.Random(7))
+    print(f"statement: {args.rows} rows, {os.path.getsize(path) / 1e6:.1f} MB")
+
+    baseline = max_rss_mb()
+    stats, elapsed = timed_import(path, args.batch_size)
+    print(f"first import:  {elapsed:.1f} s, {args.rows / elapsed:,.0f} rows/s, "
+          f"peak RSS growth {max_rss_mb() - baseline:.1f} MB")
+    print(f"  {stats}")
+
+    stats, elapsed = timed_import(path, args.batch_size)
+    print(f"second import: {elapsed:.1f} s, {args.rows / elapsed:,.0f} rows/s")
+    print(f"  {stats}")
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
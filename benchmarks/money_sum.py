@@ -0,0 +1,96 @@
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from decimal import Decimal
+
+# Aggregate speed and exactness of REAL amounts versus INTEGER cents in SQLite.
+# Builds the same expense rows twice in scratch databases, once with amounts as
+# REAL dollars (the storage before integer cents) and once as INTEGER cents, and
+# times a full SUM and the grouped SUM the monthly aggregates are built from.
+# Usage: python -m benchmarks.money_sum [--rows 10000000]
+
+SCHEMA = (
+    "CREATE TABLE expenses (id INTEGER PRIMARY KEY, chat_id BIGINT NOT NULL, "
+    "date DATE NOT NULL, category CHAR NOT NULL, amount {amount_type} NOT NULL)"
+)
+
+# Deterministic amounts between $1.00 and $200.99; the REAL table stores them divided by 100
+FILL = (
+    "WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n WHERE x < :rows) "
+    "INSERT INTO expenses (chat_id, date, category, amount) "
+    "SELECT x % 100, date('2015-01-01', '+' || (x % 3650) || ' days'), "
+    "substr('GBFWM', x % 5 + 1, 1), {amount} FROM n"
+)
+CENTS = "100 + (x * 7919) % 20000"
+
+QUERIES = {
+    "SUM(amount)": "SELECT SUM(amount) FROM expenses",
+    "grouped SUM": (
+        "SELECT chat_id, strftime('%Y-%m', date), category, SUM(amount) FROM expenses "
+        "GROUP BY chat_id, strftime('%Y-%m', date), category"
+    ),
+}
+
+
+def build(path, amount_type, amount, rows):
+    connection = sqlite3.connect(path)
+    connection.execute(SCHEMA.format(amount_type=amount_type))
+    connection.execute(FILL.format(amount=amount), {"rows": rows})
+    connection.commit()
+    return connection
+
+
+def timed(connection, query, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = connection.execute(query).fetchall()
+        samples.append(time.perf_counter() - start)
+    return min(samples), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=10_000_000, help="Expense rows")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per query; the fastest is reported")
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix="budget-money-")
+    real = build(os.path.join(directory, "real.db"), "FLOAT", f"({CENTS}) / 100.0", args.rows)
+    cents = build(os.path.join(directory, "cents.db"), "INTEGER", CENTS, args.rows)
+
+    print(f"{args.rows} rows")
+    print(f"{'query':<12} {'REAL s':>8} {'INTEGER s':>10} {'speedup':>8}")
+    results = {}
+    for name, query in QUERIES.items():
+        real_time, real_result = timed(real, query, args.repeat)
+        cents_time, cents_result = timed(cents, query, args.repeat)
+        results[name] = (real_result, cents_result)
+        print(f"{name:<12} {real_time:8.2f} {cents_time:10.2f} {real_time / cents_time:7.2f}x")
+
+    # The integer total is exact; the REAL total carries accumulated rounding error
+    real_total = results["SUM(amount)"][0][0][0]
+    exact_total = Decimal(results["SUM(amount)"][1][0][0]).scaleb(-2)
+    print(f"exact total {exact_total}, REAL total {real_total!r}, "
+          f"drift {Decimal(real_total) - exact_total:.10f}")
+
+    # A REAL sum without accumulated error equals the float closest to the exact total
+    errors = [
+        abs(real_sum - cents_sum / 100)
+        for (*_, real_sum), (*_, cents_sum) in zip(*results["grouped SUM"])
+    ]
+    drifted = sum(1 for error in errors if error)
+    print(f"grouped REAL sums with accumulated error: {drifted} of {len(errors)}, "
+          f"largest error {max(errors):.2e}")
+
+    real.close()
+    cents.close()
+    for name in ("real.db", "cents.db"):
+        os.remove(os.path.join(directory, name))
+    os.rmdir(directory)
+
+
+if __name__ == '__main__':
+    main()
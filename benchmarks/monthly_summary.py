@@ -0,0 +1,57 @@
+import argparse
+from datetime import date, timedelta
+from sqlalchemy import text
+from Storage import engine
+from Expense import expense_summarize_monthly
+from Data_Processing import check_budget, get_budget_message
+from benchmarks.common import insert_synthetic_expenses, set_benchmark_budget, time_call
+
+# Monthly summaries against a growing expense history.
+# The current month always holds the same number of rows, so with the
+# (category, date) and (date) indexes the timings should stay flat while the
+# strftime() baseline grows with the table.
+# Usage: python -m benchmarks.monthly_summary [--rows 1000000]
+
+ROWS_PER_DAY = 10
+CHAT_ID = 1
+
+STRFTIME_BASELINE = text(
+    "SELECT category, SUM(amount) FROM expenses "
+    "WHERE chat_id = :chat_id AND strftime('%Y-%m', date) = :month GROUP BY category"
+)
+
+
+def strftime_baseline():
+    with engine.connect() as connection:
+        connection.execute(STRFTIME_BASELINE, {"chat_id": CHAT_ID, "month": date.today().strftime("%Y-%m")}).all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Final history size")
+    args = parser.parse_args()
+
+    steps = [size for size in (10_000, 100_000, 1_000_000) if size < args.rows] + [args.rows]
+
+    set_benchmark_budget(CHAT_ID)
+
+    print(f"{'rows':>10} {'expense_sum':>12} {'check_budget':>13} {'budget_msg':>11} {'strftime':>10}  (median ms)")
+    written = 0
+    next_day = date.today()
+    for size in steps:
+        days = (size - written) // ROWS_PER_DAY
+        oldest = insert_synthetic_expenses(days, ROWS_PER_DAY, next_day, CHAT_ID)
+        next_day = oldest - timedelta(days=1)
+        written += days * ROWS_PER_DAY
+        with engine.connect() as connection:
+            connection.execute(text("ANALYZE"))
+
+        print(f"{written:>10} "
+              f"{time_call(lambda: expense_summarize_monthly(CHAT_ID)):>12.2f} "
+              f"{time_call(lambda: check_budget(CHAT_ID)):>13.2f} "
+              f"{time_call(lambda: get_budget_message(CHAT_ID, 'G')):>11.2f} "
+              f"{time_call(strftime_baseline, repeat=5):>10.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import os
+
+# The bot module reads its token at import time; any well-formed token works
+# against the fake API.
+os.environ.setdefault("APIBUDGET", "123456:benchmark")
+
+import argparse
+import asyncio
+import time
+from telebot import asyncio_helper, types
+from telebot.asyncio_helper import ApiTelegramException
+from benchmarks.fake_telegram import FakeTelegramAPI, make_update
+
+# Round trips to the Telegram API per reply, with and without the outbox.
+# Every chat sends a script of commands that answer with several texts each
+# (/setbud 2, /last_expense 5, /about 2, /check_budget 2) to a local fake
+# Telegram API that enforces Telegram's send limits. First every text is sent
+# as its own awaited sendMessage, as the handlers used to; then through the
+# bot's outbox, which joins a chat's waiting texts, keeps within the limits
+# and retries rejected sends. Reports the sendMessage requests, the 429
+# rejections, the texts lost, the TCP connections used and the time until
+# every reply arrived.
+# Usage: python -m benchmarks.outbox_roundtrips [--chats 100] [--api-latency-ms 20]
+
+SCRIPT = [
+    "/setbud G 400, B 1500, F 300, W 200, M 100",
+    "/s G, bread, 3.50\nG, milk, 2.25\nF, movie, 12\nW, tea, 4\nM, stamps, 6",
+    "/last_expense",
+    "/about",
+    "/check_budget",
+]
+
+
+class SendEach:
+    """
+    The former way of replying: every text is its own sendMessage, awaited in order per chat.
+
+    Attributes:
+        queued (int): Texts queued.
+        sent (int): Texts delivered.
+        failed (int): Texts lost to an error, e.g. 429 Too Many Requests.
+    """
+
+    def __init__(self, send):
+        self.queued = 0
+        self.sent = 0
+        self.failed = 0
+        self._send = send
+        self._last = {}  # chat id -> the chat's latest send
+
+    def put(self, chat_id, text, reply_to=None):
+        self.queued += 1
+        self._last[chat_id] = asyncio.ensure_future(self._after(self._last.get(chat_id), chat_id, str(text), reply_to))
+
+    async def _after(self, previous, chat_id, text, reply_to):
+        if previous is not None:
+            await previous
+        try:
+            if reply_to is None:
+                await self._send(chat_id, text)
+            else:
+                await self._send(chat_id, text, reply_to_message_id=reply_to)
+            self.sent += 1
+        except ApiTelegramException:
+            self.failed += 1
+
+    async def flush(self, chat_id):
+        if chat_id in self._last:
+            await self._last[chat_id]
+
+    async def drain(self):
+        await asyncio.gather(*self._last.values())
+
+
+async def run_script(bot, api, sender, first_chat, chats):
+    # Sends the script from every chat at once, one command per chat at a time as polling would
+    # deliver them, and waits until every reply was sent
+    calls = api.calls.get("sendMessage", 0)
+    rejected = api.rejected
+    connections = len(api.connections)
+    update_id = first_chat * len(SCRIPT)
+    start = time.monotonic()
+    for command in SCRIPT:
+        updates = []
+        for chat_id in range(first_chat, first_chat + chats):
+            updates.append(types.Update.de_json(make_update(update_id, chat_id, command)))
+            update_id += 1
+        await bot.process_new_updates(updates)
+    await sender.drain()
+    elapsed = time.monotonic() - start
+    return {
+        "texts": sender.queued,
+        "requests": api.calls.get("sendMessage", 0) - calls,
+        "rejected": api.rejected - rejected,
+        "lost": sender.failed,
+        "connections": len(api.connections) - connections,
+        "seconds": elapsed,
+    }
+
+
+async def run(chats, latency):
+    import BotHandler
+
+    api = FakeTelegramAPI(latency=latency, flood_limits=True)
+    await api.start()
+    asyncio_helper.API_URL = api.api_url
+    outbox = BotHandler.outbox
+
+    # The handlers send through the module's outbox; swap in the former sending for the first run
+    BotHandler.outbox = SendEach(BotHandler.bot.send_message)
+    before = await run_script(BotHandler.bot, api, BotHandler.outbox, 1, chats)
+    await BotHandler.bot.close_session()
+
+    BotHandler.outbox = outbox
+    outbox.start()
+    after = await run_script(BotHandler.bot, api, outbox, chats + 1, chats)
+    after["retried"] = outbox.retried
+    outbox.stop()
+    await BotHandler.bot.close_session()
+    await api.stop()
+    return before, after
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=100, help="Chats sending the script at once")
+    parser.add_argument("--api-latency-ms", type=float, default=20, help="Latency of each fake sendMessage")
+    args = parser.parse_args()
+
+    before, after = asyncio.run(run(args.chats, args.api_latency_ms / 1000))
+    print(f"chats: {args.chats}, commands per chat: {len(SCRIPT)}, texts: {before['texts']}")
+    for name, result in (("one send per text", before), ("outbox", after)):
+        print(f"{name:18} {result['requests']} sendMessage requests "
+              f"({result['requests'] / result['texts']:.2f} per text), {result['rejected']} rejected with 429, "
+              f"{result['lost']} texts lost, {result['connections']} connections, "
+              f"all replies sent in {result['seconds']:.1f} s")
+    print(f"outbox retried {after['retried']} sends after a 429")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+import argparse
+from datetime import date
+import Visualization
+from Data_Processing import (category_spending_vs_budget, check_budget, get_budget_delta_message,
+                             get_budget_message, month_snapshot, overall_spending_vs_budget)
+from Expense import Expense
+from Storage import QueryCounter
+from benchmarks.common import insert_synthetic_expenses, set_benchmark_budget, time_call
+
+# SQL statements and latency per budget report.
+# Every report of a month renders from one MonthSnapshot, read with a single
+# grouped query; /budget_summarize renders both of its messages from the same one.
+# Usage: python -m benchmarks.query_count [--rows 100000]
+
+CHAT_ID = 1
+
+
+def budget_summarize(chat_id):
+    snapshot = month_snapshot(chat_id)
+    overall_spending_vs_budget(chat_id, snapshot=snapshot)
+    category_spending_vs_budget(chat_id, snapshot=snapshot)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000, help="Expense history size")
+    args = parser.parse_args()
+
+    set_benchmark_budget(CHAT_ID)
+    insert_synthetic_expenses(args.rows // 100, 100, date.today(), chat_id=CHAT_ID)
+    new_expenses = [Expense(CHAT_ID, "G", "benchmark", 10.0, None), Expense(CHAT_ID, "F", "benchmark", 5.0, None)]
+
+    commands = {
+        "/check_budget": lambda: check_budget(CHAT_ID),
+        "/budget_summarize": lambda: budget_summarize(CHAT_ID),
+        "/s budget report": lambda: get_budget_delta_message(CHAT_ID, new_expenses),
+        "budget message": lambda: get_budget_message(CHAT_ID, "G"),
+        "dashboard page": lambda: Visualization.visual_by_month(CHAT_ID),
+    }
+    print(f"{'command':<18} {'queries':>8} {'median ms':>10}")
+    for name, command in commands.items():
+        command()  # The category names are cached after the first lookup
+        with QueryCounter() as queries:
+            command()
+        print(f"{name:<18} {queries.count:8} {time_call(command):10.2f}")
+
+
+if __name__ == '__main__':
+    main()
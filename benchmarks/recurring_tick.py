@@ -0,0 +1,96 @@
+import argparse
+import time
+from datetime import date, timedelta
+from sqlalchemy import func, text
+from Expense import Expense, add_expense, verify_monthly_totals
+from Recurring import RecurringRule, run_due_rules
+from Storage import QueryCounter, engine, session_scope
+from benchmarks.common import time_call
+
+# Cost of the recurring rules scheduler.
+# Stores --rules daily rules spread over 1000 chats, all due in the future.
+# Times an idle tick (nothing due) read through the next_run index next to a
+# tick that scans every rule, then makes --due rules a year behind and times
+# the catch-up: every missed occurrence inserted in batches by run_due_rules
+# next to one add_expense() per occurrence. A second tick must record nothing.
+# Usage: python -m benchmarks.recurring_tick [--rules 100000] [--due 100]
+
+CHATS = 1000
+CATCH_UP_DAYS = 365
+BASELINE_INSERTS = 5000
+
+
+def store_rules(count, next_run):
+    with engine.begin() as connection:
+        connection.execute(text(
+            "INSERT INTO recurring_rules (chat_id, kind, category, reason, amount, unit, every, next_run) "
+            "VALUES (:chat_id, 'expense', 'G', 'synthetic', 1000, 'day', 1, :next_run)"
+        ), [{"chat_id": number % CHATS + 1, "next_run": next_run.isoformat()} for number in range(count)])
+        connection.execute(text("ANALYZE"))
+
+
+def scan_every_rule(today):
+    # Without the index: read every rule and keep the due ones
+    with session_scope() as session:
+        return [rule for rule in session.query(RecurringRule).all() if rule.next_run <= today]
+
+
+def expense_count():
+    with session_scope() as session:
+        return session.query(func.count(Expense.id)).scalar()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rules", type=int, default=100_000, help="Recurring rules stored")
+    parser.add_argument("--due", type=int, default=100, help="Rules a year behind")
+    args = parser.parse_args()
+
+    today = date.today()
+    store_rules(args.rules, today + timedelta(days=1))
+    with engine.connect() as connection:
+        plan = connection.execute(text(
+            "EXPLAIN QUERY PLAN SELECT * FROM recurring_rules WHERE next_run <= :today ORDER BY next_run, id"
+        ), {"today": today.isoformat()}).all()
+    print(f"{args.rules} rules; due rules plan: {plan[0][-1]}")
+
+    print(f"{'idle tick':<28} {'queries':>8} {'median ms':>10}")
+    for name, call in [("next_run index", lambda: run_due_rules(today)),
+                       ("scan every rule", lambda: scan_every_rule(today))]:
+        with QueryCounter() as queries:
+            call()
+        print(f"{name:<28} {queries.count:8} {time_call(call, repeat=5):10.2f}")
+
+    # Make some rules a year behind, as if the bot had been down
+    first_day = today - timedelta(days=CATCH_UP_DAYS - 1)
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE recurring_rules SET next_run = :day WHERE id <= :due"),
+                           {"day": first_day.isoformat(), "due": args.due})
+    occurrences = args.due * CATCH_UP_DAYS
+
+    print(f"{'catch-up':<28} {'rows':>8} {'rows/s':>10} {'queries':>8}")
+    with QueryCounter() as queries:
+        start = time.perf_counter()
+        recorded = run_due_rules(today)
+        elapsed = time.perf_counter() - start
+    inserted = sum(len(entries) for entries in recorded.values())
+    assert inserted == occurrences, (inserted, occurrences)
+    print(f"{'run_due_rules batches':<28} {inserted:8} {inserted / elapsed:10.0f} {queries.count:8}")
+
+    with QueryCounter() as queries:
+        start = time.perf_counter()
+        for number in range(BASELINE_INSERTS):
+            add_expense(number % CHATS + 1, "G", "synthetic", "10.00", None, None, first_day)
+        elapsed = time.perf_counter() - start
+    print(f"{'add_expense per occurrence':<28} {BASELINE_INSERTS:8} {BASELINE_INSERTS / elapsed:10.0f} "
+          f"{queries.count:8}")
+
+    # Catching up again records nothing: the rules were moved past today with their inserts
+    before = expense_count()
+    assert run_due_rules(today) == {}
+    assert expense_count() == before
+    print(f"second tick recorded 0 entries; {len(verify_monthly_totals())} monthly total mismatches")
+
+
+if __name__ == '__main__':
+    main()
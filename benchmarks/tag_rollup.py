@@ -0,0 +1,118 @@
+import argparse
+from datetime import date, timedelta
+from sqlalchemy import func, text
+from Categories import get_categories, set_category
+from Data_Processing import category_subtree_spending, tag_spending, tag_totals
+from Expense import Expense
+from Storage import QueryCounter, engine, month_window, session_scope
+from benchmarks.common import time_call, insert_synthetic_expenses
+
+# Subtree sums over a category tree and tag sums over tag links.
+# Builds one chat with a three-level category tree (5 top categories, 10
+# subcategories each and 10 leaves below each of those) and --rows expenses
+# over ten years, a fifth of them tagged with one of --tags tags (half of them
+# nested, e.g. #tag3/sub). Then times each rollup against the query it replaces:
+# a category subtree summed through its codes against a sum of every category
+# rolled up afterwards, and a tag summed through its links against a LIKE scan
+# of the expense reasons.
+# Usage: python -m benchmarks.tag_rollup [--rows 1000000]
+
+CHAT_ID = 1
+TOP_CATEGORIES = ["G", "B", "F", "W", "M"]
+CHILDREN = 10
+
+
+def build_tree():
+    leaves = []
+    for top in TOP_CATEGORIES:
+        for middle in range(CHILDREN):
+            middle_code = f"{top}{middle}"
+            set_category(CHAT_ID, middle_code, f"Sub {middle_code}", top)
+            for leaf in range(CHILDREN):
+                leaf_code = f"{middle_code}_{leaf}"
+                set_category(CHAT_ID, leaf_code, f"Leaf {leaf_code}", middle_code)
+                leaves.append(leaf_code)
+    return leaves
+
+
+def tag_expenses(tags):
+    # Tags 0..tags-1; odd tags are nested below the tag before them
+    names = [f"tag{index - 1}/sub" if index % 2 else f"tag{index}" for index in range(tags)]
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO tags (chat_id, name) VALUES (:chat_id, :name)"),
+                           [{"chat_id": CHAT_ID, "name": name} for name in names])
+        ids = dict(connection.execute(text("SELECT name, id FROM tags WHERE chat_id = :chat_id"),
+                                      {"chat_id": CHAT_ID}).all())
+        # Every fifth expense gets one tag, written into its reason as a hashtag too
+        connection.execute(text(
+            "INSERT INTO expense_tags (tag_id, date, expense_id) "
+            "SELECT :first + (id / 5) % :tags, date, id FROM expenses WHERE chat_id = :chat_id AND id % 5 = 0"
+        ), {"first": ids[names[0]], "tags": tags, "chat_id": CHAT_ID})
+        connection.execute(text(
+            "UPDATE expenses SET reason = 'synthetic #' || "
+            "(SELECT name FROM tags WHERE tags.id = :first + (expenses.id / 5) % :tags) "
+            "WHERE chat_id = :chat_id AND id % 5 = 0"
+        ), {"first": ids[names[0]], "tags": tags, "chat_id": CHAT_ID})
+        connection.execute(text("ANALYZE"))
+
+
+def every_category_rolled_up(code, start, end):
+    # Without the subtree's codes: sum every category of the range, then roll up
+    categories = get_categories(CHAT_ID)
+    with session_scope() as session:
+        rows = session.query(Expense.category, func.sum(Expense.amount)).filter(
+            Expense.chat_id == CHAT_ID, Expense.date >= start, Expense.date < end
+        ).group_by(Expense.category).all()
+    return categories.rollup(dict(rows)).get(code)
+
+
+def like_scan(tag, start, end):
+    # Without tag links: match the hashtag in every reason of the range
+    with session_scope() as session:
+        return session.query(func.sum(Expense.amount)).filter(
+            Expense.chat_id == CHAT_ID, Expense.date >= start, Expense.date < end,
+            Expense.reason.like(f"%#{tag}%")
+        ).scalar()
+
+
+def report(name, call):
+    call()
+    with QueryCounter() as queries:
+        call()
+    print(f"{name:<40} {queries.count:8} {time_call(call, repeat=5):10.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Expense rows")
+    parser.add_argument("--tags", type=int, default=40, help="Distinct tags")
+    args = parser.parse_args()
+
+    leaves = build_tree()
+    today = date.today()
+    insert_synthetic_expenses(3650, max(1, args.rows // 3650), today, chat_id=CHAT_ID, categories=leaves)
+    tag_expenses(args.tags)
+
+    month_start, month_end = month_window(today.year, today.month)
+    # A range of days, so the subtree is summed from the expenses rather than the monthly totals
+    year_start, year_end = today - timedelta(days=364), today + timedelta(days=1)
+    all_start, all_end = date.min, year_end
+
+    print(f"{len(get_categories(CHAT_ID))} categories, {args.rows} expenses")
+    print(f"{'query':<40} {'queries':>8} {'median ms':>10}")
+    for label, start, end in [("month", month_start, month_end), ("365 days", year_start, year_end)]:
+        report(f"subtree F, {label}", lambda: category_subtree_spending(CHAT_ID, "F", start, end))
+        report(f"every category rolled up, {label}", lambda: every_category_rolled_up("F", start, end))
+    for label, start, end in [("month", month_start, month_end), ("365 days", year_start, year_end),
+                              ("all time", all_start, all_end)]:
+        report(f"#tag0 links, {label}", lambda: tag_spending(CHAT_ID, "tag0", start, end))
+        report(f"#tag0 LIKE scan, {label}", lambda: like_scan("tag0", start, end))
+    report("every tag rolled up, month", lambda: tag_totals(CHAT_ID, month_start, month_end))
+
+    # Both ways give the same total
+    linked = sum(total for total, _ in tag_spending(CHAT_ID, "tag0", all_start, all_end).values())
+    assert linked == like_scan("tag0", all_start, all_end), "tag links and hashtags differ"
+
+
+if __name__ == '__main__':
+    main()
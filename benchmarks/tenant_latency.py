@@ -0,0 +1,88 @@
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from sqlalchemy import text
+from Storage import engine
+from Expense import expense_summarize_monthly, get_last_expense, rebuild_monthly_totals
+from Data_Processing import check_budget, get_budget_message
+from benchmarks.common import CATEGORIES, percentiles
+
+# Per-chat query latency as the number of chats sharing the database grows.
+# Every chat owns the same number of rows, so with indexes leading on chat_id
+# the per-chat latency should stay flat from 10 to 10k chats.
+# Usage: python -m benchmarks.tenant_latency [--chats 10000] [--rows-per-chat 60]
+
+EXPENSE_INSERT = text(
+    "INSERT INTO expenses (chat_id, date, category, reason, amount) "
+    "VALUES (:chat_id, :date, :category, :reason, :amount)"
+)
+BUDGET_INSERT = text(
+    "INSERT INTO budget (chat_id, category, amount) VALUES (:chat_id, :category, :amount)"
+)
+
+
+def add_chats(first_chat, last_chat, rows_per_chat, rng):
+    today = date.today()
+    expenses = []
+    budgets = []
+    for chat_id in range(first_chat, last_chat):
+        for category in CATEGORIES:
+            budgets.append({"chat_id": chat_id, "category": category, "amount": 50000})  # Integer cents
+        for _ in range(rows_per_chat):
+            expenses.append({
+                "chat_id": chat_id,
+                "date": (today - timedelta(days=rng.randint(0, 365))).isoformat(),
+                "category": rng.choice(CATEGORIES),
+                "reason": "synthetic",
+                "amount": rng.randint(100, 20000),  # Integer cents
+            })
+    with engine.begin() as connection:
+        connection.execute(BUDGET_INSERT, budgets)
+        connection.execute(EXPENSE_INSERT, expenses)
+    rebuild_monthly_totals()
+
+
+def measure(func, chats, samples, rng):
+    durations = []
+    for _ in range(samples):
+        chat_id = rng.randrange(chats)
+        start = time.perf_counter()
+        func(chat_id)
+        durations.append((time.perf_counter() - start) * 1000)
+    return percentiles(durations, (50, 99))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chats", type=int, default=10_000, help="Final number of chats")
+    parser.add_argument("--rows-per-chat", type=int, default=60, help="Expenses per chat")
+    parser.add_argument("--samples", type=int, default=300, help="Timed requests per query and step")
+    args = parser.parse_args()
+
+    rng = random.Random(11)
+    queries = {
+        "check_budget": check_budget,
+        "budget_msg": lambda chat_id: get_budget_message(chat_id, 'G'),
+        "expense_sum": expense_summarize_monthly,
+        "last_expense": get_last_expense,
+    }
+    steps = [size for size in (10, 100, 1_000, 10_000) if size < args.chats] + [args.chats]
+
+    print(f"{'chats':>7} {'rows':>9}  " + "  ".join(f"{name + ' p50/p99':>22}" for name in queries) + "  (ms)")
+    chats = 0
+    for size in steps:
+        add_chats(chats, size, args.rows_per_chat, rng)
+        chats = size
+        with engine.connect() as connection:
+            connection.execute(text("ANALYZE"))
+
+        cells = []
+        for func in queries.values():
+            result = measure(func, chats, args.samples, rng)
+            cells.append(f"{result[50]:>10.2f} / {result[99]:>8.2f}")
+        print(f"{chats:>7} {chats * args.rows_per_chat:>9}  " + "  ".join(f"{cell:>22}" for cell in cells))
+
+
+if __name__ == '__main__':
+    main()
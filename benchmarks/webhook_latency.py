@@ -0,0 +1,95 @@
+import os
+
+# The bot module reads its token at import time; any well-formed token works
+# against the fake API.
+os.environ.setdefault("APIBUDGET", "123456:benchmark")
+
+import argparse
+import asyncio
+import json
+import time
+import aiohttp
+from telebot import asyncio_helper
+from Webhook import SECRET_HEADER, WebhookServer
+from benchmarks.bot_throughput import build_updates
+from benchmarks.common import percentiles
+from benchmarks.fake_telegram import FakeTelegramAPI
+
+# Replays Telegram updates against the webhook endpoint and reports the
+# end-to-end handling latency (POST sent -> all handlers for the update done).
+# Replies go to a local fake Telegram API.
+# Usage: python -m benchmarks.webhook_latency [--updates recorded.jsonl] [--rate 100]
+#   --updates takes one Telegram Update JSON object per line; without it a
+#   synthetic script from benchmarks.bot_throughput is replayed.
+
+SECRET = "benchmark-secret"
+
+
+def load_updates(path, chats):
+    if path is None:
+        return build_updates(chats)
+    with open(path) as updates_file:
+        return [json.loads(line) for line in updates_file if line.strip()]
+
+
+async def run(updates, rate, latency):
+    api = FakeTelegramAPI(latency=latency)
+    await api.start()
+    asyncio_helper.API_URL = api.api_url
+
+    from BotHandler import bot
+    handled = {}
+    server = WebhookServer(bot, SECRET, on_handled=lambda update, received, done: handled.__setitem__(update.update_id, done))
+    await server.start(host="127.0.0.1", port=0)
+    url = f"http://127.0.0.1:{server.port}{server.path}"
+
+    sent_at = {}
+    rejected = 0
+    async with aiohttp.ClientSession() as session:
+        # The wrong secret must be refused
+        async with session.post(url, json=updates[0], headers={SECRET_HEADER: "wrong"}) as response:
+            rejected = response.status
+
+        async def post(update):
+            sent_at[update["update_id"]] = time.monotonic()
+            async with session.post(url, json=update, headers={SECRET_HEADER: SECRET}) as response:
+                response.raise_for_status()
+
+        start = time.monotonic()
+        posts = []
+        for index, update in enumerate(updates):
+            # Open-loop replay at a fixed rate
+            delay = start + index / rate - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            posts.append(asyncio.create_task(post(update)))
+        await asyncio.gather(*posts)
+        await server.queue.join()
+        elapsed = time.monotonic() - start
+
+    await server.stop()
+    await bot.close_session()
+    await api.stop()
+
+    latencies = [(handled[update_id] - sent) * 1000 for update_id, sent in sent_at.items() if update_id in handled]
+    return rejected, latencies, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--updates", help="JSONL file with recorded Telegram updates")
+    parser.add_argument("--chats", type=int, default=500, help="Chats in the synthetic script")
+    parser.add_argument("--rate", type=float, default=100, help="Updates POSTed per second")
+    parser.add_argument("--api-latency-ms", type=float, default=20, help="Simulated latency per sent message")
+    args = parser.parse_args()
+
+    updates = load_updates(args.updates, args.chats)
+    rejected, latencies, elapsed = asyncio.run(run(updates, args.rate, args.api_latency_ms / 1000))
+    result = percentiles(latencies, (50, 90, 99))
+    print(f"wrong secret token -> HTTP {rejected}")
+    print(f"updates: {len(latencies)}/{len(updates)} handled in {elapsed:.2f} s at {args.rate:.0f}/s offered")
+    print(f"end-to-end latency ms: p50 {result[50]:.1f}, p90 {result[90]:.1f}, p99 {result[99]:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+import os
+import tempfile
+
+# The storage modules read the database URL at import time
+os.environ.setdefault("DBBUDGET", f"sqlite:///{tempfile.mkdtemp()}/test_budget.db")
+
+from Alerts import BudgetAlerts, budget_alerts
+from Budget import Budget
+from Categories import remove_category, set_category
+from Data_Processing import month_snapshot
+from Expense import add_expenses
+from Storage import session_scope
+
+
+def alert_tracker(delivered):
+    alerts = BudgetAlerts()
+    alerts.deliver = lambda chat_id, text: delivered.append((chat_id, text))
+    return alerts
+
+
+def spend(chat_id, amount, category="G"):
+    return add_expenses(chat_id, [(category, "test", amount, None)])
+
+
+def set_budget(chat_id, amount, category="G"):
+    with session_scope() as session:
+        session.add(Budget(chat_id, category, amount))
+
+
+def test_threshold_alerts_once_per_month():
+    set_budget(9001, 100)
+    delivered = []
+    alerts = alert_tracker(delivered)
+    assert alerts.record(9001, spend(9001, "85")) == [("G", 80, 85, 100)]
+    assert alerts.record(9001, spend(9001, "5")) == []
+    assert [percent for _, percent, _, _ in alerts.record(9001, spend(9001, "20"))] == [100]
+    assert alerts.record(9001, spend(9001, "1")) == []
+    assert len(delivered) == 2
+
+
+def test_restart_does_not_resend_an_alert():
+    set_budget(9002, 100)
+    alert_tracker([]).record(9002, spend(9002, "90"))
+    # A new tracker reads the alerts already sent this month from sent_alerts
+    delivered = []
+    assert alert_tracker(delivered).record(9002, spend(9002, "1")) == []
+    assert delivered == []
+
+
+def test_expenses_recorded_out_of_commit_order_count_once():
+    set_budget(9003, 100)
+    alerts = alert_tracker([])
+    alerts.record(9003, spend(9003, "1"))
+    first, second = spend(9003, "10"), spend(9003, "20")
+    # The second insert is recorded first: the totals are read again after its
+    # commit (the state is stale), so they already hold both expenses
+    alerts.invalidate(9003)
+    alerts.record(9003, second)
+    alerts.record(9003, first)
+    later = spend(9003, "30")
+    alerts.record(9003, later)
+    assert alerts._states[9003].spent["G"] == month_snapshot(9003).spent == 61
+
+
+def test_removing_a_category_drops_the_chat_totals():
+    set_category(9004, "X", "Extra")
+    set_budget(9004, 50, category="X")
+    set_budget(9004, 100)
+    budget_alerts.deliver = lambda chat_id, text: None
+    try:
+        budget_alerts.record(9004, spend(9004, "1"))
+        assert "X" in budget_alerts._states[9004].budget
+        remove_category(9004, "X")
+        assert 9004 not in budget_alerts._states
+    finally:
+        budget_alerts.deliver = None
+        budget_alerts.clear()
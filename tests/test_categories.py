@@ -0,0 +1,54 @@
+import os
+import tempfile
+
+import pytest
+
+# The storage modules read the database URL at import time
+os.environ.setdefault("DBBUDGET", f"sqlite:///{tempfile.mkdtemp()}/test_budget.db")
+
+from Categories import get_categories, remove_category, set_category, set_category_keywords
+from Expense import add_expenses, expense_delete_by_id
+
+
+def test_statement_descriptions_are_categorized_by_keywords():
+    categories = get_categories(6001)
+    assert categories.categorize("STARBUCKS #1234") == "F"
+    assert categories.categorize("Costco Wholesale") == "G"
+    assert categories.categorize("Transfer to savings") == "M"
+
+    set_category(6001, "PETS", "Pets")
+    set_category_keywords(6001, "PETS", ["petsmart", " Vet "])
+    categories = get_categories(6001)
+    assert categories.categorize("PetSmart 0042") == "PETS"
+    assert categories.categorize("Downtown vet") == "PETS"
+
+
+def test_category_with_expenses_cannot_be_removed():
+    set_category(6002, "PETS", "Pets")
+    expense = add_expenses(6002, [("PETS", "food", "20", None)])[0]
+    with pytest.raises(ValueError, match="still has expenses"):
+        remove_category(6002, "PETS")
+    assert "PETS" in get_categories(6002)
+
+    expense_delete_by_id(6002, expense.id)
+    remove_category(6002, "PETS")
+    assert "PETS" not in get_categories(6002)
+
+
+def test_categories_are_kept_per_chat():
+    set_category(6003, "G", "Food shopping")
+    set_category(6003, "PETS", "Pets")
+    assert get_categories(6003).name("G") == "Food shopping"
+    assert get_categories(6004).name("G") == "Groceries"
+    assert "PETS" not in get_categories(6004)
+    with pytest.raises(ValueError):
+        get_categories(6004).normalize("pets")
+
+
+def test_nested_category_totals_roll_up_to_their_ancestors():
+    set_category(6005, "RESTAURANTS", "Restaurants", parent="F")
+    set_category(6005, "COFFEE", "Coffee", parent="RESTAURANTS")
+    categories = get_categories(6005)
+    assert categories.subtree("F") == ["F", "RESTAURANTS", "COFFEE"]
+    assert categories.rollup({"COFFEE": 4, "RESTAURANTS": 30, "G": 10}) == {
+        "F": 34, "RESTAURANTS": 34, "COFFEE": 4, "G": 10}
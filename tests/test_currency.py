@@ -0,0 +1,31 @@
+import io
+import os
+import tempfile
+
+import pytest
+
+# The storage modules read the database URL at import time
+os.environ.setdefault("DBBUDGET", f"sqlite:///{tempfile.mkdtemp()}/test_budget.db")
+
+from Currency import FxRate, load_fx_rates
+from Storage import session_scope
+
+
+def stored_rates(currency):
+    with session_scope() as session:
+        return session.query(FxRate).filter(FxRate.currency == currency).count()
+
+
+@pytest.mark.parametrize("row", ["2026-01-02,EUR", "2026-01-02,,1.1", "2026-01-02,EURO,1.1", "2026-01-02,EUR,0"])
+def test_invalid_row_is_reported_with_its_line(row):
+    with pytest.raises(ValueError, match="Line 3: invalid rate row"):
+        load_fx_rates(io.StringIO(f"date,currency,rate\n2026-01-01,GBP,1.25\n{row}\n"))
+
+
+def test_invalid_row_leaves_the_stored_rates_unchanged():
+    rates_file = "date,currency,rate\n2026-01-01,CHF,1.1\n2026-01-02,CHF,1.2\n2026-01-03,CHF\n"
+    with pytest.raises(ValueError):
+        load_fx_rates(io.StringIO(rates_file), batch_size=1)
+    assert stored_rates("CHF") == 0
+    assert load_fx_rates(io.StringIO(rates_file.rsplit("2026-01-03", 1)[0])) == 2
+    assert stored_rates("CHF") == 2
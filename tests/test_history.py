@@ -0,0 +1,64 @@
+import os
+import tempfile
+from datetime import date, timedelta
+
+# The storage modules read the database URL at import time
+os.environ.setdefault("DBBUDGET", f"sqlite:///{tempfile.mkdtemp()}/test_budget.db")
+
+from Expense import add_expenses, expense_delete_by_id
+from History import history_page, parse_history_callback
+
+FIRST_DAY = date(2026, 2, 1)
+
+
+def record(chat_id, count):
+    # Two expenses a day, so pages also break between expenses of the same date
+    return add_expenses(chat_id, [("G", f"item {number}", "1", None, None, FIRST_DAY + timedelta(days=number // 2))
+                                  for number in range(count)])
+
+
+def page_reasons(text):
+    return [line.split("Spending Reason: ")[1] for line in text.splitlines() if "Spending Reason: " in line]
+
+
+def follow(chat_id, buttons, label):
+    data = dict(buttons)[label]
+    kind, cursor, newer = parse_history_callback(data)
+    return history_page(chat_id, kind, cursor, newer)
+
+
+def test_pages_walk_back_to_the_last_page():
+    record(3001, 12)
+    text, buttons = history_page(3001, "expenses")
+    assert page_reasons(text) == [f"item {number}" for number in range(11, 6, -1)]
+    assert [label for label, _ in buttons] == ["Older »"]
+
+    text, buttons = follow(3001, buttons, "Older »")
+    assert page_reasons(text) == [f"item {number}" for number in range(6, 1, -1)]
+    text, buttons = follow(3001, buttons, "Older »")
+    assert page_reasons(text) == ["item 1", "item 0"]
+    assert [label for label, _ in buttons] == ["« Newer"]
+
+    text, _ = follow(3001, buttons, "« Newer")
+    assert page_reasons(text) == [f"item {number}" for number in range(6, 1, -1)]
+
+
+def test_pages_stay_put_when_entries_are_added():
+    record(3002, 12)
+    _, first_buttons = history_page(3002, "expenses")
+    second, second_buttons = follow(3002, first_buttons, "Older »")
+    # A new expense shifts every page of an OFFSET listing; keyset pages keep their entries
+    add_expenses(3002, [("G", "new", "1", None, None, FIRST_DAY + timedelta(days=30))])
+    assert follow(3002, first_buttons, "Older »")[0] == second
+    text, buttons = follow(3002, second_buttons, "« Newer")
+    assert page_reasons(text) == [f"item {number}" for number in range(11, 6, -1)]
+    assert [label for label, _ in buttons] == ["« Newer", "Older »"]
+
+
+def test_cursor_of_a_deleted_entry_still_leads_to_the_next_page():
+    expenses = record(3003, 12)
+    _, buttons = history_page(3003, "expenses")
+    # The Older button holds the (date, id) of item 7, the last entry of the first page
+    expense_delete_by_id(3003, expenses[7].id)
+    text, _ = follow(3003, buttons, "Older »")
+    assert page_reasons(text) == [f"item {number}" for number in range(6, 1, -1)]
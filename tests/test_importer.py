@@ -0,0 +1,41 @@
+import io
+import os
+import tempfile
+
+# The storage modules read the database URL at import time
+os.environ.setdefault("DBBUDGET", f"sqlite:///{tempfile.mkdtemp()}/test_budget.db")
+
+from Importer import format_import_stats, import_statement
+from Storage import session_scope
+from Tags import ExpenseTag, Tag
+
+STATEMENT = "Date,Description,Amount\n2026-01-05,Coffee,-3\n2026-01-06,Lunch,-10\n2026-01-05,Coffee,-3\n"
+
+
+def test_repeated_row_in_unsorted_statement_is_imported():
+    stats = import_statement(8001, io.StringIO(STATEMENT), name="statement.csv")
+    assert stats["expenses"] == 3
+    assert stats["duplicates"] == 0, format_import_stats(stats)
+
+
+def test_importing_the_same_statement_again_skips_every_row():
+    import_statement(8002, io.StringIO(STATEMENT), name="statement.csv")
+    stats = import_statement(8002, io.StringIO(STATEMENT), name="statement.csv")
+    assert stats["expenses"] == 0
+    assert stats["duplicates"] == 3
+
+
+def test_imported_hashtags_are_linked_as_tags():
+    statement = "Date,Description,Amount,Memo\n2026-01-05,Coffee #cafe,-3,\n2026-01-06,Lunch,-10,#work/team\n"
+    import_statement(8003, io.StringIO(statement), name="statement.csv")
+    with session_scope() as session:
+        linked = session.query(Tag.name).join(ExpenseTag, ExpenseTag.tag_id == Tag.id).filter(
+            Tag.chat_id == 8003).all()
+    assert sorted(name for name, in linked) == ["cafe", "work/team"]
+
+
+def test_amounts_are_compared_exactly_to_the_cent():
+    import_statement(8004, io.StringIO("Date,Description,Amount\n2026-01-05,Coffee,-3\n"), name="a.csv")
+    stats = import_statement(8004, io.StringIO("Date,Description,Amount\n2026-01-05,Coffee,-3.00\n"
+                                               "2026-01-05,Coffee,-3.01\n"), name="b.csv")
+    assert (stats["expenses"], stats["duplicates"]) == (1, 1)
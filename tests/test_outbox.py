@@ -0,0 +1,105 @@
+import asyncio
+import random
+
+import pytest
+from telebot.asyncio_helper import ApiTelegramException
+
+from Outbox import Outbox
+
+
+class FakeSend:
+    """Stands in for bot.send_message: records the sends and rejects the texts in reject_once with 429 once."""
+
+    def __init__(self, latency=0.0, reject_once=()):
+        self.sent = []
+        self.latency = latency
+        self.reject_once = set(reject_once)
+
+    async def __call__(self, chat_id, text, reply_to_message_id=None):
+        await asyncio.sleep(self.latency() if callable(self.latency) else self.latency)
+        if text in self.reject_once:
+            self.reject_once.discard(text)
+            raise ApiTelegramException("sendMessage", None, {
+                "ok": False, "error_code": 429, "description": "Too Many Requests: retry after 0.05",
+                "parameters": {"retry_after": 0.05}})
+        self.sent.append((chat_id, text, reply_to_message_id))
+
+
+def fast_outbox(send):
+    # Limits high enough that the tests are not paced by the token buckets
+    return Outbox(send, chat_rate=1000, chat_burst=1000, global_rate=1000, global_burst=1000)
+
+
+def test_texts_join_only_when_they_answer_the_same_message():
+    async def scenario():
+        send = FakeSend()
+        outbox = fast_outbox(send)
+        for text, reply_to in (("a", None), ("b", None), ("c", 5), ("d", 5), ("e", None)):
+            outbox.put(1, text, reply_to)
+        outbox.start()
+        await outbox.drain()
+        outbox.stop()
+        return send.sent
+
+    assert asyncio.run(scenario()) == [(1, "a\n\nb", None), (1, "c\n\nd", 5), (1, "e", None)]
+
+
+def test_each_chat_receives_its_texts_in_order():
+    async def scenario():
+        rng = random.Random(3)
+        send = FakeSend(latency=lambda: rng.uniform(0, 0.005))
+        outbox = fast_outbox(send)
+        outbox.start()
+        for number in range(50):
+            for chat_id in range(5):
+                # A reply_to per text keeps them from being joined
+                outbox.put(chat_id, f"{chat_id}:{number}", reply_to=number)
+            await asyncio.sleep(rng.uniform(0, 0.002))
+        await outbox.drain()
+        outbox.stop()
+        return send.sent
+
+    sent = asyncio.run(scenario())
+    for chat_id in range(5):
+        assert [text for chat, text, _ in sent if chat == chat_id] == [f"{chat_id}:{number}" for number in range(50)]
+
+
+def test_rejected_send_is_retried_before_the_texts_behind_it():
+    async def scenario():
+        send = FakeSend(reject_once={"first"})
+        outbox = fast_outbox(send)
+        outbox.start()
+        outbox.put(1, "first", reply_to=1)
+        outbox.put(1, "second", reply_to=2)
+        await outbox.drain()
+        outbox.stop()
+        return send.sent, outbox.retried, outbox.failed
+
+    sent, retried, failed = asyncio.run(scenario())
+    assert [text for _, text, _ in sent] == ["first", "second"]
+    assert (retried, failed) == (1, 0)
+
+
+def test_flush_and_drain_resolve_when_the_texts_were_sent():
+    async def scenario():
+        send = FakeSend(latency=0.01)
+        outbox = fast_outbox(send)
+        with pytest.raises(RuntimeError):
+            await outbox.flush(1)
+        with pytest.raises(RuntimeError):
+            await outbox.drain()
+        with pytest.raises(RuntimeError):
+            outbox.put_threadsafe(1, "too early")
+
+        outbox.start()
+        await outbox.flush(1)  # Nothing queued
+        outbox.put(1, "one", reply_to=1)
+        outbox.put(1, "two", reply_to=2)
+        outbox.put(2, "other")
+        await asyncio.wait_for(outbox.flush(1), 1)
+        flushed = [text for chat, text, _ in send.sent if chat == 1]
+        await asyncio.wait_for(outbox.drain(), 1)
+        outbox.stop()
+        return flushed, len(send.sent)
+
+    assert asyncio.run(scenario()) == (["one", "two"], 3)
@@ -0,0 +1,42 @@
+import os
+import tempfile
+from datetime import date
+
+# The storage modules read the database URL at import time
+os.environ.setdefault("DBBUDGET", f"sqlite:///{tempfile.mkdtemp()}/test_budget.db")
+
+from Categories import get_categories
+from Recurring import RecurringRule, add_rule, parse_recurring_command, run_due_rules
+from Storage import session_scope
+
+
+def new_rule(chat_id, command, today):
+    return add_rule(chat_id, parse_recurring_command(command, get_categories(chat_id), today), today)
+
+
+def recorded_days(created, chat_id):
+    return [entry.date for entry in created.get(chat_id, [])]
+
+
+def test_missed_occurrences_are_caught_up_once():
+    rule, created = new_rule(4001, "/every month 31 from 2026-01-20 /s B, rent, 1500", date(2026, 1, 20))
+    assert created == []
+
+    # The bot was down from January to the end of April: one occurrence per missed month
+    created = run_due_rules(date(2026, 4, 30))
+    assert recorded_days(created, 4001) == [date(2026, 1, 31), date(2026, 2, 28), date(2026, 3, 31),
+                                            date(2026, 4, 30)]
+    assert all(expense.amount == 1500 for expense in created[4001])
+    assert recorded_days(run_due_rules(date(2026, 4, 30)), 4001) == []
+    assert recorded_days(run_due_rules(date(2026, 5, 30)), 4001) == []
+    assert recorded_days(run_due_rules(date(2026, 5, 31)), 4001) == [date(2026, 5, 31)]
+
+
+def test_add_rule_records_only_the_new_rule():
+    old, _ = new_rule(4002, "/every day /s G, bread, 2", date(2026, 3, 1))
+    # The old rule is due again, but belongs to the scheduler's next run
+    _, created = new_rule(4002, "/every week from 2026-03-01 /e allowance, 10", date(2026, 3, 10))
+    assert [(entry.source, entry.date) for entry in created] == [("allowance", date(2026, 3, 1)),
+                                                                  ("allowance", date(2026, 3, 8))]
+    with session_scope() as session:
+        assert session.get(RecurringRule, old.id).next_run == date(2026, 3, 2)
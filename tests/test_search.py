@@ -0,0 +1,44 @@
+import os
+import tempfile
+from datetime import date
+
+import pytest
+
+# The storage modules read the database URL at import time
+os.environ.setdefault("DBBUDGET", f"sqlite:///{tempfile.mkdtemp()}/test_budget.db")
+
+from Search import parse_find_command
+
+
+@pytest.mark.parametrize("command, words", [
+    ("/find 7-eleven", ["7-eleven"]),
+    ("/find 3.5mm jack", ["3.5mm", "jack"]),
+    ("/find 24/7 gym", ["24/7", "gym"]),
+    ("/find 1234", ["1234"]),
+    ("/find 2024", ["2024"]),
+    ("/find uber 0000", ["uber", "0000"]),
+])
+def test_words_that_start_with_a_digit_are_searched_for(command, words):
+    assert parse_find_command(command) == (words, None, None, "all time")
+
+
+@pytest.mark.parametrize("command, start, end", [
+    ("/find uber 2024-03", date(2024, 3, 1), date(2024, 4, 1)),
+    ("/find uber 2024", date(2024, 1, 1), date(2025, 1, 1)),
+    ("/find 1234 2024", date(2024, 1, 1), date(2025, 1, 1)),
+    ("/find 7-eleven 2024-01-01..2024-06-30", date(2024, 1, 1), date(2024, 7, 1)),
+])
+def test_periods_are_recognized(command, start, end):
+    words, first, stop, _ = parse_find_command(command)
+    assert (first, stop) == (start, end)
+    assert words == [command.split()[1]]
+
+
+def test_two_periods_are_refused():
+    with pytest.raises(ValueError):
+        parse_find_command("/find uber 2024-03 2024-04")
+
+
+def test_a_year_after_a_period_is_searched_for():
+    words, start, end, _ = parse_find_command("/find 2024-03 2023")
+    assert (words, start, end) == (["2023"], date(2024, 3, 1), date(2024, 4, 1))
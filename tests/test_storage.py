@@ -0,0 +1,86 @@
+import os
+import sqlite3
+import tempfile
+from decimal import Decimal
+
+import pytest
+
+# The storage modules read the database URL at import time
+os.environ.setdefault("DBBUDGET", f"sqlite:///{tempfile.mkdtemp()}/test_budget.db")
+
+from Budget import Budget
+from Expense import Expense, add_expenses
+from Income import Income
+from sqlalchemy import func, text
+from Storage import Money, migrate_legacy_databases, session_scope, to_money
+
+
+def legacy_databases(directory):
+    # Legacy files whose ids (1 and 2) collide with rows of the shared database
+    paths = {table: os.path.join(directory, f"{table}.db") for table in ("expenses", "income", "budget")}
+    schemas = {
+        "expenses": ("CREATE TABLE expenses (id INTEGER PRIMARY KEY, date DATE, category CHAR, reason VARCHAR, "
+                     "amount FLOAT, note VARCHAR)",
+                     [(1, "2024-01-02", "G", "bread", 2.5, None), (2, "2024-01-03", "F", "movie", 12.0, "late")]),
+        "income": ("CREATE TABLE income (id INTEGER PRIMARY KEY, date DATE, source VARCHAR, amount FLOAT, "
+                   "note VARCHAR)", [(1, "2024-01-01", "salary", 1000.0, None)]),
+        "budget": ("CREATE TABLE budget (id INTEGER PRIMARY KEY, category VARCHAR, amount FLOAT)",
+                   [(1, "G", 400.0), (2, "F", 100.0)]),
+    }
+    for table, (schema, rows) in schemas.items():
+        legacy = sqlite3.connect(paths[table])
+        legacy.execute(schema)
+        legacy.executemany(f"INSERT INTO {table} VALUES ({', '.join('?' * len(rows[0]))})", rows)
+        legacy.commit()
+        legacy.close()
+    return paths
+
+
+def count(model, chat_id):
+    with session_scope() as session:
+        return session.query(model).filter(model.chat_id == chat_id).count()
+
+
+def test_migration_keeps_legacy_rows_whose_ids_are_taken():
+    paths = legacy_databases(tempfile.mkdtemp())
+    # Rows made before the migration take the legacy ids
+    add_expenses(7001, [("G", "before", "1", None), ("G", "before", "2", None)])
+    with session_scope() as session:
+        session.add(Budget(7001, "G", 300))
+
+    assert migrate_legacy_databases(paths, chat_id=7001) == {"expenses": 2, "income": 1, "budget": 1}
+    assert (count(Expense, 7001), count(Income, 7001), count(Budget, 7001)) == (4, 1, 2)
+
+    # Migrating again adds nothing; the same files for another chat are copied again
+    assert migrate_legacy_databases(paths, chat_id=7001) == {"expenses": 0, "income": 0, "budget": 0}
+    assert migrate_legacy_databases(paths, chat_id=7002) == {"expenses": 2, "income": 1, "budget": 2}
+    assert (count(Expense, 7002), count(Income, 7002), count(Budget, 7002)) == (2, 1, 2)
+
+
+@pytest.mark.parametrize("value, money", [
+    ("12.5", "12.50"), (12.5, "12.50"), (Decimal("3"), "3.00"),
+    ("2.675", "2.68"), (2.675, "2.68"), ("-2.675", "-2.68"), ("0.004", "0.00"), ("0.005", "0.01"),
+])
+def test_amounts_round_half_up_to_the_cent(value, money):
+    assert to_money(value) == Decimal(money)
+    assert str(to_money(value)) == money
+
+
+@pytest.mark.parametrize("value", ["abc", "nan", "inf"])
+def test_invalid_amounts_are_refused(value):
+    with pytest.raises(ValueError):
+        to_money(value)
+
+
+def test_money_is_stored_as_cents_and_sums_exactly():
+    expenses = add_expenses(7003, [("G", "gum", "0.10", None)] * 1000 + [("G", "rounded", 1.005, None)])
+    with session_scope() as session:
+        cents = session.execute(text("SELECT amount FROM expenses WHERE id = :id"), {"id": expenses[0].id}).scalar()
+        stored = session.get(Expense, expenses[-1].id).amount
+        total = session.query(func.sum(Expense.amount)).filter(Expense.chat_id == 7003).scalar()
+    assert cents == 10
+    assert stored == Decimal("1.01") and isinstance(stored, Decimal)
+    # 1000 float additions of 0.1 drift from 100; the cents do not
+    assert sum([0.1] * 1000) != 100
+    assert total == Decimal("101.01")
+    assert Money().process_result_value(Money().process_bind_param("-0.07", None), None) == Decimal("-0.07")
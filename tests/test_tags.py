@@ -0,0 +1,43 @@
+import io
+import os
+import tempfile
+from datetime import date
+
+# The storage modules read the database URL at import time
+os.environ.setdefault("DBBUDGET", f"sqlite:///{tempfile.mkdtemp()}/test_budget.db")
+
+from Data_Processing import tag_spending, tag_totals
+from Expense import Expense, add_expenses, store_inserted_expense_tags
+from Importer import import_statement
+from Storage import session_scope
+from Tags import ExpenseTag, parse_tags
+
+ALL_TIME = (date(2000, 1, 1), date(2100, 1, 1))
+
+
+def test_hashtags_are_parsed_lower_case_once():
+    assert parse_tags("Sushi #Travel/Japan #food", "#food again, not a#tag or #1") == ["travel/japan", "food"]
+
+
+def test_nested_tags_roll_up_into_their_parent():
+    add_expenses(5001, [
+        ("F", "ramen #travel/japan", "100", None),
+        ("B", "hostel", "50", "#travel"),
+        ("F", "train #travel/japan #travel", "10", None),
+        ("F", "blog #travelling", "5", None),
+    ])
+    spending = tag_spending(5001, "travel", *ALL_TIME)
+    assert spending == {"F": (110, 2), "B": (50, 1)}
+    assert tag_totals(5001, *ALL_TIME) == [("travel", 160, 3), ("travel/japan", 110, 2), ("travelling", 5, 1)]
+
+
+def test_imported_hashtags_are_linked_once():
+    statement = "Date,Description,Amount,Memo\n2026-01-05,Coffee #cafe,-3,\n2026-01-06,Lunch,-10,#work/team\n"
+    import_statement(5002, io.StringIO(statement), name="statement.csv")
+    with session_scope() as session:
+        store_inserted_expense_tags(session, 5002)  # Linking again adds nothing
+    assert tag_totals(5002, *ALL_TIME) == [("cafe", 3, 1), ("work", 10, 1), ("work/team", 10, 1)]
+    with session_scope() as session:
+        links = session.query(ExpenseTag).join(Expense, Expense.id == ExpenseTag.expense_id).filter(
+            Expense.chat_id == 5002).count()
+    assert links == 2